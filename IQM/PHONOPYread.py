@@ -18,10 +18,19 @@
             input file beforehand - contains phonon energy/frequency information. Returns energies
             (in eV) - NOT frequency (in THz).
    mesh:    class which parses information in Phonopy mesh.yaml file and returns it as a numpy array.
-            Requires use of a mesh.conf input file beforehand - contains DOS information.
+            Requires use of a mesh.conf input file beforehand - contains DOS information. A
+            missing total_dos.dat is computed from mesh.yaml in-process, or by phonopy (in the
+            background if asked), and cached against FORCE_CONSTANTS and mesh.conf.
    band:    class which parses information in Phonopy band.yaml file and returns it as a numpy array
             - or float depending. Requires the use of a band.conf input file with q-path defined
             beforehand. Returns energies in eV - NOT frequency (in THz).
+            
+   The arrays pulled from each yaml/dat file are saved to the .iqmcache folder of the directory
+   (see cache.py), so unchanged files are only parsed once. Compressed files (i.e. band.yaml.gz)
+   are read in place of missing plain ones - see fileio.py. band.yaml and qpoints.yaml are streamed
+   line by line (see _stream_arrays) - the yaml loader is only used for files in another layout.
+   Eigenvectors (written with EIGENVECTORS = .TRUE.) are converted once into a .npy file in the
+   .iqmcache folder and read back as a memory map, so only the modes which are sliced are loaded.
 """
 ####################################################################################################
 
@@ -29,71 +38,381 @@
 import numpy as np
 import yaml
 import os
+import subprocess
+import cache
+import fileio
+
+#C ACCELERATED (LIBYAML) LOADER WHEN PYYAML WAS BUILT WITH IT - THE PURE PYTHON ONE ELSE
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+#===========================    YAML CONVERSION   ==========================================
+def _phonon_arrays(phonon):
+    """ Pull the arrays used by the readers below out of a loaded phonopy yaml dictionary:
+        reciprocal lattice (3 x 3, one vector per column), q-positions (3 x nqpts), distances
+        along the path (nqpts, band.yaml only), q-point weights (nqpts, mesh.yaml only), 
+        frequencies in THz (nqpts x nbands) and the number of atoms."""
+    arrays = {}
+    phonons = phonon["phonon"]
+    arrays['reclat'] = np.array(phonon["reciprocal_lattice"],dtype=float).T
+    arrays['qpoints'] = np.array([q["q-position"] for q in phonons],dtype=float).T
+    if "distance" in phonons[0]:
+        arrays['distance'] = np.array([q["distance"] for q in phonons],dtype=float)
+    if "weight" in phonons[0]:
+        arrays['weight'] = np.array([q["weight"] for q in phonons],dtype=float)
+    arrays['frequency'] = np.array([[b["frequency"] for b in q["band"]] for q in phonons],dtype=float)
+    arrays['natom'] = np.array(phonon["natom"])
+    return arrays
+
+def _vector(line):
+    #FLOATS OF A FLOW SEQUENCE ROW - I.E. '- [ 0.1, 0.2, 0.3 ] # a*'
+    return [float(v) for v in line[line.index('[')+1:line.index(']')].split(',')]
+
+def _stream_arrays(lines):
+    """ Pull the same arrays as _phonon_arrays straight from the lines of a band.yaml, mesh.yaml
+        or qpoints.yaml file in the layout phonopy writes (top level keys at column 0, one
+        '- q-position:' entry per q-point, one 'frequency:' row per band). Eigenvectors and
+        every other key are skipped without being split, and no object tree is built. None
+        is returned if the lines do not follow this layout, so the caller can fall back to 
+        the full yaml loader."""
+    reclat = []
+    qpos = []
+    dist = []
+    weight = []
+    freq = []
+    natom = None
+    section = None
+    for line in lines:
+        first = line[:1]
+        if first==' ':
+            stripped = line.lstrip()
+            if stripped[:10]=='frequency:':
+                freq.append(float(stripped[10:]))
+            elif stripped[:9]=='distance:':
+                dist.append(float(stripped[9:]))
+            elif stripped[:7]=='weight:':
+                weight.append(float(stripped[7:]))
+        elif first=='-':
+            if line[:13]=='- q-position:':
+                qpos.append(_vector(line))
+            elif section=='reciprocal_lattice':
+                reclat.append(_vector(line))
+        elif first.isalpha():
+            #TOP LEVEL KEY - REMEMBER IT FOR THE ROWS THAT FOLLOW
+            section,sep,value = line.partition(':')
+            if section=='natom':
+                natom = int(value)
+    nqpts = len(qpos)
+    if nqpts==0 or natom is None or len(reclat)!=3 or len(freq)%nqpts!=0:
+        return None
+    arrays = {}
+    arrays['reclat'] = np.array(reclat).T
+    arrays['qpoints'] = np.array(qpos).T
+    if len(dist)==nqpts:
+        arrays['distance'] = np.array(dist)
+    if len(weight)==nqpts:
+        arrays['weight'] = np.array(weight)
+    arrays['frequency'] = np.array(freq).reshape((nqpts,-1))
+    arrays['natom'] = np.array(natom)
+    return arrays
+
+def _load(filename,kind):
+    """ Load the arrays of a phonopy yaml file from the cache - or parse and cache them. The
+        file is streamed through _stream_arrays, and only loaded as a full yaml document
+        (with the C loader if available) if it does not follow the phonopy layout."""
+    filename = fileio.locate(filename)
+    arrays = cache.load(filename,kind)
+    if arrays is None:
+        f = fileio.open_file(filename)
+        arrays = _stream_arrays(f)
+        f.close()
+        if arrays is None:
+            f = fileio.open_file(filename)
+            phonon = yaml.load(f,Loader=_Loader)
+            f.close()
+            arrays = _phonon_arrays(phonon)
+        cache.save(filename,kind,arrays)
+    return arrays
+
+#===========================    EIGENVECTOR STORE   ========================================
+def _eigencounts(filename):
+    #NUMBER OF Q-POINTS AND ATOMS FROM THE HEADER - Q-POINTS ARE COUNTED IF nqpoint IS MISSING
+    f = fileio.open_file(filename)
+    nqpts = None
+    natom = None
+    for line in f:
+        if line[:8]=='nqpoint:':
+            nqpts = int(line[8:])
+        elif line[:6]=='natom:':
+            natom = int(line[6:])
+        elif line[:7]=='phonon:':
+            break
+    if nqpts is None:
+        nqpts = sum([1 for line in f if line[:13]=='- q-position:'])
+    f.close()
+    return nqpts,natom
+
+def _eigenblock(values,shape,q):
+    #ONE Q-POINT OF EIGENVECTORS FROM ITS FLAT LIST OF REAL AND IMAGINARY PARTS
+    if len(values)!=2*np.prod(shape):
+        raise ValueError('wrong number of eigenvector rows at q-point '+str(q+1)+' - was EIGENVECTORS = .TRUE. set?')
+    return np.array(values).view(complex).reshape(shape)
+
+def _eigenfill(lines,store):
+    """ Fill @store (nqpts x nbands x natoms x 3, complex) from the lines of a phonopy yaml file.
+        The indented '- [ re, im ]' rows of each q-point are gathered and written as one block,
+        so at most one q-point is held in memory."""
+    q = -1
+    values = []
+    for line in lines:
+        if line[:13]=='- q-position:':
+            if q>=0:
+                store[q] = _eigenblock(values,store.shape[1:],q)
+            q+=1
+            values = []
+        elif q>=0 and line[:1]==' ':
+            stripped = line.lstrip()
+            if stripped[:3]=='- [':
+                values.extend(_vector(stripped))
+    store[q] = _eigenblock(values,store.shape[1:],q)
+    return
+
+def _eigenvectors(filename):
+    """ Return the eigenvectors of a band.yaml, qpoints.yaml or mesh.yaml file as an array of
+        nqpts x nbands x natoms x 3 complex values. The first call streams the file into a .npy
+        cache entry and every call returns it as a read-only memory map. Without a writable
+        cache the array is built in memory instead."""
+    filename = fileio.locate(filename)
+    store = cache.load_memmap(filename,'eigenvectors')
+    if store is not None:
+        return store
+    nqpts,natom = _eigencounts(filename)
+    shape = (nqpts,3*natom,natom,3)
+    store = cache.create_memmap(filename,'eigenvectors',shape,np.complex128)
+    if store is None:
+        store = np.zeros(shape,dtype=np.complex128)
+    f = fileio.open_file(filename)
+    try:
+        _eigenfill(f,store)
+    except (ValueError,IndexError):
+        #DROP THE HALF FILLED TEMPORARY ENTRY
+        if isinstance(store,np.memmap):
+            os.remove(store.filename)
+        raise
+    finally:
+        f.close()
+    if isinstance(store,np.memmap):
+        store = cache.commit_memmap(filename,'eigenvectors',store)
+    return store
+
+def _modes(store,qpts=None,branches=None):
+    #SLICE AN EIGENVECTOR STORE BY Q-POINT AND BRANCH - INTS AND SLICES KEEP A MEMORY MAP VIEW
+    if qpts is not None:
+        store = store[qpts]
+    if branches is not None:
+        store = store[...,branches,:,:]
+    return store
 
 #============================    DEFINE QPOINTS CLASS   =====================================
 class qpoints:
     """ Qpoints class read the qpoints.yaml file contained in a DFPT directory."""
     def __init__(self,phon_dir):
         self.phon_dir = phon_dir
-        with open(self.phon_dir+'qpoints.yaml','r') as f:
-            qpoints = yaml.load(f)
-        self.qpoints = qpoints
+        self._data = _load(self.phon_dir+'qpoints.yaml','qpoints')
+        self._eigvec = None
         return
     
+    def eigenvectors(self,qpts=None,branches=None):
+        """ Eigenvectors as nqpts x nbands x natoms x 3 complex values, optionally sliced by
+            @qpts and @branches (ints, slices or index arrays). See _eigenvectors."""
+        if self._eigvec is None:
+            self._eigvec = _eigenvectors(self.phon_dir+'qpoints.yaml')
+        return _modes(self._eigvec,qpts,branches)
+    
     def reclat(self):
-        rfile = np.zeros((3,len(self.qpoints["reciprocal_lattice"])))
-        for i in range(len(self.qpoints["reciprocal_lattice"])):
-            rfile[:,i] = self.qpoints["reciprocal_lattice"][i]
-        return rfile
+        return self._data['reclat'].copy()
     
     def kpoints(self):       
-        qfile = np.zeros((3,len(self.qpoints["phonon"])))
-        for i in range(len(self.qpoints["phonon"])):
-            qfile[:,i] = self.qpoints["phonon"][i]["q-position"]
-        return qfile
+        return self._data['qpoints'].copy()
     
     def bands(self):
         hbar = 0.004135 #eV/THz       
-        bandfile = np.zeros((len(self.qpoints["phonon"]),len(self.qpoints["phonon"][0]["band"])))
-        for i in range(len(self.qpoints["phonon"])):
-            for j in range(len(self.qpoints["phonon"][0]["band"])):
-                bandfile[i,j] = self.qpoints["phonon"][i]["band"][j]["frequency"]
-        bandfile = hbar*bandfile
+        bandfile = hbar*self._data['frequency']
         return bandfile
     
     def natoms(self):
-        natoms = self.qpoints["natom"]
+        natoms = int(self._data['natom'])
         return natoms
     
     def nbands(self):
-        nbands = len(self.qpoints["phonon"][0]["band"])
+        nbands = self._data['frequency'].shape[1]
         return nbands
 
+#===========================    PHONON DOS   ===============================================
+#COMMAND WRITING total_dos.dat (AND mesh.yaml) - RUN IN THE DFPT DIRECTORY
+PHONOPY_DOS = ['phonopy','-c','POSCAR-unitcell','--dos','mesh.conf']
+
+def _conf(filename):
+    #TAGS OF A PHONOPY CONF FILE (I.E. mesh.conf) AS A DICTIONARY OF UPPERCASE KEYS AND STRINGS
+    tags = {}
+    if not fileio.exists(filename):
+        return tags
+    f = fileio.open_file(filename)
+    for line in f:
+        line = line.split('#')[0]
+        if '=' in line:
+            key,value = line.split('=',1)
+            tags[key.strip().upper()] = value.strip()
+    f.close()
+    return tags
+
+def histogram_dos(frequency,weight=None,sigma=None,pitch=None):
+    """ Total phonon DOS from mesh frequencies (nqpts x nbands, THz) and q-point weights. The
+        modes are binned on a grid fine enough to resolve @sigma and the histogram is smeared
+        with a gaussian of width @sigma, which approximates summing one gaussian per mode but 
+        costs two np.bincount calls and one np.convolve. The result is sampled every @pitch.
+        As in phonopy, sigma defaults to 1/100 of the frequency range and the grid spans the 
+        range plus 10 sigma on each side in 201 points. The DOS integrates to nbands. If all 
+        frequencies are equal the range is taken as 1/1000 of their magnitude (at least 
+        0.001 THz) so the grid still has a width."""
+    frequency = np.asarray(frequency,dtype=float)
+    if weight is None:
+        weight = np.ones(frequency.shape[0])
+    fmin = frequency.min()
+    fmax = frequency.max()
+    span = fmax-fmin
+    if span<=0:
+        span = 1e-3*max(abs(fmax),1.0)
+    if sigma is None:
+        sigma = span/100.
+    if pitch is None:
+        pitch = (span+20*sigma)/200.
+    if sigma<0 or pitch<=0:
+        raise ValueError('phonon DOS needs a positive frequency pitch and a non-negative sigma')
+    energy = np.arange(fmin-10*sigma,fmax+10*sigma+pitch/2,pitch)
+    #BIN ON A GRID AT LEAST 8 POINTS PER SIGMA, THEN KEEP EVERY @sub-TH POINT AFTER SMEARING
+    sub = int(np.ceil(8*pitch/sigma)) if sigma>0 else 1
+    fine = pitch/sub
+    npts = sub*(len(energy)-1)+1
+    #LINEAR BINNING - EACH MODE IS SPLIT BETWEEN ITS TWO NEIGHBOURING GRID POINTS
+    weights = np.repeat(np.asarray(weight,dtype=float),frequency.shape[1])
+    position = (frequency.ravel()-energy[0])/fine
+    lower = np.floor(position).astype(int)
+    upper = position-lower
+    counts = np.bincount(lower,weights*(1-upper),minlength=npts+1)
+    counts += np.bincount(lower+1,weights*upper,minlength=npts+1)
+    counts = counts[0:npts]/(weights.sum()/frequency.shape[1])
+    if sigma>0:
+        half = min(int(np.ceil(5*sigma/fine)),(npts-1)//2)
+        x = fine*np.arange(-half,half+1)
+        kernel = np.exp(-0.5*(x/sigma)**2)/(np.sqrt(2*np.pi)*sigma)
+        dos = np.convolve(counts,kernel,'same')[::sub]
+    else:
+        dos = counts/pitch
+    return energy,dos
+
 #=============================    DEFINE MESH CLASS   ======================================
     
 class mesh:
-    """ The mesh class reads the total_dos.dat and dos files. Could be improved
-        to actually read mesh.yaml."""
-    def __init__(self,dos_dir):
+    """ The mesh class returns the total phonon DOS of a DFPT directory. It is computed once
+        per pair of FORCE_CONSTANTS and mesh.conf (the cache is keyed on a hash of both) - 
+        read from total_dos.dat if present, else in-process from the mesh.yaml frequencies 
+        (see histogram_dos, SIGMA and FPITCH are taken from mesh.conf), else by running 
+        phonopy in the directory. phonopy is also run when either file is left from older 
+        inputs (see _stale). The cached entry records its method ('phonopy' or 'histogram'),
+        and a histogram is replaced by phonopy's own DOS as soon as that exists. With 
+        @background the phonopy run is left going and only waited for when the DOS is first
+        asked for."""
+    #PHONOPY OUTPUT FILES - BOTH ARE WRITTEN BY ONE PHONOPY_DOS RUN
+    _outputs = ('total_dos.dat','mesh.yaml')
+    
+    def __init__(self,dos_dir,background=False):
         self.dos_dir = dos_dir
-        if not os.path.exists(self.dos_dir+'total_dos.dat'):
-            os.chdir(self.dos_dir)
-            os.system('phonopy -c POSCAR-unitcell --dos mesh.conf')
-        else:
-            pass
-        dosstr = open(self.dos_dir+'total_dos.dat','r')
-        self.dosstr = dosstr.read()
-        dosstr.close()
+        self._data = None
+        self._process = None
+        self._eigvec = None
+        self._key = cache.digest([self.dos_dir+'FORCE_CONSTANTS',self.dos_dir+'mesh.conf'])
+        self._data = cache.load(self.dos_dir+'total_dos.dat','phonondos',key=self._key)
+        fresh = [fileio.exists(self.dos_dir+name) and not self._stale(name) for name in self._outputs]
+        if self._data is not None and (str(self._data.get('method'))=='phonopy' or not fresh[0]):
+            return
+        if fresh[0]:
+            self._save(self._read(),'phonopy')
+            return
+        if fresh[1]:
+            mesharrays = _load(self.dos_dir+'mesh.yaml','meshyaml')
+            tags = _conf(self.dos_dir+'mesh.conf')
+            sigma = float(tags['SIGMA']) if 'SIGMA' in tags else None
+            pitch = float(tags['FPITCH']) if 'FPITCH' in tags else None
+            energy,dos = histogram_dos(mesharrays['frequency'],mesharrays.get('weight'),sigma,pitch)
+            self._save({'energy':energy,'dos':dos},'histogram')
+            return
+        #NO CURRENT OUTPUT - RUN PHONOPY WITHOUT CHANGING THE WORKING DIRECTORY OF THIS PROCESS
+        self._process = subprocess.Popen(PHONOPY_DOS,cwd=self.dos_dir)
+        if not background:
+            self.wait()
+        return
+    
+    def _stale(self,name):
+        """ True if the phonopy output @name (see _outputs) is left from other FORCE_CONSTANTS or
+            mesh.conf: it is older than either of them (which also covers a disabled cache), or
+            the 'phonondos' entry last derived from it was saved under another key."""
+        path = fileio.locate(self.dos_dir+name)
+        inputs = [fileio.locate(self.dos_dir+filename) for filename in ('FORCE_CONSTANTS','mesh.conf')]
+        changed = max([os.path.getmtime(filename) for filename in inputs if os.path.exists(filename)]+[0])
+        if os.path.getmtime(path)<changed:
+            return True
+        saved = cache.stored(self.dos_dir+'total_dos.dat','phonondos')
+        if saved is None or saved[0]==self._key:
+            return False
+        return cache.fingerprint(path) in [str(source) for source in saved[1].get('sources',[])]
+    
+    def _save(self,data,method):
+        #KEEP THE DOS AND CACHE IT UNDER THE INPUT DIGEST WITH ITS METHOD AND THE OUTPUTS IT CAME FROM
+        sources = [cache.fingerprint(fileio.locate(self.dos_dir+name)) for name in self._outputs if fileio.exists(self.dos_dir+name)]
+        self._data = dict(data)
+        self._data['method'] = np.array(method)
+        self._data['sources'] = np.array(sources)
+        cache.save(self.dos_dir+'total_dos.dat','phonondos',self._data,key=self._key)
         return
+    
+    def _read(self):
+        #READ total_dos.dat (OR ITS CACHED ARRAYS)
+        filename = fileio.locate(self.dos_dir+'total_dos.dat')
+        data = cache.load(filename,'mesh')
+        if data is None:
+            #FREQUENCY AND TOTAL DOS COLUMNS IN ONE READ - THE '# Sigma' HEADER IS A COMMENT
+            dosstr = fileio.open_file(filename)
+            table = np.loadtxt(dosstr,usecols=(0,1),ndmin=2)
+            dosstr.close()
+            data = {'energy':table[:,0].copy(),'dos':table[:,1].copy()}
+            cache.save(filename,'mesh',data)
+        return data
+    
+    def wait(self):
+        """ Wait for a background phonopy run (if any) and read its total_dos.dat. """
+        if self._process is None:
+            return
+        code = self._process.wait()
+        self._process = None
+        if code!=0:
+            raise IOError('phonopy --dos failed in '+self.dos_dir+' (exit code '+str(code)+')')
+        self._save(self._read(),'phonopy')
+        return
+    
+    def eigenvectors(self,qpts=None,branches=None):
+        """ Eigenvectors of the mesh.yaml q-points as nqpts x nbands x natoms x 3 complex values,
+            optionally sliced by @qpts and @branches. See _eigenvectors."""
+        if self._eigvec is None:
+            self._eigvec = _eigenvectors(self.dos_dir+'mesh.yaml')
+        return _modes(self._eigvec,qpts,branches)
         
     def dos(self):
-        dosstr2 = self.dosstr
-        dosstr2 = dosstr2.split('\n')[1:]
-        energy = []
-        dos = []
-        for i in range(len(dosstr2)-1):
-            energy = np.append(energy,float(dosstr2[i].split()[0]))
-            dos = np.append(dos,float(dosstr2[i].split()[1]))
+        self.wait()
+        energy = self._data['energy'].copy()
+        dos = self._data['dos'].copy()
         hbar = 0.004135 #eV/THz
         #energy = hbar*energy
         return energy,dos
@@ -104,44 +423,39 @@ class bands:
     """ Class to read band.yaml file in the DFPT directory."""
     def __init__(self,band_dir):
         self.band_dir = band_dir
-        with open(self.band_dir+'band.yaml','r') as f:
-            band = yaml.load(f)
-        self.band = band
+        self._data = _load(self.band_dir+'band.yaml','bands')
+        self._eigvec = None
         return
     
+    def eigenvectors(self,qpts=None,branches=None):
+        """ Eigenvectors along the path as nqpts x nbands x natoms x 3 complex values, optionally
+            sliced by @qpts and @branches (ints, slices or index arrays) - i.e. eigenvectors(0,
+            slice(0,3)) for the acoustic modes at the first q-point. See _eigenvectors."""
+        if self._eigvec is None:
+            self._eigvec = _eigenvectors(self.band_dir+'band.yaml')
+        return _modes(self._eigvec,qpts,branches)
+    
     def reclat(self):
-        rfile = np.zeros((3,len(self.band["reciprocal_lattice"])))
-        for i in range(len(self.band["reciprocal_lattice"])):
-            rfile[:,i] = self.band["reciprocal_lattice"][i]
-        return rfile
+        return self._data['reclat'].copy()
     
     def qpoints(self):       
-        qfile = np.zeros((3,len(self.band["phonon"])))
-        for i in range(len(self.band["phonon"])):
-            qfile[:,i] = self.band["phonon"][i]["q-position"]
-        return qfile
+        return self._data['qpoints'].copy()
     
     def distance(self):
-        dfile = np.zeros((1,len(self.band["phonon"])))
-        for i in range(dfile.shape[1]):
-            dfile[0,i] = self.band["phonon"][i]["distance"]
+        dfile = self._data['distance'].reshape((1,-1)).copy()
         return dfile
     
     def bands(self):
         hbar = 0.004135 #eV/THz 
-        bandfile = np.zeros((len(self.band["phonon"][0]["band"]),len(self.band["phonon"])))
-        for i in range(len(self.band["phonon"][0]["band"])):
-            for j in range(len(self.band["phonon"])):
-                bandfile[i,j] = self.band["phonon"][j]["band"][i]["frequency"]
-        bandfile = hbar*bandfile
+        bandfile = hbar*self._data['frequency'].T
         return bandfile
     
     def natoms(self):
-        natoms = self.band["natom"]
+        natoms = int(self._data['natom'])
         return natoms
     
     def nbands(self):
-        nbands = len(self.band["phonon"][0]["band"])
+        nbands = self._data['frequency'].shape[1]
         return nbands    
     
     
@@ -12,9 +12,12 @@
    
    ---
    
-   eigenval:   class which parses VASP eigenval file to return kpoints and energies (in eV)
-               as numpy arrays or floats - depending. Flag for Spin Polarized vs Non- Spin 
-               Polarized (and SOC) depending - as VASP format changes.
+   eigenval:   class which parses VASP eigenval file to return kpoints, weights, energies (in eV)
+               and occupations as numpy arrays or floats - depending. Flag for Spin Polarized vs 
+               Non- Spin Polarized (and SOC) depending - as VASP format changes.
+   bandindex:  function which picks bands by index range and/or by an energy window around
+               the Fermi level - used by the eigenval and procar accessors and inputs.meshgrid
+               so only the bands of interest are allocated.
    outcar:     class which parses VASP outcar file and returns system information, such as
                fermilevel, direct lattice vectors, reciprocal lattice vectors and compound.
                Returns floats, strings, or numpy arrays depending.
@@ -28,6 +31,16 @@
                spinors. For the Spin Polarized case it returns character information for both
                spin-up and spin-down cases. Else - it returns simply the total character at
                each k-point and energy level. Returns information in the form of numpy array.
+   vasprun:    class which streams VASP vasprun.xml and returns kpoints, band energies, orbital
+               characters, DOS and lattice vectors with the same array shapes as the eigenval,
+               procar, doscar and outcar classes - one file instead of four, and a cross-check
+               for the text parsers.
+   poscar:     class which reads the lattice, species and fractional atom positions of a
+               POSCAR or CONTCAR file - used by utils/symmetry.py to find the point group.
+   
+   Every reader also accepts runs archived as .gz, .xz or .bz2 files (i.e. OUTCAR.gz) - they
+   are decompressed as they are read (see fileio.py).
+   
    qscript:    Returns information contained in a bash queing script. Design for SLURM queue
                system. May not be applicable for all users.
 """
@@ -38,107 +51,304 @@
 import numpy as np
 import os
 import re
+import mmap
+import multiprocessing
+from multiprocessing import sharedctypes
+import cache
+import fileio
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+#===========================    FILE HELPERS   ============================================
+def _header(filename,nlines):
+    #READ ONLY THE FIRST @NLINES LINES OF A FILE - WITHOUT THEIR LINE ENDINGS
+    textfile = fileio.open_file(filename)
+    lines = [textfile.readline().rstrip('\n') for i in range(nlines)]
+    textfile.close()
+    return lines
+
+def _body(filename,nlines):
+    #READ EVERYTHING AFTER THE FIRST @NLINES LINES OF A FILE
+    textfile = fileio.open_file(filename)
+    for i in range(nlines):
+        textfile.readline()
+    body = textfile.read()
+    textfile.close()
+    return body
+
+def _offsets(filename,kind,pattern,start=0):
+    """ Byte offsets of the k-point blocks of an uncompressed file, followed by the file size.
+        A block starts at group 1 of each match of @pattern after byte @start. The offsets are
+        found once by running the pattern over a memory map of the file and are then kept in
+        the .iqmcache folder, so a later query only touches the blocks it asks for. Matches in
+        the trailing whitespace of the file (i.e. a final blank line) start no block."""
+    saved = cache.load(filename,kind)
+    if saved is not None:
+        return saved['offsets']
+    textfile = open(filename,'rb')
+    textmap = mmap.mmap(textfile.fileno(),0,access=mmap.ACCESS_READ)
+    end = len(textmap)
+    while end>start and textmap[end-1:end] in (b' ',b'\t',b'\r',b'\n'):
+        end -= 1
+    offsets = [match.start(1) for match in pattern.finditer(textmap,start) if match.start(1)<end]
+    offsets.append(len(textmap))
+    textmap.close()
+    textfile.close()
+    offsets = np.array(offsets,dtype=np.int64)
+    cache.save(filename,kind,{'offsets':offsets})
+    return offsets
+
+def _blocks(filename,offsets,indices):
+    #READ BLOCKS @INDICES (BETWEEN CONSECUTIVE OFFSETS) FROM A MEMORY MAP - ONE STRING EACH
+    textfile = open(filename,'rb')
+    textmap = mmap.mmap(textfile.fileno(),0,access=mmap.ACCESS_READ)
+    blocks = []
+    for i in indices:
+        block = textmap[int(offsets[i]):int(offsets[i+1])]
+        if not isinstance(block,str):
+            block = block.decode('ascii','replace')
+        blocks.append(block)
+    textmap.close()
+    textfile.close()
+    return blocks
+
+def _kind(kind,dtype):
+    #CACHE KIND FOR ARRAYS STORED WITH @DTYPE - FLOAT64 ENTRIES KEEP THE PLAIN KIND
+    dtype = np.dtype(dtype)
+    if dtype==np.float64:
+        return kind
+    return kind+'.'+dtype.name
+
+#===========================    BAND SELECTION   ==========================================
+def bandindex(energies,bands=None,window=None,efermi=0.0):
+    """ Sorted indices of the bands to keep, or None to keep every band. @energies has the
+        band index as its last axis (i.e. nspin x nkpts x nbands). @bands is a band index, list,
+        slice or mask - i.e. slice(0,20). @window is an (emin,emax) pair in eV relative to 
+        @efermi; a band is kept if its energy range over all spins and k-points overlaps the 
+        window, so window=(0,0) keeps the bands crossing the Fermi level."""
+    if bands is None and window is None:
+        return None
+    nbands = energies.shape[-1]
+    index = np.arange(nbands)
+    if bands is not None:
+        index = np.unique(np.atleast_1d(index[bands]))
+    if window is not None and energies.size>0:
+        energies = energies.reshape((-1,nbands))[:,index]
+        keep = (energies.max(axis=0)>=efermi+window[0]) & (energies.min(axis=0)<=efermi+window[1])
+        index = index[keep]
+    return index
 
 #===========================    DEFINE EIGENVAL CLASS   ====================================
 class eigenval:
-    """ Eigenval class reads stated information from the EIGENVAL file in given directory."""
+    """ Eigenval class reads stated information from the EIGENVAL file in given directory.
+        The accessors take an optional @kpts (an index, list, slice or mask of k-points). If
+        the file has not been parsed yet only those k-point blocks are read, through an index
+        of block offsets kept in the .iqmcache folder - i.e. energy(kpts=0) for Gamma. energy 
+        and occupations also take @bands/@window/@efermi (see bandindex) and only allocate
+        the selected bands - i.e. energy(window=(-10,10),efermi=ef) for a band plot. They are
+        returned as @dtype (i.e. np.float32 to halve their memory). Unless @SpinPol is given
+        it is read from the ISPIN field of the header - SOC runs share the non-spin layout."""
+    
+    #BLANK LINE IN FRONT OF EVERY K-POINT BLOCK
+    _blockstart = re.compile(br'\n[ \t\r]*\n()')
     
-    def __init__(self,dir_eig,SpinPol=True,SOC=True):
-        #DEFINE EIGENVAL FILE AND OPEN AS STRING
+    def __init__(self,dir_eig,SpinPol=None,SOC=None,dtype=float):
+        #READ EIGENVAL HEADER (FIRST SIX LINES) - THE BODY IS READ ON FIRST ACCESS
         self.dir1 = dir_eig
-        eigenstr = open(self.dir1+'EIGENVAL','r')
-        eigenstr2 = eigenstr.read().split('\n \n')
-        eigenstr.close()
-        
-        #DEFINE EIGENVAL HEADER AND BODY
-        self.header = eigenstr2[0]
-        self.eigenval = eigenstr2[1:]
-        fsteps = self.header.split('\n')[5]
+        self.filename = fileio.locate(self.dir1+'EIGENVAL')
+        lines = _header(self.filename,6)
+        self.header = '\n'.join(lines)
+        self._start = sum([len(line)+1 for line in lines[0:5]])
+        fsteps = lines[5]
+        self.nkpts = int(fsteps.split()[1])
         self.nbands = int(fsteps.split()[2])
-        
-        #DEFINE IF SPINPOL OR SOC LAYOUT
+
+        #DEFINE IF SPINPOL OR SOC LAYOUT - ISPIN IS THE FOURTH FIELD OF THE FIRST HEADER LINE
+        if SpinPol is None:
+            fields = lines[0].split()
+            SpinPol = len(fields)>3 and fields[3]=='2'
         self.spinpol = SpinPol
-        self.soc = SOC
+        self.soc = bool(SOC)
+        self.dtype = dtype
+        self._blocks = None
         return
-        
-    def kpoints(self):
-        #READ KPOINTS FROM EIGENVAL (3D VECTOR)
-        kpts = np.zeros([3,len(self.eigenval)])
-        for i in range(len(self.eigenval)):
-            kpts_prelim = self.eigenval[i].split('\n')
-            kpts_str = kpts_prelim[0]
-            kx = kpts_str.split()[0]
-            ky = kpts_str.split()[1]
-            kz = kpts_str.split()[2]
-            kvec = [float(kx),float(ky),float(kz)]
-            kpts[:,i]=kvec   
-        return kpts
+
+    def _parse(self):
+        """ Read the whole body in one bulk pass. Every token after the header is numeric, so
+            each k-point block is a fixed stride of 4 + nbands*ncol values (kx ky kz weight
+            followed by one row per band). The band rows are returned as an array with
+            dimensions nkpts x nbands x ncol. The arrays are saved to (and loaded from) the
+            .iqmcache folder - see cache.py."""
+        if not self._load():
+            filename = self.filename
+            self._kpts,self._weights,self._blocks = self._convert(_body(filename,6),self.nkpts)
+            cache.save(filename,'eigenval',{'kpoints':self._kpts,'weights':self._weights,'blocks':self._blocks})
+        return self._blocks
     
+    def _load(self):
+        #TAKE THE FULL ARRAYS FROM MEMORY OR THE .IQMCACHE FOLDER IF THEY ARE THERE - TRUE IF PARSED
+        if self._blocks is None:
+            saved = cache.load(self.filename,'eigenval')
+            if saved is not None:
+                self._kpts = saved['kpoints']
+                self._weights = saved['weights']
+                self._blocks = saved['blocks']
+        return self._blocks is not None
+
+    def _convert(self,body,nkpts):
+        #CONVERT THE TEXT OF @NKPTS CONSECUTIVE K-POINT BLOCKS - KPOINTS, WEIGHTS AND BAND ROWS
+        values = np.fromstring(body,dtype=float,sep=' ')
+        if values.size==0 or values.size%nkpts!=0:
+            #FALL BACK ON A STRICT CONVERSION SO MALFORMED NUMBERS RAISE A VALUEERROR
+            values = np.array(body.split(),dtype=float)
+        stride = values.size//nkpts
+        ncol = (stride-4)//self.nbands
+        if stride!=4+ncol*self.nbands:
+            raise IndexError('EIGENVAL body does not match '+str(nkpts)+' kpoints and '+str(self.nbands)+' bands')
+        blocks = values.reshape((nkpts,stride))
+        return blocks[:,0:3].T,blocks[:,3],blocks[:,4:].reshape((nkpts,self.nbands,ncol))
+
+    def _select(self,kpts):
+        """ Kpoints, weights and band rows for all k-points (@kpts None) or a subset. A subset
+            is sliced from the parsed arrays when they are in memory or cached (or the file is 
+            compressed and cannot be mapped), else only its blocks are read through the offset
+            index."""
+        if kpts is None:
+            self._parse()
+            return self._kpts,self._weights,self._blocks
+        kpts = np.atleast_1d(np.arange(self.nkpts)[kpts])
+        if not self._load() and not fileio.compressed(self.filename):
+            offsets = _offsets(self.filename,'eigenvalindex',self._blockstart,self._start)
+            if len(offsets)!=self.nkpts+1:
+                raise IndexError('EIGENVAL contains '+str(len(offsets)-1)+' k-point blocks, expected '+str(self.nkpts))
+            return self._convert(' '.join(_blocks(self.filename,offsets,kpts)),len(kpts))
+        self._parse()
+        return self._kpts[:,kpts],self._weights[kpts],self._blocks[kpts]
+
+    def _nspin(self):
+        if self.spinpol==True and self.soc==False:
+            return 2
+        return 1
+
+    def kpoints(self,kpts=None):
+        #READ KPOINTS FROM EIGENVAL (3D VECTOR)
+        return self._select(kpts)[0].copy()
+
+    def weights(self,kpts=None):
+        #READ KPOINT WEIGHTS FROM EIGENVAL
+        return self._select(kpts)[1].copy()
+
     def nband(self):
         return self.nbands
-    
+
     def nvalence(self):
         #READ VALANCE ELECTRONS FROM EIGENVAL HEADER
         valencestr = self.header.split('\n')[5]
         valence = valencestr.split()[0]
         nvalence = int(valence)
         return nvalence
-    
-    def energy(self): 
-        if self.spinpol==True and self.soc==False:
-            #READ ENERGY FOR SPIN POLARIZED (SPIN UP FIRST, THEN SPIN DOWN)
-            energy_array = np.zeros((2,len(self.eigenval),self.nbands))
-            for i in range(len(self.eigenval)):
-                line = self.eigenval[i].split('\n')
-                e_str = line[1:]
-                for j in range(self.nbands):
-                    energies = e_str[j].split()
-                    energy_array[0,i,j] = float(energies[1])
-                    energy_array[1,i,j] = float(energies[2])
-        else:
-            #READ ENERGY FOR NON-SPIN POLARIZED - IN ORDER
-            energy_array = np.zeros((1,len(self.eigenval),self.nbands))
-            for i in range(len(self.eigenval)):
-                line = self.eigenval[i].split('\n')
-                e_str = line[1:]
-                for j in range(self.nbands):
-                    energies = e_str[j].split()
-                    energy_array[0,i,j] = float(energies[1])                
-        
+
+    def _bands(self,blocks,bands,window,efermi):
+        #INDICES OF THE SELECTED BANDS (SEE BANDINDEX) - ALL BANDS IF NO SELECTION IS GIVEN
+        nspin = self._nspin()
+        index = bandindex(blocks[:,:,1:1+nspin].transpose(2,0,1),bands,window,efermi)
+        if index is None:
+            index = np.arange(self.nbands)
+        return index
+
+    def energy(self,kpts=None,bands=None,window=None,efermi=0.0):
+        #COLUMNS ARE BAND INDEX, ENERGY (SPIN UP, SPIN DOWN), OCCUPATION (SPIN UP, SPIN DOWN)
+        blocks = self._select(kpts)[2]
+        nspin = self._nspin()
+        index = self._bands(blocks,bands,window,efermi)
+        energy_array = np.zeros((nspin,blocks.shape[0],len(index)),dtype=self.dtype)
+        for s in range(nspin):
+            energy_array[s,:,:] = blocks[:,index,1+s]
         return energy_array
 
+    def occupations(self,kpts=None,bands=None,window=None,efermi=0.0):
+        #OCCUPATIONS FOLLOW THE ENERGIES - OLDER VASP VERSIONS DO NOT WRITE THEM
+        blocks = self._select(kpts)[2]
+        nspin = self._nspin()
+        if blocks.shape[2]<1+2*nspin:
+            raise IndexError('EIGENVAL does not contain occupations')
+        index = self._bands(blocks,bands,window,efermi)
+        occ_array = np.zeros((nspin,blocks.shape[0],len(index)),dtype=self.dtype)
+        for s in range(nspin):
+            occ_array[s,:,:] = blocks[:,index,1+nspin+s]
+        return occ_array
+
 #===========================    DEFINE OUTCAR CLASS   ====================================       
 class outcar:
-    """ Class to read parameters from OUTCAR file."""
+    """ Class to read parameters from OUTCAR file. The file is memory mapped rather than read
+        into a string, and the byte offset of each section is looked up once and kept in an
+        index - so every accessor only touches the bytes around the value it needs. A 
+        compressed OUTCAR cannot be mapped: tail (and fermilevel, toten, finished, time) 
+        stream it through the decompressor, and only the header accessors decompress it into
+        memory, on first use."""
+    
+    #BYTES DECOMPRESSED PER READ WHEN A COMPRESSED OUTCAR IS STREAMED
+    chunksize = 4*1024**2
     
     def __init__(self,dir_outcar):
-        #READ OUTCAR FILE AS STRING
+        #MEMORY MAP OUTCAR FILE - NOTHING IS READ UNTIL AN ACCESSOR ASKS FOR IT
         self.dir_outcar = dir_outcar
-        outstr = open(self.dir_outcar+'OUTCAR','r')
-        outstr2 = outstr.read()
-        outstr.close()
-        self.outstr = outstr2
+        self.filename = fileio.locate(self.dir_outcar+'OUTCAR')
+        self._map = None
+        if not fileio.compressed(self.filename):
+            outstr = open(self.filename,'rb')
+            try:
+                self._map = mmap.mmap(outstr.fileno(),0,access=mmap.ACCESS_READ)
+            except ValueError:
+                #EMPTY FILES CANNOT BE MAPPED
+                self._map = b''
+            outstr.close()
+        self._index = {}
+        self._tail = None
         return
+    
+    def _mapped(self):
+        #THE MAPPED FILE - A COMPRESSED FILE IS DECOMPRESSED INTO MEMORY THE FIRST TIME IT IS NEEDED
+        if self._map is None:
+            outstr = fileio.open_file(self.filename,'rb')
+            self._map = outstr.read()
+            outstr.close()
+        return self._map
+    
+    def _offset(self,key):
+        #BYTE OFFSET OF THE FIRST OCCURRENCE OF KEY (-1 IF MISSING) - SEARCHED ONCE, THEN INDEXED
+        if key not in self._index:
+            self._index[key] = self._mapped().find(key.encode('ascii'))
+        return self._index[key]
+    
+    def _section(self,key,stopkey):
+        #RETURN THE TEXT FROM KEY UP TO THE NEXT STOPKEY AS A STRING
+        start = self._offset(key)
+        if start<0:
+            return ''
+        stop = self._map.find(stopkey.encode('ascii'),start)
+        if stop<0:
+            stop = len(self._map)
+        section = self._map[start:stop]
+        if not isinstance(section,str):
+            section = section.decode('ascii','replace')
+        return section
         
     def latticeconst(self):
         #FIND AND READ LATTICE VECTORS FROM OUTCAR AS STRING
-        start = self.outstr.find("ALAT")
-        stop = self.outstr.find("Lattice vectors:")
-        latticeconst = float(self.outstr[start:stop].split()[2])  
+        latticeconst = float(self._section("ALAT","Lattice vectors:").split()[2])  
         return latticeconst
     
     def system(self):
         #READ SYSTEM (COMPOUND NAME) AS STRING FROM OUTCAR
-        start = self.outstr.find("SYSTEM =")
-        stop = self.outstr.find("POSCAR =")
-        name = self.outstr[start:stop].split()[2]
+        name = self._section("SYSTEM =","POSCAR =").split()[2]
         return name
     
     def dirlatvec(self):
         #READ DIRECT LATTICE VECTORS FROM OUTCAR - RETURN ARRAY OF FLOATS
-        start = self.outstr.find("direct lattice vectors")
-        stop = self.outstr.find("length of vectors")
-        latticestr = self.outstr[start:stop].split("\n")
+        latticestr = self._section("direct lattice vectors","length of vectors").split("\n")
         dirlat=np.zeros((3,3))
         for i in range(1,4):
             latticestr2 = latticestr[i].split()
@@ -149,9 +359,7 @@ class outcar:
     
     def reclatvec(self):
         #READ RECIPROCAL LATTICE VECTORS FROM OUTCAR - RETURN ARRAY OF FLOATS
-        start = self.outstr.find("direct lattice vectors")
-        stop = self.outstr.find("length of vectors")
-        latticestr = self.outstr[start:stop].split("\n")
+        latticestr = self._section("direct lattice vectors","length of vectors").split("\n")
         reclat=np.zeros((3,3))
         for i in range(1,4):
             latticestr2 = latticestr[i].split()
@@ -160,534 +368,919 @@ class outcar:
             reclat[2,i-1] = float(latticestr2[5]) 
         return reclat
     
+    def tail(self,window=262144):
+        """ Read the completion data from the end of the file: the last E-fermi and TOTEN, the
+            CPU and wall time (in hours) and whether VASP wrote its timing section, i.e. the
+            job terminated normally. The search starts in the last @window bytes and only
+            steps backwards (quadrupling the window) for the per-ionic-step values, so the cost
+            does not depend on the size of the OUTCAR. A compressed file is streamed instead
+            (see _streamtail). Missing values are returned as None."""
+        if self._tail is not None:
+            return self._tail
+        if self._map is None:
+            self._tail = self._streamtail(window)
+            return self._tail
+        size = len(self._map)
+        #THE TIMING SECTION IS ONLY EVER WRITTEN AT THE VERY END OF THE FILE
+        start = max(0,size-window)
+        tail = {}
+        tail['finished'] = self._map.rfind(b'General timing and accounting',start)>=0
+        tail['time'] = self._lastvalue('Total CPU time used (sec):',5,start)
+        tail['walltime'] = self._lastvalue('Elapsed time (sec):',3,start)
+        if tail['time'] is not None:
+            tail['time'] = tail['time']/3600 #Convert to Hours
+        if tail['walltime'] is not None:
+            tail['walltime'] = tail['walltime']/3600
+        #E-FERMI AND TOTEN ARE WRITTEN EVERY IONIC STEP - STEP BACK UNTIL THE LAST ONE IS FOUND
+        for key,field,name in [('E-fermi',2,'fermilevel'),('free  energy   TOTEN',4,'toten')]:
+            start = max(0,size-window)
+            while True:
+                value = self._lastvalue(key,field,start)
+                if value is not None or start==0:
+                    break
+                start = max(0,size-4*(size-start))
+            tail[name] = value
+        self._tail = tail
+        return tail
+    
+    def _streamtail(self,window):
+        """ tail for a file which cannot be mapped - one pass through the decompressor in 
+            @chunksize pieces, holding only the current piece. The last line holding each key
+            is kept with its offset, and the timing values only count if they lie in the last
+            @window bytes, as for a mapped file."""
+        keys = [('General timing and accounting',None,'finished'),('Total CPU time used (sec):',5,'time'),
+                ('Elapsed time (sec):',3,'walltime'),('E-fermi',2,'fermilevel'),('free  energy   TOTEN',4,'toten')]
+        last = {}
+        size = 0
+        carry = b''
+        outstr = fileio.open_file(self.filename,'rb')
+        while True:
+            chunk = outstr.read(self.chunksize)
+            text = carry+chunk
+            #ONLY WHOLE LINES ARE SEARCHED - THE PARTIAL LAST LINE IS CARRIED INTO THE NEXT PIECE
+            cut = len(text) if not chunk else text.rfind(b'\n')+1
+            for key,field,name in keys:
+                location = text.rfind(key.encode('ascii'),0,cut)
+                if location>=0:
+                    stop = text.find(b'\n',location)
+                    last[name] = (size+location,text[location:stop if stop>=0 else len(text)])
+            size += cut
+            carry = text[cut:]
+            if not chunk:
+                break
+        outstr.close()
+        tail = {}
+        for key,field,name in keys:
+            value = None
+            if name in last and (name in ('fermilevel','toten') or last[name][0]>=size-window):
+                value = True
+                if field is not None:
+                    try:
+                        value = float(last[name][1].split()[field])
+                    except (IndexError,ValueError):
+                        value = None
+            tail[name] = value
+        tail['finished'] = tail['finished'] is not None
+        if tail['time'] is not None:
+            tail['time'] = tail['time']/3600 #Convert to Hours
+        if tail['walltime'] is not None:
+            tail['walltime'] = tail['walltime']/3600
+        return tail
+    
+    def _lastvalue(self,key,field,start):
+        #FLOAT IN COLUMN @FIELD OF THE LAST LINE CONTAINING KEY AFTER BYTE @START (NONE IF MISSING)
+        location = self._map.rfind(key.encode('ascii'),start)
+        if location<0:
+            return None
+        stop = self._map.find(b'\n',location)
+        if stop<0:
+            stop = len(self._map)
+        line = self._map[location:stop].split()
+        try:
+            return float(line[field])
+        except (IndexError,ValueError):
+            return None
+    
     def fermilevel(self):
-        #READ FERMILEVEL FROM OUTCAR - SOMETIMES OUTCAR DOESNT CONTAIN THIS AND WILL THROW AN ERROR
-        #CHECK OUTCAR FILE FIRST BEFORE ADJUSTING THIS METHOD
-        start = self.outstr.find("E-fermi")
-        stop = self.outstr.find("XC(G=0)")
-        fermifile = self.outstr[start:stop].split()
-        endpoint=len(fermifile)
-        fermilevel=float(fermifile[endpoint-1])
+        #READ THE FINAL FERMILEVEL FROM THE END OF OUTCAR - SOMETIMES OUTCAR DOESNT CONTAIN THIS
+        #AND WILL THROW AN ERROR. CHECK OUTCAR FILE FIRST BEFORE ADJUSTING THIS METHOD
+        fermilevel = self.tail()['fermilevel']
+        if fermilevel is None:
+            raise IndexError('E-fermi not found in '+self.filename)
         return fermilevel
     
+    def toten(self):
+        #READ THE FINAL FREE ENERGY (TOTEN) IN EV FROM THE END OF OUTCAR
+        toten = self.tail()['toten']
+        if toten is None:
+            raise IndexError('TOTEN not found in '+self.filename)
+        return toten
+    
+    def finished(self):
+        #TRUE IF VASP REACHED THE TIMING SECTION AT THE END OF THE RUN
+        return self.tail()['finished']
+    
     def compound(self):
         #SAME AS SYSTEM
-        start = self.outstr.find("SYSTEM =")
-        stop = self.outstr.find("POSCAR =")
-        compound = self.outstr[start:stop].split()[2]
-        return compound
+        return self.system()
     
     def nions(self):
         #GET NUMBER OF ATOMS IN UNIT CELL
-        start = self.outstr.find("NIONS =")
-        stop = self.outstr.find("non local maximal ")
-        nions = self.outstr[start:stop].split()[2]
+        nions = self._section("NIONS =","non local maximal ").split()[2]
         return float(nions)
     
     def nkpts(self):
         #GET TOTAL NUMBER OF KPOINTS
-        start = self.outstr.find("NKPTS =")
-        stop = self.outstr.find("k-points in BZ")
-        nkpts = float(self.outstr[start:stop].split()[2])
+        nkpts = float(self._section("NKPTS =","k-points in BZ").split()[2])
         return nkpts                
     
-    def time(self):
-        #GET TOTAL TIME NEEDED TO COMPUTE VASP JOB
+    def ionicsteps(self):
+        """ Generator which yields one dictionary per completed ionic step while reading OUTCAR
+            line by line - only the current step is ever held in memory. Each record contains
+            the step number, the free energy (TOTEN, eV), forces and positions (nions x 3, 
+            eV/Angst and Angst), stress (XX YY ZZ XY YZ ZX in kB), the direct lattice vectors 
+            (same layout as dirlatvec) and the last magnetization written during the step 
+            (a float, or an array of three for SOC runs). A record is only yielded once its 
+            TOTEN line has been written, so this can be called on a file VASP is still writing."""
+        nions = int(self.nions())
+        step = 0
+        lattice = None
+        magnetization = None
+        stress = None
+        forces = None
+        positions = None
+        outstr = fileio.open_file(self.filename)
         try:
-            location = self.outstr.find('Total CPU time used (sec):')
-            finalstring = self.outstr[location:].split('\n')[0]
-            finalstring = finalstring.split()[5]
-            time = float(finalstring)/3600 #Convert to Hours
-            return time
-        except IndexError:
+            while True:
+                line = outstr.readline()
+                if not line.endswith('\n'):
+                    #END OF FILE (OR A LINE VASP IS STILL WRITING)
+                    break
+                if line.startswith(' number of electron') and 'magnetization' in line:
+                    values = [float(v) for v in line.split('magnetization')[1].split()]
+                    magnetization = values[0] if len(values)==1 else np.array(values)
+                elif line.startswith('  in kB'):
+                    stress = np.array([float(v) for v in line.split()[2:8]])
+                elif 'direct lattice vectors' in line:
+                    block = [outstr.readline() for i in range(3)]
+                    if not block[2].endswith('\n'):
+                        break
+                    lattice = np.array([[float(v) for v in row.split()[0:3]] for row in block]).T
+                elif 'TOTAL-FORCE' in line:
+                    block = [outstr.readline() for i in range(nions+1)][1:]
+                    if not block or not block[-1].endswith('\n'):
+                        break
+                    rows = np.array([[float(v) for v in row.split()[0:6]] for row in block])
+                    positions = rows[:,0:3]
+                    forces = rows[:,3:6]
+                elif 'free  energy   TOTEN' in line:
+                    step+=1
+                    yield {'step':step,
+                           'energy':float(line.split()[4]),
+                           'forces':forces,
+                           'positions':positions,
+                           'stress':stress,
+                           'lattice':lattice,
+                           'magnetization':magnetization}
+        finally:
+            outstr.close()
+        
+    def time(self):
+        #GET TOTAL TIME NEEDED TO COMPUTE VASP JOB - ZERO IF THE JOB DID NOT FINISH
+        time = self.tail()['time']
+        if time is None:
             time = 0
-            return time
+        return time
     
 #===========================    DEFINE DOSCAR CLASS   ====================================
 class doscar:
     """ Class to read doscar file and pull DOS/Energy values. It may be easier to read 
-        this info correctly from vasprun.xml."""
+        this info correctly from vasprun.xml. Every token after the six header lines is 
+        numeric, so the body is converted in one pass and sliced by known strides: the 
+        total DOS block (NEDOS rows) followed by one block per atom (a five value header 
+        plus NEDOS rows) when LORBIT is set. Rows that VASP wraps over two lines (f orbitals
+        with SOC) need no special handling since only the token count matters. The DOS and
+        projected DOS are returned (and the projections kept and cached) as @dtype. Unless
+        given, spin polarization is read from the column count of the total DOS (5 columns
+        instead of 3) and SOC from that of the projections (4 channels of 3, 9 or 16 orbitals)
+        once the body is parsed. A 17 column projection (16 lm orbitals, or 4 SOC channels of 
+        s p d f) is taken as non-spin lm decomposed."""
     
-    def __init__(self,dir_doscar,SpinPol=True,SOC=True):
-        #READ IN DOSCAR AS STRING
+    def __init__(self,dir_doscar,SpinPol=None,SOC=None,dtype=float):
+        #READ IN DOSCAR HEADER AND FIRST TOTAL DOS ROW - THE BODY IS READ ON FIRST ACCESS
         self.dir_doscar = dir_doscar
-        dosfile = open(self.dir_doscar+'DOSCAR','r')
-        dosstr = dosfile.read()
-        dosfile.close()
-        self.dosstr=dosstr
-        #GET LENGTH OF DOSSTR
-        line = self.dosstr.split('\n')[5]
-        self.length = int(line.split()[2])
+        self.filename = fileio.locate(self.dir_doscar+'DOSCAR')
+        lines = _header(self.filename,7)
+        self.header = '\n'.join(lines[0:6])
+        #GET LENGTH OF DOSSTR (NEDOS) AND NUMBER OF ATOMS
+        self.length = int(lines[5].split()[2])
+        self.natoms = int(lines[0].split()[0])
+        if SpinPol is None:
+            SpinPol = len(lines[6].split())==5
         self.soc=SOC
         self.spinpol=SpinPol
+        self.dtype=dtype
+        self._total = None
+        self._pdos = None
+        return
+    
+    def _parse(self):
+        #CONVERT THE BODY IN BULK AND SPLIT IT INTO THE TOTAL DOS AND PER-ATOM BLOCKS
+        if self._total is not None:
+            return
+        filename = self.filename
+        kind = _kind('doscar',self.dtype)
+        saved = cache.load(filename,kind)
+        if saved is not None:
+            self._total = saved['total']
+            self._pdos = saved['pdos']
+            self._sniff()
+            return
+        body = _body(filename,6)
+        ncol = len(body.split('\n',1)[0].split())
+        values = np.fromstring(body,dtype=float,sep=' ')
+        if values.size==0 or values.size<self.length*ncol:
+            #FALL BACK ON A STRICT CONVERSION SO MALFORMED NUMBERS RAISE A VALUEERROR
+            values = np.array(body.split(),dtype=float)
+        self._total = values[0:self.length*ncol].reshape((self.length,ncol))
+        rest = values[self.length*ncol:]
+        if rest.size==0:
+            self._pdos = np.zeros((0,self.length,1),dtype=self.dtype)
+        else:
+            stride = rest.size//self.natoms
+            ncol = (stride-5)//self.length
+            if rest.size!=self.natoms*stride or stride!=5+ncol*self.length:
+                raise IndexError('DOSCAR projections do not match '+str(self.natoms)+' atoms and NEDOS = '+str(self.length))
+            #DROP THE FIVE VALUE HEADER OF EACH ATOM BLOCK - NATOMS X NEDOS X NCOL
+            self._pdos = rest.reshape((self.natoms,stride))[:,5:].reshape((self.natoms,self.length,ncol))
+            self._pdos = self._pdos.astype(self.dtype)
+        cache.save(filename,kind,{'total':self._total,'pdos':self._pdos})
+        self._sniff()
         return
+    
+    def _sniff(self):
+        #SOC RUNS WRITE FOUR CHANNELS (TOTAL, MX, MY, MZ) OF 3, 9 OR 16 ORBITALS PER ATOM
+        if self.soc is None:
+            self.soc = self.spinpol!=True and self._pdos.shape[2]-1 in (12,36,64)
+        return
+    
+    def _nchan(self):
+        #NUMBER OF PROJECTION CHANNELS - UP/DOWN FOR SPIN POLARIZED, TOTAL/MX/MY/MZ FOR SOC
+        if self.soc==False and self.spinpol==True:
+            return 2
+        elif self.soc==True:
+            return 4
+        return 1
         
     def dos(self):
-        #READ DOS AS ARRAY OF FLOATS
-        dosstr = self.dosstr.split('\n')
-        count=0
+        #READ DOS AS ARRAY OF FLOATS - FIRST DIMENSION IS 2 FOR SPIN POLARIZED, 1 ELSE
+        self._parse()
         if self.soc==False and self.spinpol==True:
-            #FIRST DIMENSION IS 2 FOR SPIN POLARIZED
-            dos_array = np.zeros((2,self.length))
-            for m in range(6,self.length+6):
-                line = dosstr[m].split()
-                dos_array[0,count] = float(line[1])
-                dos_array[1,count] = float(line[2])
-                count+=1
+            dos_array = self._total[:,1:3].T.astype(self.dtype)
         else:
-            #FIRST DIMENSION IS 1 ELSE
-            dos_array = np.zeros((1,self.length))
-            for m in range(6,self.length+6):
-                line = dosstr[m].split()
-                dos_array[0,count] = float(line[1])
-                count+=1
-
+            dos_array = self._total[:,1:2].T.astype(self.dtype)
         return dos_array
     
     def energy(self):
         #READ ENERGIES FROM DOSCAR, RETURN AS ARRAY OF FLOATS
-        dosstr = self.dosstr.split('\n')
-        energy = np.zeros((1,self.length))
-        count = 0
-        for i in range(6,self.length+6):
-            line = dosstr[i].split()
-            energy[0,count] = float(line[0])
-            count+=1
-            
-        return energy
+        self._parse()
+        return self._total[:,0:1].T.copy()
+    
+    def pdos(self):
+        """ Projected DOS for every atom, with dimensions natoms x nchan x NEDOS x norbitals.
+            The columns of each atom block interleave the channels orbital by orbital (s-up 
+            s-down py-up ... or s mx my mz py ... for SOC), so one reshape and transpose 
+            separates them."""
+        self._parse()
+        nchan = self._nchan()
+        norb = (self._pdos.shape[2]-1)//nchan
+        if self._pdos.shape[2]!=1+nchan*norb:
+            raise IndexError('DOSCAR projections do not split into '+str(nchan)+' channels')
+        pdos = self._pdos[:,:,1:].reshape((self._pdos.shape[0],self.length,norb,nchan))
+        return pdos.transpose(0,3,1,2)
     
     def odos(self):
-        """ There's a lot here - the structure of DOSCAR for orbital case is quite complex. Take care 
-            if modifying this section."""
-        #HEADER INFO
-        header = 7
-        dosstr = self.dosstr.split('\n')
-        start = header+self.length
-        stop = len(dosstr)-1
-        total_length = stop-start
-        num_atoms = total_length/self.length
-        energy = np.zeros((1,total_length))
-        row_delete=0
-        dividend=self.length
-        
-        #GET ENERGY
-        count=0
-        for n in range(start,stop):
-            energy[0,count] = float(dosstr[n].split()[0])
-            count+=1
-        
-        #CHECK FOR F_BANDS - VASP REQUIRES AN ADDITIONAL LINE IN SOC CASE
-        if not energy[0,0]==energy[0,self.length+1]:
-            fbands = True
-            energy = energy[:,0:2*self.length]
-            energy = energy[:,::2]
-        else:
-            fbands = False
-            energy = energy[:,0:self.length]
-        
-        #GET DOS AS A FUNCTION OF CHARACTER FOR SPINPOL / NON_SOC
-        if self.spinpol==True and self.soc==False:
-            for test in range(start,start+1):
-                line = dosstr[test].split()
-                line = [float(j) for j in line]
-            dos_array = np.zeros((2,total_length,(len(line)-1)/2))
-            row_count=0
-            for i in range(start,stop):                
-                line = dosstr[i].split()
-                if (i-start)%(dividend)==0 and i!=start:
-                    row_delete+=1
-                    dividend=(i-start)+self.length+1
-                    continue
-                line = [float(j) for j in line]
-                col_count=0
-                for k in range(1,len(line),2):
-                    dos_array[0,row_count,col_count] = line[k]
-                    dos_array[1,row_count,col_count] = line[k+1]
-                    col_count+=1
-                row_count+=1                
-        
-        #GET DOS AS A FUNCTION OF CHARACTER FOR NON_SPINPOL / NON_SOC
-        if self.spinpol==False and self.soc==False:
-            for test in range(start,start+1):
-                line = dosstr[test].split()
-                line = [float(j) for j in line]
-            dos_array = np.zeros((1,total_length,(len(line)-1)))
-            row_count=0
-            for i in range(start,stop):
-                if (i-start)%(dividend)==0 and i!=start:
-                    row_delete+=1
-                    dividend=(i-start)+self.length+1
-                    continue                
-                line = dosstr[i].split()
-                line = [float(j) for j in line]
-                col_count=0
-                for k in range(1,len(line)):
-                    dos_array[0,row_count,col_count] = line[k]
-                    col_count+=1
-                row_count+=1
-                if row_count%self.length==0 and not row_count==0:
-                    row_delete+=1
-                    continue                
-            
-        #GET DOS AS A FUNCTION OF CHARACTER FOR SOC
-        if self.soc==True and fbands==False:
-            for test in range(start,start+1):
-                line = dosstr[test].split()
-                line = [float(j) for j in line]
-            dos_array = np.zeros((4,total_length,(len(line)-1)/4))
-            row_count=0
-            for i in range(start,stop):
-                if (i-start)%(dividend)==0 and i!=start:
-                    row_delete+=1
-                    dividend=(i-start)+self.length+1
-                    continue                
-                line = dosstr[i].split()
-                line = [float(j) for j in line]
-                col_count = 0
-                for k in range(1,len(line),4):
-                    dos_array[0,row_count,col_count] = line[k]
-                    dos_array[1,row_count,col_count] = line[k+1]
-                    dos_array[2,row_count,col_count] = line[k+2]
-                    dos_array[3,row_count,col_count] = line[k+3]
-                    col_count+=1
-                row_count+=1
-                if row_count%self.length==0 and not row_count==0:
-                    row_delete+=1
-                    continue                
-        
-        #GET DOS AS A FUNCTION OF CHARACTER WITH SOC AND FBANDS
-        if self.soc==True and fbands==True:
-            for test in range(start,start+1):
-                line = dosstr[test].split()
-                line = [float(j) for j in line]
-            dos_array = np.zeros((4,total_length,(len(line)-1)/4+7))
-            line_count=0
-            row_count=0
-            for i in range(start,stop):                
-                if line_count%2==0:
-                    if (i-start)%(dividend)==0 and i!=start:
-                        print dosstr[i].split()
-                        row_delete+=1
-                        dividend=(i-start)+2*self.length+1
-                        continue                    
-                    line = dosstr[i].split()
-                    line2 = dosstr[i+1].split()
-                    total_line = np.append(line,line2,axis=0)
-                    col_count=0
-                    for k in range(1,len(total_line),4):
-                        dos_array[0,row_count,col_count] = float(total_line[k])
-                        dos_array[1,row_count,col_count] = float(total_line[k+1])
-                        dos_array[2,row_count,col_count] = float(total_line[k+1])
-                        dos_array[3,row_count,col_count] = float(total_line[k+2])
-                        col_count+=1
-                    row_count+=1
-                    line_count+=1
-                else:
-                    line_count+=1
-                if row_count%self.length==0 and not row_count==0:
-                    row_delete+=1
-                    continue                
-                    
-        #SUM FOR NUMBER OF ATOMS
-        curr_length=dos_array.shape[1]
-        new_length=curr_length-row_delete
-        dos_array = dos_array[:,0:new_length]
-        new_array = np.zeros((dos_array.shape[0],self.length,dos_array.shape[2]))
-        for atom in range(num_atoms-1):
-            new_array+=dos_array[:,self.length*atom:self.length*(atom+1),:]
-        
-        return energy,new_array             
+        """ Energies and projected DOS summed over all atoms - nchan x NEDOS x norbitals. """
+        self._parse()
+        if self._pdos.shape[0]==0:
+            raise IndexError('DOSCAR contains no projected DOS - is LORBIT set?')
+        #THE ATOM BLOCKS REPEAT THE ENERGIES OF THE TOTAL DOS - TAKE THEM AT FULL PRECISION
+        energy = self._total[:,0:1].T.copy()
+        return energy,self.pdos().sum(axis=0)
                 
 
 #============================    DEFINE PROCAR CLASS   ==================================== 
+def _procar_fill(lines,arrays,nspin,nchan,ispin=-1,koffset=0,rows=None):
+    """ Fill the PROCAR arrays (a dictionary with kpoints, weights, energies, occupations, 
+        character and labels) from an iterable of PROCAR lines. Lines are dispatched on their
+        first characters so the per-ion rows, which make up most of the file, are skipped 
+        without being split. @ispin is the spin set the lines start in (each '# of k-points' 
+        header starts the next one) and k-point N is stored in row N-1-@koffset. Energies and
+        occupations are kept for every band; the character of band N goes to row @rows[N-1]
+        (skipped if negative, all bands if @rows is None). The character array is allocated
+        (as arrays['dtype']) at the first ion header if it is still None. The number of spin
+        sets reached is left in arrays['nsets']."""
+    kpts = arrays['kpoints']
+    weights = arrays['weights']
+    energies = arrays['energies']
+    occupations = arrays['occupations']
+    character = arrays['character']
+    floats = re.compile(r'-?\d+\.\d+')
+    kpt = 0
+    band = 0
+    row = 0
+    comp = 0
+    for line in lines:
+        first = line[:1]
+        if first=='t':
+            #TOTAL CHARACTER ROW - ONE PER SPINOR COMPONENT
+            if comp<nchan and row>=0:
+                values = line.split()
+                chan = ispin if nspin==2 else comp
+                character[chan,kpt,row,:] = [float(v) for v in values[1:len(values)-1]]
+            comp+=1
+        elif first==' ':
+            if line[1:2]=='k':
+                kpt = int(line.split()[1])-1-koffset
+                start = line.find(':')+1
+                stop = line.find('weight')
+                kpts[:,kpt] = [float(v) for v in floats.findall(line[start:stop])]
+                weights[kpt] = float(line[stop:].split()[-1])
+        elif first=='b':
+            values = line.split()
+            band = int(values[1])-1
+            row = band if rows is None else rows[band]
+            energies[ispin if nspin==2 else 0,kpt,band] = float(values[4])
+            occupations[ispin if nspin==2 else 0,kpt,band] = float(values[7])
+            comp = 0
+        elif first=='i':
+            if character is None:
+                values = line.split()
+                arrays['labels'] = values[1:len(values)-1]
+                nsel = energies.shape[2] if rows is None else int((rows>=0).sum())
+                character = np.zeros((nchan,kpts.shape[1],nsel,len(arrays['labels'])),dtype=arrays['dtype'])
+                arrays['character'] = character
+            comp = 0
+        elif first=='#':
+            ispin+=1
+    arrays['nsets'] = ispin+1
+    return arrays
+
+#SHARED RESULT BUFFERS OF THE PARALLEL PROCAR WORKERS - SET BY _PROCAR_INIT IN EACH WORKER
+_shared = {}
+
+def _procar_init(buffers):
+    #POOL INITIALIZER - THE SHARED BUFFERS ARE HANDED OVER ONCE, NOT WITH EVERY TASK
+    _shared.update(buffers)
+    return
+
+def _procar_chunk(task):
+    """ Pool worker - parse the PROCAR bytes between two k-point block offsets straight into
+        the shared result arrays. Nothing but None is sent back to the parent."""
+    filename,start,stop,ispin,nspin,nchan,shapes,rows = task
+    arrays = dict((name,np.frombuffer(_shared[name],dtype=dtype).reshape(shape)) for name,(shape,dtype) in shapes.items())
+    arrays['labels'] = []
+    text = _blocks(filename,[start,stop],[0])[0]
+    _procar_fill(text.split('\n'),arrays,nspin,nchan,ispin=ispin,rows=rows)
+    return
+
 class procar:
     """ Reader for VASP PROCAR file. This file is only generated for LORBIT tag being set.
         This file specifically provides orbital character information, and the file 
-        structure can be complex. There is a more straighforward way to write these
-        routines for the interested (I'm sure). But these should do the job."""
+        structure can be complex. The whole file is read in a single streaming pass which
+        fills the kpoints, weights, band energies, occupations and orbital characters 
+        together. Only the 'tot' row of each ion block is kept - one row per band for 
+        non-spin and spin polarized runs (the spin down set follows the spin up set), and 
+        four rows (total, mx, my, mz) per band for SOC runs. As for eigenval, the accessors
+        take an optional @kpts and then only read those k-point blocks (of every spin set),
+        and @bands/@window/@efermi (see bandindex) - the character is then only allocated 
+        and filled for the selected bands. With @nproc > 1 an uncompressed file is split at 
+        k-point blocks and the chunks are parsed by a pool of processes writing into shared
+        memory. The character is stored (and cached) as @dtype - np.float32 or np.float16 cut
+        its memory by two or four. Unless given, SOC is read from the number of 'tot' rows of
+        the first band (4 instead of 1) and spin polarization from the number of spin sets 
+        (see _sniff) - for compressed files spinpol stays None until the first read."""
+    
+    #K-POINT HEADER LINE OPENING EVERY BLOCK
+    _blockstart = re.compile(br'\n( k-point )')
+    #BAND LINES - ONLY THE ENERGY IS CAPTURED
+    _bandline = re.compile(br'\nband +\d+ # energy +(\S+)')
+    #TARGET BYTES PER PARALLEL CHUNK (AT LEAST 4 CHUNKS PER PROCESS ARE USED)
+    chunksize = 64*1024**2
     
-    def __init__(self,dir_procar,SpinPol=True,SOC=True):
-        #READ IN PROCAR AS STRING
+    def __init__(self,dir_procar,SpinPol=None,SOC=None,nproc=1,dtype=float):
+        #READ THE PROCAR HEADER (AND THE FIRST BLOCK IF THE LAYOUT IS NOT GIVEN)
         self.dir_procar = dir_procar
-        prostring = open(self.dir_procar+'PROCAR','r')
-        prostring2 = prostring.read()
-        prostring.close()
-        self.prostring = prostring2
-        #READ IN STRING OF ENERGIES
-        energystring = os.popen('grep "# of bands:" '+self.dir_procar+'PROCAR')
-        energystring2 = energystring.read()
-        start = energystring2.find("# of bands:")
-        stop = energystring2.find("# of ions:")
-        bands = [int(s) for s in energystring2[start:stop].split() if s.isdigit()]
-        self.nbands = bands[0]
-        #READ IN KPOINT STRING
-        kpointstring = os.popen('grep "k-point " '+self.dir_procar+'PROCAR').read()
-        kpointstring2 = kpointstring.split('\n')
-        kpointstring3 = filter(None,kpointstring2)  
+        self.filename = fileio.locate(self.dir_procar+'PROCAR')
         self.spinpol=SpinPol
         self.soc=SOC
-        if self.spinpol==True and self.soc==False:
-            self.nkpts = len(kpointstring3)/2
-        else:
-            self.nkpts = len(kpointstring3)
+        self._ionline = None
+        self._sniff()
+        self.nproc=nproc
+        self.dtype=dtype
+        self._parsed = False
+        self._bandenergy = None
         return
     
-    def nbands(self):
-        #THIS IS CLEARLY NOT NEEDED - JUST RETURN SELF.NBANDS.
-        energystring = os.popen('grep "# of bands:" '+self.dir_procar+'PROCAR')
-        energystring2 = energystring.read()
-        start = energystring2.find("# of bands:")
-        stop = energystring2.find("# of ions:")
-        bands = [int(s) for s in energystring2[start:stop].split() if s.isdigit()]
-        numbands = bands[0]
-        return numbands
+    def _sniff(self):
+        """ Read the header counts and, for any layout flag left as None, infer it from the
+            top of the file in the same pass. The 'tot' rows of the first band give SOC. The 
+            spin sets are counted from the size of the first k-point block: a plain file holds
+            nsets x nkpts blocks of equal size, so its size gives nsets without reading on. 
+            Compressed files have no usable size - nsets is left unresolved and is counted by
+            the pass which reads the file (see _resolve)."""
+        prostring = fileio.open_file(self.filename)
+        prostring.readline()
+        header = prostring.readline()
+        counts = [int(s) for s in header.replace(':',' ').split() if s.isdigit()]
+        self.nkpts = counts[0]
+        self.nbands = counts[1]
+        self.nions = counts[2]
+        if self.spinpol is not None and self.soc is not None:
+            prostring.close()
+            return
+        position = 0
+        start = None
+        blocksize = None
+        bands = 0
+        tots = 0
+        nsets = 1
+        for line in prostring:
+            first = line[:2]
+            if first==' k':
+                if start is not None:
+                    blocksize = position-start
+                    break
+                start = position
+            elif first=='ba':
+                bands+=1
+            elif first=='to' and bands==1:
+                tots+=1
+            elif first=='io' and self._ionline is None:
+                self._ionline = line
+            elif first=='# ':
+                #SECOND SPIN SET REACHED WITHIN THE FIRST BLOCK (SINGLE K-POINT)
+                nsets = 2
+                break
+            position += len(line)
+        if self.soc is None:
+            self.soc = tots>1
+        if blocksize is not None and self.spinpol is None and not self.soc:
+            if fileio.compressed(self.filename):
+                prostring.close()
+                return
+            size = os.path.getsize(self.filename)-start
+            nsets = min(2,max(1,int(round(float(size)/(self.nkpts*blocksize)))))
+        prostring.close()
+        if self.spinpol is None:
+            self.spinpol = nsets==2
+        return
     
-    def nkpts(self):
-        #SAME - JUST RETURN SELF.NKPTS
-        kpointstring = os.popen('grep "k-point " '+self.dir_procar+'PROCAR').read()
-        kpointstring2 = kpointstring.split('\n')
-        kpointstring3 = filter(None,kpointstring2)
-        nkpts = len(kpointstring3)
-        return nkpts
+    def _resolve(self,arrays):
+        #SET SPINPOL FROM THE SPIN SETS COUNTED BY A FULL PASS - ONE SET DROPS THE SPARE SPIN SLOT
+        if self.spinpol is not None:
+            return arrays
+        self.spinpol = arrays['nsets']==2
+        if not self.spinpol:
+            for name in ('energies','occupations','character'):
+                if arrays[name] is not None:
+                    arrays[name] = arrays[name][0:1].copy()
+        return arrays
     
-    def kpoints(self):
-        #RETURN ARRAY OF KPOINTS AS FLOAT.
-        kpointstring = os.popen('grep k-point '+self.dir_procar+'PROCAR').read()
-        kpointstring2 = kpointstring.split('\n')
-        kvec = np.zeros((3,self.nkpts))
-        col_count=0
-        for i in range(1,len(kpointstring2)):
-            kstr = kpointstring2[i]
-            start = kstr.find(':')+1
-            stop = kstr.find('weight')
-            kstr_new = kstr[start:stop].replace('-',' -')
-            try:
-                if kstr_new == "":
-                    continue
-                else:
-                    kstr_new2 = map(float,kstr_new.split())
-                    kvec[:,col_count] = kstr_new2
-                    col_count+=1
-            except ValueError:
-                break    
-        return kvec
-    
-    def energies(self):
-        counter1 = 0
-        energyvec=[]
-        os.system('echo "============= BAND ENERGIES =============="')
-        #DEFINE DIMENSIONS OF ENERGY BANDS SPIN POL VS NON SPIN POL
-        if self.spinpol==True and self.soc==False:
-            enmat = np.zeros((2,self.nkpts,self.nbands))
+    def _layout(self):
+        #NUMBER OF ENERGY SETS AND CHARACTER SETS FOR THE SPIN POLARIZED, SOC AND NON-SPIN CASES
+        #AN UNRESOLVED SPINPOL (COMPRESSED FILE, SEE _SNIFF) IS READ WITH ROOM FOR TWO SPIN SETS
+        if self.spinpol!=False and self.soc==False:
+            return 2,2
+        elif self.soc==True:
+            return 1,4
         else:
-            enmat = np.zeros((1,self.nkpts,self.nbands))
-        while True:
-            counter1+=1
-            #ADJUST SPACING OF TEXT
-            if counter1<10:
-                spacestr = "  "
-            elif counter1>=10 and counter1<100:
-                spacestr = " "
-            elif counter1>=100:
-                spacestr = ""
-            #GREP ENERGIES FROM PROCAR FILE
-            os.system('echo "band '+spacestr+str(counter1)+'" '+self.dir_procar+'PROCAR')
-            energystring =  os.popen('grep "band '+spacestr+str(counter1)+'" '+self.dir_procar+'PROCAR').read()
-            energylist = energystring.split('\n')
-            if not energystring:
-                os.system(' echo "band '+str(counter1)+' NOT found" ')
-                break
+            return 1,1
+    
+    def _arrays(self,nkpts):
+        #EMPTY ARRAYS FOR @NKPTS KPOINTS - THE CHARACTER IS ALLOCATED AT THE FIRST ION HEADER
+        nspin,nchan = self._layout()
+        return {'kpoints':np.zeros((3,nkpts)),
+                'weights':np.zeros(nkpts),
+                'energies':np.zeros((nspin,nkpts,self.nbands)),
+                'occupations':np.zeros((nspin,nkpts,self.nbands)),
+                'character':None,
+                'labels':[],
+                'dtype':self.dtype}
+    
+    def _rows(self,index):
+        #ROW OF EACH BAND IN THE CHARACTER ARRAY - -1 FOR BANDS WHICH ARE NOT SELECTED
+        if index is None:
+            return None
+        rows = -np.ones(self.nbands,dtype=int)
+        rows[index] = np.arange(len(index))
+        return rows
+    
+    def _kind(self):
+        nspin,nchan = self._layout()
+        return _kind('procar'+str(nspin)+str(nchan),self.dtype)
+    
+    def _load(self):
+        #TAKE THE FULL ARRAYS FROM THE .IQMCACHE FOLDER IF THEY ARE THERE - TRUE IF PARSED
+        if not self._parsed:
+            #AN UNRESOLVED SPINPOL (SEE _SNIFF) LOOKS FOR THE ENTRY OF EITHER LAYOUT
+            unresolved = self.spinpol is None
+            for spinpol in ([True,False] if unresolved else [self.spinpol]):
+                self.spinpol = spinpol
+                saved = cache.load(self.filename,self._kind())
+                if saved is not None:
+                    break
+            if saved is None and unresolved:
+                self.spinpol = None
+            if saved is not None:
+                self._kpts = saved['kpoints']
+                self._weights = saved['weights']
+                self._energies = saved['energies']
+                self._occupations = saved['occupations']
+                self._character = saved['character']
+                self._labels = [str(label) for label in saved['labels']]
+                self._parsed = True
+        return self._parsed
+    
+    def _read(self,kpts,index):
+        """ Read the arrays for the k-points @kpts (all if None) and the character of the bands
+            @index (all if None) from the file - through the block index for a k-point subset
+            of an uncompressed file, in parallel for @nproc > 1, else in one streaming pass."""
+        nspin,nchan = self._layout()
+        rows = self._rows(index)
+        nsel = self.nbands if index is None else len(index)
+        compressed = fileio.compressed(self.filename)
+        if kpts is not None and not compressed:
+            offsets = _offsets(self.filename,'procarindex',self._blockstart)
+            nsets = (len(offsets)-1)//self.nkpts
+            if nsets==0 or len(offsets)!=nsets*self.nkpts+1:
+                raise IndexError('PROCAR contains '+str(len(offsets)-1)+' k-point blocks, expected a multiple of '+str(self.nkpts))
+            indices = [ispin*self.nkpts+k for k in kpts for ispin in range(nsets)]
+            blocks = _blocks(self.filename,offsets,indices)
+            arrays = self._arrays(len(kpts))
+            for i in range(len(indices)):
+                row = i//nsets
+                _procar_fill(blocks[i].split('\n'),arrays,nspin,nchan,ispin=i%nsets,koffset=kpts[row]-row,rows=rows)
+        elif self.nproc>1 and not compressed:
+            arrays = self._parallel(nspin,nchan,rows)
+        else:
+            prostring = fileio.open_file(self.filename)
+            arrays = self._resolve(_procar_fill(prostring,self._arrays(self.nkpts),nspin,nchan,rows=rows))
+            prostring.close()
+            nchan = self._layout()[1]
+        if arrays['character'] is None:
+            arrays['character'] = np.zeros((nchan,arrays['kpoints'].shape[1],nsel,0),dtype=self.dtype)
+        if kpts is not None and arrays['kpoints'].shape[1]!=len(kpts):
+            #COMPRESSED FILES ARE READ WHOLE - KEEP THE REQUESTED K-POINTS
+            arrays = self._take(arrays,kpts,None)
+        return arrays
+    
+    def _take(self,arrays,kpts,index):
+        #SLICE K-POINTS @KPTS AND BANDS @INDEX (EITHER MAY BE NONE) OUT OF A SET OF ARRAYS
+        arrays = dict(arrays)
+        if kpts is not None:
+            arrays['kpoints'] = arrays['kpoints'][:,kpts]
+            arrays['weights'] = arrays['weights'][kpts]
+            for name in ('energies','occupations','character'):
+                arrays[name] = arrays[name][:,kpts]
+        if index is not None:
+            for name in ('energies','occupations','character'):
+                arrays[name] = arrays[name][:,:,index]
+        return arrays
+    
+    def _parse(self):
+        """ Read the whole file (see _procar_fill). The arrays are saved to (and loaded from) 
+            the .iqmcache folder - see cache.py."""
+        if self._load():
+            return
+        arrays = self._read(None,None)
+        self._kpts = arrays['kpoints']
+        self._weights = arrays['weights']
+        self._energies = arrays['energies']
+        self._occupations = arrays['occupations']
+        self._character = arrays['character']
+        self._labels = arrays['labels']
+        cache.save(self.filename,self._kind(),{'kpoints':self._kpts,'weights':self._weights,'energies':self._energies,
+                                               'occupations':self._occupations,'character':self._character,
+                                               'labels':np.array(self._labels)})
+        self._parsed = True
+        return
+    
+    def _parallel(self,nspin,nchan,rows=None):
+        """ Parse the file in chunks of whole k-point blocks with a pool of @self.nproc
+            processes. The result arrays live in shared memory (RawArray) which every worker
+            fills in place, so no partial arrays are pickled back to the parent. A chunk may
+            run across the '# of k-points' header of the next spin set - the worker picks the
+            spin index up from it just as the serial pass does."""
+        offsets = _offsets(self.filename,'procarindex',self._blockstart)
+        nblocks = len(offsets)-1
+        if nblocks==0 or nblocks%self.nkpts!=0:
+            raise IndexError('PROCAR contains '+str(nblocks)+' k-point blocks, expected a multiple of '+str(self.nkpts))
+        #THE FIRST BLOCK GIVES THE ORBITAL LABELS, WHICH SIZE THE CHARACTER ARRAY
+        first = _procar_fill(_blocks(self.filename,offsets,[0])[0].split('\n'),self._arrays(1),nspin,nchan,ispin=0)
+        labels = first['labels']
+        nsel = self.nbands if rows is None else int((rows>=0).sum())
+        shapes = {'kpoints':((3,self.nkpts),float),
+                  'weights':((self.nkpts,),float),
+                  'energies':((nspin,self.nkpts,self.nbands),float),
+                  'occupations':((nspin,self.nkpts,self.nbands),float),
+                  'character':((nchan,self.nkpts,nsel,len(labels)),self.dtype)}
+        #RAW BYTE BUFFERS - VIEWED WITH THE DTYPE OF EACH ARRAY (FLOAT16 HAS NO CTYPES EQUIVALENT)
+        buffers = dict((name,sharedctypes.RawArray('b',int(np.prod(shape))*np.dtype(dtype).itemsize)) for name,(shape,dtype) in shapes.items())
+        nchunks = max(4*self.nproc,int((offsets[-1]-offsets[0])//self.chunksize)+1)
+        bounds = np.unique(np.linspace(0,nblocks,min(nchunks,nblocks)+1).astype(int))
+        tasks = [(self.filename,int(offsets[bounds[i]]),int(offsets[bounds[i+1]]),bounds[i]//self.nkpts,nspin,nchan,shapes,rows)
+                 for i in range(len(bounds)-1)]
+        pool = multiprocessing.Pool(self.nproc,_procar_init,(buffers,))
+        try:
+            pool.map(_procar_chunk,tasks)
+        finally:
+            pool.close()
+            pool.join()
+        arrays = dict((name,np.frombuffer(buffers[name],dtype=dtype).reshape(shape)) for name,(shape,dtype) in shapes.items())
+        arrays['labels'] = labels
+        arrays['dtype'] = self.dtype
+        return arrays
+    
+    def _bandenergies(self):
+        """ Band energies of every spin set, k-point and band (nsets x nkpts x nbands) - used to
+            resolve an energy window before the characters are read. Only the band lines are 
+            picked out, with one regular expression over a memory map of the file."""
+        if self._parsed:
+            return self._energies
+        if self._bandenergy is None:
+            if fileio.compressed(self.filename):
+                prostring = fileio.open_file(self.filename)
+                values = [line.split()[4] for line in prostring if line.startswith('band')]
+                prostring.close()
             else:
-                #ITERATE THROUGH EACH LINE - SKIP KPOINTS READ ENERGIES
-                for k in range(len(energylist)):
-                    enstr = energylist[k]
-                    start = enstr.find('energy')
-                    stop = enstr.find('# occ')
-                    try:
-                        enlist = enstr[start:stop].split()
-                        num = float(enlist[1])
-                        if k==0:
-                            energyvec = num
-                        else:
-                            energyvec = np.append(energyvec,num)
-                    except IndexError:
-                        continue
-                if len(energyvec)==2*self.nkpts:
-                    enmat[0,:,counter1-1] = energyvec[0:self.nkpts]
-                    enmat[1,:,counter1-1] = energyvec[self.nkpts:]
-                else:
-                    enmat[0,:,counter1-1] = energyvec
-        return enmat
+                textfile = open(self.filename,'rb')
+                textmap = mmap.mmap(textfile.fileno(),0,access=mmap.ACCESS_READ)
+                values = self._bandline.findall(textmap)
+                textmap.close()
+                textfile.close()
+            self._bandenergy = np.array(values,dtype=float).reshape((-1,self.nkpts,self.nbands))
+            if self.spinpol is None:
+                self.spinpol = self._bandenergy.shape[0]==2
+        return self._bandenergy
+    
+    def _bandindex(self,kpts,bands,window,efermi):
+        #BANDS SELECTED BY INDEX AND/OR ENERGY WINDOW (AT THE REQUESTED K-POINTS) - NONE FOR ALL
+        if window is None:
+            return bandindex(np.zeros((0,self.nbands)),bands)
+        energies = self._bandenergies()
+        if kpts is not None:
+            energies = energies[:,np.arange(self.nkpts)[kpts]]
+        return bandindex(energies,bands,window,efermi)
+    
+    def _select(self,kpts,index=None):
+        """ Arrays (as in _procar_fill) for all k-points (@kpts None) or a subset, and for all
+            bands (@index None) or the bands in @index. They are sliced from the full arrays
+            when those are in memory or cached (a compressed file without a band selection is 
+            parsed in full), else only the requested blocks and bands are read."""
+        if kpts is not None:
+            kpts = np.atleast_1d(np.arange(self.nkpts)[kpts])
+        if self._load() or (index is None and (kpts is None or fileio.compressed(self.filename))):
+            self._parse()
+            arrays = {'kpoints':self._kpts,'weights':self._weights,'energies':self._energies,
+                      'occupations':self._occupations,'character':self._character,'labels':self._labels}
+            return self._take(arrays,kpts,index)
+        arrays = self._read(kpts,index)
+        if index is not None:
+            arrays['energies'] = arrays['energies'][:,:,index]
+            arrays['occupations'] = arrays['occupations'][:,:,index]
+        return arrays
+    
+    def kpoints(self,kpts=None):
+        #RETURN ARRAY OF KPOINTS AS FLOAT.
+        return self._select(kpts)['kpoints']
+    
+    def weights(self,kpts=None):
+        #RETURN ARRAY OF KPOINT WEIGHTS
+        return self._select(kpts)['weights']
+    
+    def energies(self,kpts=None,bands=None,window=None,efermi=0.0):
+        #RETURN BAND ENERGIES - 2 X NKPTS X NBANDS FOR SPIN POLARIZED, 1 X NKPTS X NBANDS ELSE
+        return self._select(kpts,self._bandindex(kpts,bands,window,efermi))['energies']
+    
+    def occupations(self,kpts=None,bands=None,window=None,efermi=0.0):
+        #RETURN BAND OCCUPATIONS - SAME DIMENSIONS AS ENERGIES
+        return self._select(kpts,self._bandindex(kpts,bands,window,efermi))['occupations']
     
     def labels(self):
-        #READ LABELS - I.E. BAND CHARACTERS
-        labelfile = os.popen('grep -m 2 "ion" '+self.dir_procar+'PROCAR').read()
-        labelstring = labelfile.split('\n')[1]
-        labels = map(str,labelstring.split())
-        del labels[0]
-        del labels[-1]
-        return labels
+        #READ LABELS - I.E. BAND CHARACTERS - FROM THE FIRST ION HEADER (KEPT BY _SNIFF IF IT READ THAT FAR)
+        if self._load():
+            return list(self._labels)
+        if self._ionline is None:
+            prostring = fileio.open_file(self.filename)
+            for line in prostring:
+                if line.startswith('io'):
+                    self._ionline = line
+                    break
+            prostring.close()
+        if self._ionline is None:
+            return []
+        values = self._ionline.split()
+        return values[1:len(values)-1]
     
-    def character(self):
-        nkpts = self.nkpts
-        numbands = self.nbands
-        soc = self.soc
-        spinpol = self.spinpol
-        start = [m.start() for m in re.finditer('ion ', self.prostring)]
-        stop = [m.start() for m in re.finditer('band ', self.prostring)]
-        nkcount=0
-        nbcount=0
-        os.system('echo "=============  BAND CHARACTERS  =============="')
-        if self.spinpol==True and self.soc==False:
-            for j in range(len(stop)):
-                if j==(len(stop)-1):
-                    segments = self.prostring[start[j]:].split("\n\n")
-                else:
-                    segments = self.prostring[start[j]:stop[j+1]].split("\n\n")
-                count=0
-                kpt=False
-                for i in range(len(segments)):
-                    if segments[i]:
-                        try:
-                            count+=1
-                            block = segments[i].split("\n")
-                            listblock = block[len(block)-1].split()
-                            spinor = np.array([float(k) for k in listblock[1:len(listblock)-1]])
-                            if count==1:
-                                spinor1=spinor
-                            #elif count==2:
-                            #    spinor2=spinor
-                        except ValueError:
-                            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-                            nkcount+=1
-                            nbcount=0
-                            kpt=True
-                            break
-                    else:
-                        continue
-                if j==0:
-                    orbital_spin1 = np.zeros((nkpts,numbands,len(spinor1)))
-                    orbital_spin2 = np.zeros((nkpts,numbands,len(spinor1)))
-                    
-                if kpt==False:
-                    if nkcount==self.nkpts:
-                        nkcount=0
-                        nbcount=0
-                    if nkcount<self.nkpts:
-                        orbital_spin1[nkcount,nbcount,:] = spinor1
-                        nbcount+=1
-                    else:
-                        print j, nkcount, nbcount
-                        orbital_spin2[nkcount,nbcount,:] = spinor1
-                        nbcount+=1
-                
-                elif kpt==True:
-                    continue
-            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-            orbital = np.zeros((2,self.nkpts,self.nbands,orbital_spin1.shape[2]))
-            orbital[0,:,:,:] = orbital_spin1
-            orbital[1,:,:,:] = orbital_spin2 
-        elif self.spinpol==False and self.soc==False:
-            for j in range(len(stop)):
-                if j==(len(stop)-1):
-                    segments = self.prostring[start[j]:].split("\n\n")
-                else:
-                    segments = self.prostring[start[j]:stop[j+1]].split("\n\n")
-                count=0
-                kpt=False
-                for i in range(len(segments)):
-                    if segments[i]:
-                        try:
-                            count+=1
-                            block = segments[i].split("\n")
-                            listblock = block[len(block)-1].split()
-                            spinor = np.array([float(k) for k in listblock[1:len(listblock)-1]])
-                            if count==1:
-                                spinor1=spinor
-                            #elif count==2:
-                            #    spinor2=spinor
-                        except ValueError:
-                            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-                            nkcount+=1
-                            nbcount=0
-                            kpt=True
-                            break
-                    else:
-                        continue
-                if j==0:
-                    orbital_spin1 = np.zeros((nkpts,numbands,len(spinor1)))
-                    
-                if kpt==False:
-                    if nkcount==self.nkpts:
-                        nkcount=0
-                        nbcount=0
-                    if nkcount<self.nkpts:
-                        orbital_spin1[nkcount,nbcount,:] = spinor1
-                        nbcount+=1
-                    else:
-                        print j, nkcount, nbcount
-                        orbital_spin2[nkcount,nbcount,:] = spinor1
-                        nbcount+=1
-                
-                elif kpt==True:
-                    continue
-            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-            orbital = np.zeros((1,self.nkpts,self.nbands,orbital_spin1.shape[2]))
-            orbital[0,:,:,:] = orbital_spin1             
-        else:
-            for j in range(len(stop)):
-                if j==(len(stop)-1):
-                    segments = self.prostring[start[j]:].split("\n\n")
-                else:
-                    segments = self.prostring[start[j]:stop[j+1]].split("\n\n")
-                count=0
-                kpt=False
-                for i in range(len(segments)):
-                    if segments[i]:
-                        try:
-                            count+=1
-                            block = segments[i].split("\n")
-                            listblock = block[len(block)-1].split()
-                            spinor = np.array([float(k) for k in listblock[1:len(listblock)-1]])
-                            if count==1:
-                                spinor1=spinor
-                            elif count==2:
-                                spinor2=spinor
-                            elif count==3:
-                                spinor3=spinor
-                            elif count==4:
-                                spinor4=spinor
-                        except ValueError:
-                            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-                            nkcount+=1
-                            nbcount=0
-                            kpt=True
-                            break
-                    else:
-                        continue
-                if j==0:
-                    orbital_spin1 = np.zeros((nkpts,numbands,len(spinor1)))
-                    orbital_spin2 = np.zeros((nkpts,numbands,len(spinor2)))
-                    orbital_spin3 = np.zeros((nkpts,numbands,len(spinor3)))
-                    orbital_spin4 = np.zeros((nkpts,numbands,len(spinor4)))
-                    
-                if kpt==False:
-                    orbital_spin1[nkcount,nbcount,:] = spinor1
-                    orbital_spin2[nkcount,nbcount,:] = spinor2
-                    orbital_spin3[nkcount,nbcount,:] = spinor3
-                    orbital_spin4[nkcount,nbcount,:] = spinor4
-                    nbcount+=1
-                
-                elif kpt==True:
-                    continue
-            os.system('echo "k-point '+str(nkcount+1)+'" '+self.dir_procar)
-            orbital = np.zeros((4,self.nkpts,self.nbands,orbital_spin1.shape[2]))
-            orbital[0,:,:,:] = orbital_spin1
-            orbital[1,:,:,:] = orbital_spin2
-            orbital[2,:,:,:] = orbital_spin3
-            orbital[3,:,:,:] = orbital_spin4
+    def character(self,kpts=None,bands=None,window=None,efermi=0.0):
+        #RETURN TOTAL ORBITAL CHARACTER - NCHAN X NKPTS X NBANDS X NORBITALS
+        return self._select(kpts,self._bandindex(kpts,bands,window,efermi))['character']
+    
+#===========================    DEFINE VASPRUN CLASS   ====================================
+class vasprun:
+    """ Streaming reader for vasprun.xml. The file is read with iterparse and every element is
+        cleared as soon as its data has been copied out, so the xml tree is never held in
+        memory. Rows are converted to floats one set (i.e. one k-point) at a time. The arrays
+        come back with the same dimensions as the text readers: energy/occupations/kpoints as 
+        in eigenval, character/labels as in procar, dos/pdos/odos as in doscar (dosenergy 
+        corresponds to doscar.energy) and dirlatvec/reclatvec/fermilevel as in outcar. Only 
+        the last <eigenvalues>, <projected> and <dos> sections (the final ionic step) are kept,
+        and the root drops every finished <calculation>, so memory stays flat over the ionic 
+        steps of a long MD run. The orbital character and projected DOS are stored (and cached)
+        as @dtype."""
+    
+    #SECTIONS WHOSE <r> AND <v> ROWS ARE COLLECTED
+    _sections = ('kpointlist','weights','basis','rec_basis','eigenvalues','projected','total','partial')
+    
+    def __init__(self,dir_vasprun,dtype=float):
+        self.dir_vasprun = dir_vasprun
+        self.dtype = dtype
+        self.filename = fileio.locate(self.dir_vasprun+'vasprun.xml')
+        self._data = None
+        return
+    
+    def _key(self,parent,elem):
+        #SECTION AN ELEMENT BELONGS TO, GIVEN THE SECTION OF ITS PARENT
+        tag = elem.tag
+        if tag=='varray':
+            name = elem.get('name')
+            if parent=='kpoints' and name in ('kpointlist','weights'):
+                return name
+            if parent=='crystal' and name in ('basis','rec_basis'):
+                return name
+            return None
+        if tag in ('kpoints','structure','dos','projected'):
+            return tag
+        if tag=='crystal' and parent=='structure':
+            return tag
+        if tag=='eigenvalues':
+            return None if parent=='projected' else tag
+        if tag in ('total','partial') and parent=='dos':
+            return tag
+        if tag in ('r','v','set','array','field','i'):
+            return parent
+        return None
+    
+    def _parse(self):
+        if self._data is not None:
+            return self._data
+        filename = self.filename
+        self._data = cache.load(filename,_kind('vasprun',self.dtype))
+        if self._data is not None:
+            return self._data
+        chunks = dict((key,[]) for key in self._sections)
+        spins = dict((key,0) for key in self._sections)
+        ions = dict((key,0) for key in self._sections)
+        fields = dict((key,[]) for key in self._sections)
+        efermi = None
+        keys = [None]
+        rows = []
+        root = None
+        source = fileio.open_file(filename,'rb')
+        for event,elem in ElementTree.iterparse(source,events=('start','end')):
+            if event=='start':
+                if root is None:
+                    root = elem
+                key = self._key(keys[-1],elem)
+                if key in self._sections and key!=keys[-1]:
+                    #A NEW SECTION REPLACES THE ONE FROM THE PREVIOUS IONIC STEP
+                    chunks[key] = []
+                    spins[key] = 0
+                    ions[key] = 0
+                    fields[key] = []
+                if elem.tag=='set' and key in self._sections:
+                    comment = elem.get('comment') or ''
+                    if comment.startswith('spin'):
+                        spins[key]+=1
+                    elif comment.startswith('ion'):
+                        ions[key]+=1
+                keys.append(key)
+                continue
+            key = keys.pop()
+            tag = elem.tag
+            if tag=='r' or tag=='v':
+                if key in self._sections:
+                    rows.append(elem.text)
+            elif tag=='set' or tag=='varray':
+                if rows:
+                    chunks[key].append(np.fromstring(' '.join(rows),dtype=float,sep=' '))
+                    rows = []
+            elif tag=='field':
+                if key in self._sections:
+                    fields[key].append(elem.text.strip())
+                continue
+            elif tag=='i':
+                if key=='dos' and elem.get('name')=='efermi':
+                    efermi = float(elem.text)
+            elif tag=='calculation':
+                #CLEARED ELEMENTS ARE STILL CHILDREN OF THE ROOT - DROP THEM WITH EACH IONIC STEP
+                root.clear()
+                continue
+            elem.clear()
+        source.close()
         
-        return orbital
+        #RESHAPE THE COLLECTED ROWS
+        data = {}
+        concat = dict((key,np.concatenate(chunks[key]) if chunks[key] else np.zeros(0)) for key in self._sections)
+        kpts = concat['kpointlist'].reshape((-1,3)).T
+        nkpts = kpts.shape[1]
+        data['kpoints'] = kpts
+        data['weights'] = concat['weights']
+        data['dirlat'] = concat['basis'].reshape((3,3)).T
+        data['reclat'] = concat['rec_basis'].reshape((3,3)).T
+        data['efermi'] = np.array(np.nan if efermi is None else efermi)
+        #EIGENVALUES - NSPIN X NKPTS X NBANDS X (ENERGY, OCCUPATION)
+        nspin = max(spins['eigenvalues'],1)
+        bands = concat['eigenvalues'].reshape((nspin,nkpts,-1,2))
+        data['energy'] = bands[:,:,:,0]
+        data['occupations'] = bands[:,:,:,1]
+        nbands = bands.shape[2]
+        #PROJECTIONS - NCHAN X NKPTS X NBANDS X NIONS X NORBITALS, SUMMED OVER IONS
+        norb = len(fields['projected'])
+        if norb>0:
+            nchan = max(spins['projected'],1)
+            projected = concat['projected'].reshape((nchan,nkpts,nbands,-1,norb))
+            data['character'] = projected.sum(axis=3).astype(self.dtype)
+        else:
+            data['character'] = np.zeros((1,nkpts,nbands,0),dtype=self.dtype)
+        data['labels'] = np.array(fields['projected'])
+        #TOTAL DOS - NSPIN X NEDOS X (ENERGY, DOS, INTEGRATED DOS)
+        nspin = max(spins['total'],1)
+        data['total'] = concat['total'].reshape((nspin,-1,3))
+        nedos = data['total'].shape[1]
+        #PARTIAL DOS - NIONS X NCHAN X NEDOS X (ENERGY + NORBITALS)
+        ncol = len(fields['partial'])
+        if ncol>1:
+            nions = max(ions['partial'],1)
+            nchan = max(spins['partial']//nions,1)
+            data['partial'] = concat['partial'].reshape((nions,nchan,nedos,ncol)).astype(self.dtype)
+        else:
+            data['partial'] = np.zeros((0,1,nedos,1),dtype=self.dtype)
+        cache.save(filename,_kind('vasprun',self.dtype),data)
+        self._data = data
+        return data
+    
+    def kpoints(self):
+        return self._parse()['kpoints']
+    
+    def weights(self):
+        return self._parse()['weights']
+    
+    def energy(self):
+        #BAND ENERGIES - NSPIN X NKPTS X NBANDS (AS EIGENVAL.ENERGY)
+        return self._parse()['energy']
+    
+    def occupations(self):
+        return self._parse()['occupations']
+    
+    def character(self):
+        #ORBITAL CHARACTER SUMMED OVER IONS - NCHAN X NKPTS X NBANDS X NORBITALS (AS PROCAR.CHARACTER)
+        return self._parse()['character']
+    
+    def labels(self):
+        return [str(label) for label in self._parse()['labels']]
+    
+    def dosenergy(self):
+        #DOS ENERGIES - 1 X NEDOS (AS DOSCAR.ENERGY)
+        return self._parse()['total'][0:1,:,0]
+    
+    def dos(self):
+        #TOTAL DOS - NSPIN X NEDOS (AS DOSCAR.DOS)
+        return self._parse()['total'][:,:,1]
+    
+    def pdos(self):
+        #PROJECTED DOS - NIONS X NCHAN X NEDOS X NORBITALS (AS DOSCAR.PDOS)
+        return self._parse()['partial'][:,:,:,1:]
+    
+    def odos(self):
+        #ENERGIES AND PROJECTED DOS SUMMED OVER IONS (AS DOSCAR.ODOS)
+        partial = self._parse()['partial']
+        if partial.shape[0]==0:
+            raise IndexError('vasprun.xml contains no projected DOS - is LORBIT set?')
+        return self.dosenergy(),partial[:,:,:,1:].sum(axis=0)
+    
+    def dirlatvec(self):
+        return self._parse()['dirlat']
+    
+    def reclatvec(self):
+        return self._parse()['reclat']
+    
+    def fermilevel(self):
+        fermilevel = float(self._parse()['efermi'])
+        if np.isnan(fermilevel):
+            raise IndexError('efermi not found in '+self.filename)
+        return fermilevel
     
 #===========================    DEFINE KPOINTS CLASS   ====================================
 class kpoints:
@@ -695,7 +1288,7 @@ class kpoints:
     
     def __init__(self,dir_kpts):
         self.dir_kpts = dir_kpts
-        kptfile = open(self.dir_kpts+'KPOINTS','r')
+        kptfile = fileio.open_file(self.dir_kpts+'KPOINTS')
         kptstr = kptfile.read()
         kptfile.close()
         self.kptstr = kptstr
@@ -725,36 +1318,74 @@ class kpoints:
     #ERROR IF NOT LINE MODE
     
     def nsample(self):
-        #NEED TO COMPLETE
-        pass
+        #SUBDIVISIONS OF AN AUTOMATIC (GAMMA OR MONKHORST-PACK) MESH - NONE FOR OTHER MODES
+        lines = self.kptstr.split('\n')
+        if len(lines)<4 or lines[1].split()[0:1]!=['0'] or lines[2].strip()[0:1].upper() not in ('G','M'):
+            return None
+        return [int(v) for v in lines[3].split()[0:3]]
     
     def labels(self):
         start = self.kptstr.find("rec")
         lines = self.kptstr[start:].split('\n')
-        kpoints=[]
-        for i in range(1,len(lines)):
-            try:
-                sublines = lines[i].split()
-                kpoints = np.append(kpoints,sublines[3])
-            except IndexError:
-                continue
-        #Reprocess Kpoints
-        for i in range(len(kpoints)):
-            kstring = kpoints[i]
-            newstring = kstring[1:2]
-            kpoints[i] = newstring
-        #Screen for duplicates
-        klabel=[]
+        #Label of every line with one - reprocessed to the character after the ! marker
+        kpoints = [line.split()[3][1:2] for line in lines[1:] if len(line.split())>3]
+        #Screen for duplicates - every second label starts a segment, plus the final point
+        klabel = np.empty(len(kpoints[0::2])+1,dtype=object)
         for i in range(0,len(kpoints),2):
-            try:
-                if kpoints[i]=='G':
-                    klabel = np.append(klabel,'$\Gamma$')
-                else:
-                    klabel = np.append(klabel,kpoints[i])
-            except IndexError:
-                break
-        klabel = np.append(klabel,kpoints[len(kpoints)-1])
-        return klabel 
+            if kpoints[i]=='G':
+                klabel[i//2] = '$\Gamma$'
+            else:
+                klabel[i//2] = kpoints[i]
+        klabel[-1] = kpoints[len(kpoints)-1]
+        return klabel.astype(str) 
+
+#===========================    DEFINE POSCAR CLASS   =====================================
+class poscar:
+    """ Read the structure from a POSCAR (or CONTCAR, with @name) file - VASP 4 or 5 format."""
+    
+    def __init__(self,dir_poscar,name='POSCAR'):
+        self.dir_poscar = dir_poscar
+        posfile = fileio.open_file(self.dir_poscar+name)
+        lines = posfile.read().split('\n')
+        posfile.close()
+        self.comment = lines[0].strip()
+        scale = float(lines[1].split()[0])
+        lattice = np.array([[float(v) for v in lines[i].split()[0:3]] for i in range(2,5)])
+        if scale<0:
+            #NEGATIVE SCALE IS THE CELL VOLUME
+            scale = (-scale/abs(np.linalg.det(lattice)))**(1./3)
+        self.lattice = scale*lattice
+        #VASP 5 WRITES A LINE OF ELEMENT SYMBOLS BEFORE THE COUNTS
+        line = 5
+        if not lines[line].split()[0].isdigit():
+            self.symbols = lines[line].split()
+            line+=1
+        else:
+            self.symbols = self.comment.split()
+        self.counts = [int(v) for v in lines[line].split()]
+        line+=1
+        if lines[line].strip()[0:1].upper()=='S':
+            #SELECTIVE DYNAMICS
+            line+=1
+        cartesian = lines[line].strip()[0:1].upper() in ('C','K')
+        natoms = sum(self.counts)
+        positions = np.array([[float(v) for v in lines[line+1+i].split()[0:3]] for i in range(natoms)])
+        if cartesian:
+            positions = np.linalg.solve(self.lattice.T,scale*positions.T).T
+        self.positions = positions
+        return
+    
+    def dirlatvec(self):
+        #DIRECT LATTICE VECTORS AS COLUMNS - SAME LAYOUT AS outcar.dirlatvec
+        return self.lattice.T.copy()
+    
+    def fractional(self):
+        #FRACTIONAL ATOM POSITIONS - natoms x 3
+        return self.positions.copy()
+    
+    def types(self):
+        #SPECIES INDEX OF EVERY ATOM - natoms
+        return np.repeat(np.arange(len(self.counts)),self.counts)
 
 class qscript:
     """ Read information from marcc.job qscript file"""
@@ -799,39 +1430,76 @@ class findreplace:
     
 #===========================    DEFINE INCAR CLASS   =====================================
 class incar:
-    """ Read information from INCAR file - specifically soc and spinpol setting."""
+    """ Read information from INCAR file. The file is parsed once into a dictionary of tags 
+        (@self.tags, keys in upper case). Comments (# or !) are dropped, several tags may share
+        a line when separated by ;, and values are converted to bools (.TRUE./.FALSE./T/F), 
+        ints, floats, lists (with VASP's 3*0.0 repeat notation expanded) or left as strings.
+        A missing INCAR gives an empty dictionary - VASP defaults then apply."""
     def __init__(self,dir_incar):
         self.dir_incar = dir_incar
+        self.tags = {}
+        if fileio.exists(self.dir_incar+'INCAR'):
+            incarfile = fileio.open_file(self.dir_incar+'INCAR')
+            for line in incarfile:
+                line = re.split('[#!]',line)[0]
+                for statement in line.split(';'):
+                    if '=' not in statement:
+                        continue
+                    tag,value = statement.split('=',1)
+                    tag = tag.strip().upper()
+                    if tag:
+                        self.tags[tag] = self._value(value)
+            incarfile.close()
+        return
+    
+    def _value(self,value):
+        #CONVERT THE TEXT OF A TAG TO A BOOL, INT, FLOAT, LIST OR STRING
+        tokens = []
+        for token in value.split():
+            if '*' in token:
+                count,item = token.split('*',1)
+                if count.isdigit():
+                    tokens += [item]*int(count)
+                    continue
+            tokens.append(token)
+        converted = [self._scalar(token) for token in tokens]
+        if len(converted)==0:
+            return ''
+        elif len(converted)==1:
+            return converted[0]
+        elif all([not isinstance(item,str) for item in converted]):
+            return converted
+        return value.strip()
+    
+    def _scalar(self,token):
+        #CONVERT A SINGLE TOKEN - FORTRAN STYLE LOGICALS AND D EXPONENTS INCLUDED
+        logical = token.strip('.').upper()
+        if logical in ('TRUE','T'):
+            return True
+        if logical in ('FALSE','F'):
+            return False
+        try:
+            return int(token)
+        except ValueError:
+            pass
+        try:
+            return float(token.replace('d','e').replace('D','e'))
+        except ValueError:
+            return token
+    
+    def get(self,tag,default=None):
+        #VALUE OF A TAG (CASE INSENSITIVE) - OR DEFAULT IF IT IS NOT SET
+        return self.tags.get(tag.upper(),default)
         
     def soc(self):
-        soc_string = os.popen("grep LSORBIT "+self.dir_incar+"INCAR")
-        soc_string = soc_string.read()
-        start = soc_string.find('=')
-        stop = soc_string.find('\n')
-        start_new = start+1
-        stop_new = stop-1
-        if soc_string[start_new:stop_new]==".FALSE." or soc_string[start_new:stop_new]==" .FALSE." or soc_string[start_new:stop_new]==" .FALSE. ":
-            soc = bool(False)
-        elif soc_string[start_new:stop_new]==".TRUE." or soc_string[start_new:stop_new]==" .TRUE." or soc_string[start_new:stop_new]==" .TRUE. ":
-            soc = bool(True)
-        else:
-            soc = bool(False) 
-            
-        return soc
+        #LSORBIT = .TRUE.
+        soc = self.get('LSORBIT',False)
+        return soc is True
     
     def spin(self):
-        spin_string = os.popen("grep ISPIN "+self.dir_incar+"INCAR")
-        spin_string = spin_string.read()
-        start = spin_string.find('=')+1
-        stop = spin_string.find('\n')
-        if spin_string[start:stop]=="1" or spin_string[start:stop]==" 1" or spin_string[start:stop]==" 1 ":
-            spin = bool(False)
-        elif spin_string[start:stop]=="2" or spin_string[start:stop]==" 2" or spin_string[start:stop]==" 2 ":
-            spin = bool(True)
-        else:
-            spin = bool(False) 
-            
-        return spin
+        #ISPIN = 2
+        spin = self.get('ISPIN',1)
+        return spin==2
     
 
 #==================================            ===========================================
@@ -0,0 +1,238 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+###################################################################################################
+
+""" Persistent cache for parsed arrays. Each calculation directory gets a .iqmcache folder which
+    holds one .npz file per parsed output file (i.e. .iqmcache/EIGENVAL.eigenval.npz), plus a
+    .npy file for arrays that are read as memory maps (i.e. phonon eigenvectors). Entries
+    are keyed on the absolute path, size, modification time and a fingerprint of the first and
+    last 64 KB of the source file - so an edited or rewritten file is parsed again. An edit 
+    inside the middle of a file which keeps both its size and its modification time is NOT
+    detected - clear the cache after such an edit. Every key also carries the schema version
+    of its kind (VERSIONS), so entries written by an older parser are parsed again. The total
+    size of each cache folder is bounded by MAXSIZE, evicting the least recently used entries.
+
+    The cache is used transparently by the VASPread and PHONOPYread readers. Set ENABLED to
+    False to always parse from the raw files.
+
+    ---
+
+    digest: hash the contents of several files - a key for results derived from all of them.
+    version: the key stored for an entry - a source key tagged with the schema version of its kind.
+    load:   return the dictionary of arrays saved for a file, or None if missing or stale.
+    stored: return the key and arrays of an entry without checking the key.
+    save:   save a dictionary of arrays for a file and evict old entries if needed.
+    load_memmap:   return a large single-array entry (.npy) as a read-only memory map.
+    create_memmap: open a new .npy entry as a writable memory map to be filled in place.
+    commit_memmap: put a filled memory map in place and record the key of its source file.
+    clear:  remove the cache folder of a calculation directory.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import os
+import hashlib
+import shutil
+import re
+import fileio
+
+#===========================    CACHE SETTINGS   ===========================================
+ENABLED = True
+CACHE_DIR = '.iqmcache'
+MAXSIZE = 2*1024**3 #BYTES PER CALCULATION DIRECTORY
+BLOCK = 65536 #BYTES HASHED FROM EACH END OF THE SOURCE FILE
+
+#SCHEMA VERSION OF EACH KIND OF ENTRY - RAISE IT WHENEVER A PARSER CHANGES WHAT IT STORES. KINDS
+#ARE MATCHED ON THEIR LEADING LETTERS (I.E. procar22.float32 IS A procar ENTRY), OTHERS ARE 1
+VERSIONS = {'eigenval':1,'eigenvalindex':2,'doscar':1,'procar':2,'procarindex':2,'vasprun':2,
+            'qpoints':1,'bands':1,'meshyaml':1,'mesh':1,'eigenvectors':1,'phonondos':2}
+
+#===========================    CACHE FUNCTIONS   ==========================================
+def fingerprint(path):
+    """ Return the key of a source file - a hash of its absolute path, size, modification time
+        and the contents of its first and last BLOCK bytes."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(('%s|%d|%r' % (path,stat.st_size,stat.st_mtime)).encode('utf-8'))
+    source = open(path,'rb')
+    digest.update(source.read(BLOCK))
+    if stat.st_size>BLOCK:
+        source.seek(max(BLOCK,stat.st_size-BLOCK))
+        digest.update(source.read(BLOCK))
+    source.close()
+    return digest.hexdigest()
+
+def digest(paths):
+    """ Return a hash of the full contents of @paths (in order), each located first so an
+        archived file (i.e. FORCE_CONSTANTS.gz) hashes its compressed bytes. Missing files hash
+        as missing, so creating one changes the digest. Used as an explicit @key for results
+        derived from several input files."""
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        path = fileio.locate(path)
+        if not os.path.exists(path):
+            digest.update(b'|missing|')
+            continue
+        source = open(path,'rb')
+        block = source.read(BLOCK)
+        while block:
+            digest.update(block)
+            block = source.read(BLOCK)
+        source.close()
+    return digest.hexdigest()
+
+def version(kind,key):
+    #KEY STORED FOR AN ENTRY - THE SOURCE KEY AND THE SCHEMA VERSION OF ITS KIND
+    return '%s|v%d' % (key,VERSIONS.get(re.match('[a-z]*',kind).group(0),1))
+
+def entry(path,kind):
+    #LOCATION OF THE CACHE ENTRY FOR A SOURCE FILE AND A KIND OF PARSED DATA
+    directory,name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory,CACHE_DIR,name+'.'+kind+'.npz')
+
+def stored(path,kind):
+    """ Return the key an entry for @path was saved under and its arrays (as a dictionary),
+        without comparing the key to the source - or None if there is no readable entry of the
+        current schema version."""
+    if not ENABLED:
+        return None
+    filename = entry(path,kind)
+    if not os.path.exists(filename):
+        return None
+    try:
+        saved = np.load(filename)
+        try:
+            key = str(saved['__key__'])
+            arrays = dict((name,saved[name]) for name in saved.files if name!='__key__')
+        finally:
+            saved.close()
+    except (IOError,OSError,ValueError,KeyError):
+        return None
+    source = key.rsplit('|v',1)[0]
+    if key!=version(kind,source):
+        return None
+    return source,arrays
+
+def load(path,kind,key=None):
+    """ Return the arrays saved for @path (as a dictionary) or None if there is no entry or the
+        source file changed since it was saved. If @key is given it is compared instead of the
+        fingerprint of @path, which then need not exist (see digest). Loading an entry marks 
+        it as recently used."""
+    if not ENABLED or not os.path.exists(entry(path,kind)):
+        return None
+    try:
+        if key is None:
+            key = fingerprint(path)
+    except (IOError,OSError):
+        return None
+    saved = stored(path,kind)
+    if saved is None or saved[0]!=key:
+        return None
+    try:
+        os.utime(entry(path,kind),None)
+    except (IOError,OSError):
+        pass
+    return saved[1]
+
+def save(path,kind,arrays,key=None):
+    """ Save a dictionary of arrays for @path (under @key if given, see load). The entry is
+        written to a temporary file and renamed into place so a crashed or concurrent writer 
+        never leaves a partial entry. Failures (i.e. read-only directories) are ignored - the
+        cache is only an accelerator."""
+    if not ENABLED:
+        return
+    filename = entry(path,kind)
+    directory = os.path.dirname(filename)
+    try:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        arrays = dict(arrays)
+        if key is None:
+            key = fingerprint(path)
+        arrays['__key__'] = np.array(version(kind,key))
+        temp = filename[:-4]+'.'+str(os.getpid())+'.tmp.npz'
+        np.savez(temp,**arrays)
+        os.rename(temp,filename)
+        evict(directory,MAXSIZE)
+    except (IOError,OSError):
+        return
+    return
+
+def load_memmap(path,kind):
+    """ Return the array saved for @path with create_memmap/commit_memmap as a read-only memory
+        map (nothing is read until it is sliced), or None if missing or stale. The key lives
+        in a small .npz entry of the same kind next to the .npy file."""
+    if load(path,kind) is None:
+        return None
+    try:
+        return np.load(entry(path,kind)[:-4]+'.npy',mmap_mode='r')
+    except (IOError,OSError,ValueError):
+        return None
+
+def create_memmap(path,kind,shape,dtype):
+    """ Open a temporary .npy entry for @path as a writable memory map of @shape and @dtype,
+        for arrays too large to build in memory. Fill it and pass it to commit_memmap. None is
+        returned if the cache is disabled or the folder cannot be written."""
+    if not ENABLED:
+        return None
+    filename = entry(path,kind)
+    directory = os.path.dirname(filename)
+    try:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temp = filename[:-4]+'.'+str(os.getpid())+'.tmp.npy'
+        return np.lib.format.open_memmap(temp,mode='w+',dtype=dtype,shape=shape)
+    except (IOError,OSError):
+        return None
+
+def commit_memmap(path,kind,array):
+    """ Flush a memory map from create_memmap, rename it into place and save its key. The new
+        entry is never evicted by its own commit, even if it alone exceeds MAXSIZE. Returns the
+        entry reopened read-only (or @array itself if it could not be committed)."""
+    filename = entry(path,kind)
+    target = filename[:-4]+'.npy'
+    try:
+        array.flush()
+        os.rename(array.filename,target)
+        temp = filename[:-4]+'.'+str(os.getpid())+'.tmp.npz'
+        np.savez(temp,__key__=np.array(version(kind,fingerprint(path))),shape=np.array(array.shape))
+        os.rename(temp,filename)
+        evict(os.path.dirname(filename),MAXSIZE,keep=(filename,target))
+        return np.load(target,mmap_mode='r')
+    except (IOError,OSError):
+        return array
+
+def evict(directory,maxsize,keep=()):
+    #REMOVE LEAST RECENTLY USED ENTRIES (OTHER THAN @keep) UNTIL THE FOLDER FITS IN MAXSIZE BYTES
+    entries = []
+    for name in os.listdir(directory):
+        filename = os.path.join(directory,name)
+        if os.path.isfile(filename):
+            stat = os.stat(filename)
+            entries.append((stat.st_mtime,stat.st_size,filename))
+    entries.sort()
+    total = sum([size for mtime,size,filename in entries])
+    for mtime,size,filename in entries:
+        if total<=maxsize:
+            break
+        if filename in keep:
+            continue
+        os.remove(filename)
+        total -= size
+    return
+
+def clear(calc_dir):
+    #REMOVE THE WHOLE CACHE FOLDER OF A CALCULATION DIRECTORY
+    directory = os.path.join(calc_dir,CACHE_DIR)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    return
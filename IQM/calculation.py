@@ -0,0 +1,180 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+###################################################################################################
+
+""" Lazy view of a single VASP run directory (i.e. ~/work/myname/Test/MgB2/STATIC/). Rather than
+    constructing the VASPread readers one by one, scripts create a Calculation and ask for the
+    values they need. Every reader is only constructed (and its file only opened) the first time
+    one of its values is used, and every value is computed once and then remembered.
+
+    ---
+
+    Calculation: class with memoized properties for the readers (incar, outcar, eigenval, doscar,
+                 procar, kpoints, vasprun) and the values read from them (fermilevel, lattices, energies,
+                 dos, orbital characters, band path). Unless given explicitly, the readers work out
+                 spin polarization and SOC from their own file headers, and the spinpol and soc
+                 properties report the same sniffed layout (INCAR only when the files are
+                 missing). @nproc processes are used to parse PROCAR and
+                 @dtype (i.e. np.float32) is passed on to the readers for compact arrays.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import os
+import VASPread
+import fileio
+
+#===========================    MEMOIZED PROPERTY   ========================================
+def memoized(method):
+    """ Turn a method into a read-only property which is computed on first access and then
+        stored in the instance's _memo dictionary."""
+    name = method.__name__
+    def getter(self):
+        if name not in self._memo:
+            self._memo[name] = method(self)
+        return self._memo[name]
+    getter.__name__ = name
+    getter.__doc__ = method.__doc__
+    return property(getter)
+
+#===========================    DEFINE CALCULATION CLASS   =================================
+class Calculation(object):
+    """ Calculation class gives lazy access to the outputs of one VASP run directory."""
+
+    def __init__(self,calc_dir,SpinPol=None,SOC=None,nproc=1,dtype=float):
+        #NOTHING IS READ HERE - SEE THE PROPERTIES BELOW
+        self.calc_dir = os.path.join(calc_dir,'')
+        self._spinpol = SpinPol
+        self._soc = SOC
+        self.nproc = nproc
+        self.dtype = dtype
+        self._memo = {}
+        return
+
+    #============================    READERS   ==============================================
+    @memoized
+    def incar(self):
+        return VASPread.incar(self.calc_dir)
+
+    @memoized
+    def outcar(self):
+        return VASPread.outcar(self.calc_dir)
+
+    @memoized
+    def eigenval(self):
+        return VASPread.eigenval(self.calc_dir,SpinPol=self._spinpol,SOC=self._soc,dtype=self.dtype)
+
+    @memoized
+    def doscar(self):
+        return VASPread.doscar(self.calc_dir,SpinPol=self._spinpol,SOC=self._soc,dtype=self.dtype)
+
+    @memoized
+    def procar(self):
+        return VASPread.procar(self.calc_dir,SpinPol=self._spinpol,SOC=self._soc,nproc=self.nproc,dtype=self.dtype)
+
+    @memoized
+    def kpoints(self):
+        return VASPread.kpoints(self.calc_dir)
+
+    @memoized
+    def vasprun(self):
+        return VASPread.vasprun(self.calc_dir,dtype=self.dtype)
+
+    #============================    LAYOUT   ===============================================
+    @memoized
+    def spinpol(self):
+        #SPIN POLARIZATION - FROM THE CONSTRUCTOR IF GIVEN, ELSE THE EIGENVAL HEADER (AS THE READERS
+        #SEE IT), ELSE INCAR
+        if self._spinpol is not None:
+            return self._spinpol
+        if fileio.exists(self.calc_dir+'EIGENVAL'):
+            return self.eigenval.spinpol
+        return self.incar.spin()
+
+    @memoized
+    def soc(self):
+        #SPIN ORBIT COUPLING - FROM THE CONSTRUCTOR IF GIVEN, ELSE THE 'tot' ROWS OF PROCAR (AS THE
+        #READERS SEE IT), ELSE INCAR - EIGENVAL DOES NOT TELL SOC FROM NON-SPIN
+        if self._soc is not None:
+            return self._soc
+        if fileio.exists(self.calc_dir+'PROCAR'):
+            return self.procar.soc
+        return self.incar.soc()
+
+    #============================    OUTCAR   ===============================================
+    @memoized
+    def fermilevel(self):
+        return self.outcar.fermilevel()
+
+    @memoized
+    def dirlat(self):
+        return self.outcar.dirlatvec()
+
+    @memoized
+    def reclat(self):
+        return self.outcar.reclatvec()
+
+    @memoized
+    def natoms(self):
+        return self.outcar.nions()
+
+    @memoized
+    def compound(self):
+        return self.outcar.compound()
+
+    #============================    EIGENVAL   =============================================
+    @memoized
+    def kpts(self):
+        #KPOINTS (3 X NKPTS) FROM EIGENVAL
+        return self.eigenval.kpoints()
+
+    @memoized
+    def energies(self):
+        #BAND ENERGIES (NSPIN X NKPTS X NBANDS) FROM EIGENVAL
+        return self.eigenval.energy()
+
+    @memoized
+    def nbands(self):
+        return self.eigenval.nband()
+
+    #============================    DOSCAR   ===============================================
+    @memoized
+    def dos_energy(self):
+        return self.doscar.energy()
+
+    @memoized
+    def dos(self):
+        return self.doscar.dos()
+
+    @memoized
+    def odos(self):
+        #ENERGIES AND ORBITAL PROJECTED DOS SUMMED OVER ATOMS (SEE VASPread.doscar.odos)
+        return self.doscar.odos()
+
+    #============================    PROCAR   ===============================================
+    @memoized
+    def orbital_kpts(self):
+        return self.procar.kpoints()
+
+    @memoized
+    def orbital_energies(self):
+        return self.procar.energies()
+
+    @memoized
+    def characters(self):
+        return self.procar.character()
+
+    #============================    KPOINTS   ==============================================
+    @memoized
+    def kpath(self):
+        return self.kpoints.kpath()
+
+    @memoized
+    def klabels(self):
+        return self.kpoints.labels()
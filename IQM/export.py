@@ -0,0 +1,68 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+###################################################################################################
+
+""" Writers for the file formats of external viewers.
+
+    ---
+
+    write_bxsf: write band energies on a k-mesh (inputs.meshgrid layout) as an XCrySDen bxsf file
+                for Fermi surface rendering.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import VASPread
+
+#===========================    SETTINGS   =================================================
+BUFFER = 4*1024**2 #BYTES BUFFERED BEFORE EACH WRITE TO DISK
+
+#===========================    BXSF   =====================================================
+def _bxsf_band(slab):
+    """ Text of one band (n1 x n2 x n3 energies) in bxsf order: one line per (m,p) with the n3
+        values, a blank pair of lines between the m blocks. Values below 10 eV in magnitude get
+        five decimals and the rest four, so the columns keep their width. The whole slab is
+        formatted by a single % operation on a format string assembled from the magnitudes."""
+    n1,n2,n3 = slab.shape
+    cells = np.where(np.abs(slab)<10,'    %.5f','    %.4f').reshape((n1*n2,n3))
+    rows = [''.join(row)+'\n' for row in cells]
+    blocks = [''.join(rows[m*n2:(m+1)*n2]) for m in range(n1)]
+    return '\n\n'.join(blocks) % tuple(slab.ravel().tolist())
+
+def write_bxsf(filename,energymat,reclat,fermilevel,crossing=False):
+    """ Write @energymat (n1 x n2 x n3 x nbands, from inputs.meshgrid) as a bxsf file. @reclat
+        holds one reciprocal lattice vector per column, as returned by VASPread.outcar.reclatvec.
+        With @crossing only the bands which cross @fermilevel are written (see
+        VASPread.bandindex) - they keep their original band numbers. Each band is formatted
+        as one block of text and the file is written through a BUFFER byte buffer."""
+    ksamp = energymat.shape[0:3]
+    nbands = energymat.shape[3]
+    index = np.arange(nbands)
+    if crossing:
+        index = VASPread.bandindex(energymat,window=(0,0),efermi=fermilevel)
+
+    #GENERATE BXSF HEADER
+    bxsf = open(filename,'w',BUFFER)
+    bxsf.write('BEGIN_INFO \n  #Created by Jake Tutmaher and Guy Marcus\n  #Not for outside distribution\n')
+    bxsf.write('  Fermi_Energy: '+str(fermilevel)+'\n')
+    bxsf.write('END_INFO\n\nBEGIN_BLOCK_BANDGRID_3D\n  Pointless_Line\n  BEGIN_BANDGRID_3D\n')
+    bxsf.write('    '+str(len(index))+'\n')
+    bxsf.write('    '+str(ksamp[0])+' '+str(ksamp[1])+' '+str(ksamp[2])+'\n    0.0 0.0 0.0\n')
+    for i in range(3):
+        bxsf.write('    '+str(reclat[0,i])+' '+str(reclat[1,i])+' '+str(reclat[2,i])+'\n')
+
+    #GENERATE ENERGIES IN ROW MAJOR - ONE FORMATTED BLOCK PER BAND
+    for n in index:
+        bxsf.write('\n  BAND: '+str(n+1)+'\n')
+        bxsf.write(_bxsf_band(energymat[:,:,:,n]))
+    bxsf.write('  END_BANDGRID_3D\n')
+    bxsf.write('END_BLOCK_BANDGRID_3D')
+    bxsf.close()
+    return
@@ -0,0 +1,76 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+###################################################################################################
+
+""" Open raw output files whether or not they have been compressed. Finished runs are often
+    archived as OUTCAR.gz, PROCAR.xz, vasprun.xml.bz2, etc. to save quota - the readers ask for
+    the plain name and get the first existing sibling in SUFFIXES. Compressed files are
+    decompressed as a stream while they are read, never inflated to disk.
+
+    .gz and .bz2 use the standard library. .xz needs the lzma module (python 3, or the
+    backports.lzma package on python 2).
+
+    ---
+
+    locate:     return the path of a file or of its compressed sibling.
+    exists:     True if a file or one of its compressed siblings exists.
+    compressed: True if a located path is compressed.
+    open_file:  open a (located) file for reading, decompressing on the fly.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import os
+import gzip
+import bz2
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+#===========================    SETTINGS   =================================================
+#SEARCH ORDER - THE PLAIN FILE WINS IF BOTH EXIST (I.E. A RUN WAS RESTARTED AFTER ARCHIVING)
+SUFFIXES = ('','.gz','.xz','.bz2')
+
+#===========================    FILE FUNCTIONS   ===========================================
+def locate(path):
+    """ Return @path if it exists, else the first compressed sibling that does (i.e.
+        path+'.gz'). If none exist @path is returned unchanged so opening it raises the
+        usual IOError."""
+    for suffix in SUFFIXES:
+        if os.path.exists(path+suffix):
+            return path+suffix
+    return path
+
+def exists(path):
+    #TRUE IF THE FILE OR ONE OF ITS COMPRESSED SIBLINGS EXISTS
+    return os.path.exists(locate(path))
+
+def compressed(path):
+    #TRUE IF THE (LOCATED) PATH ENDS IN ONE OF THE COMPRESSED SUFFIXES
+    return os.path.splitext(path)[1] in SUFFIXES[1:]
+
+def open_file(path,mode='r'):
+    """ Open @path for reading. The path is located first, so the plain name of an archived
+        file may be given. Compressed files return a file object which decompresses as it
+        is read - readline, iteration and read all work as for a plain file."""
+    path = locate(path)
+    suffix = os.path.splitext(path)[1]
+    if suffix=='.gz':
+        return gzip.open(path,'rb')
+    elif suffix=='.bz2':
+        return bz2.BZ2File(path,'rb')
+    elif suffix=='.xz':
+        if lzma is None:
+            raise IOError('reading '+path+' needs the lzma module (backports.lzma on python 2)')
+        return lzma.open(path,'rb')
+    return open(path,mode)
@@ -75,14 +75,44 @@ class HTP:
             status = system.runJob(self._cifs[j],finalprefix,self.keyphrase)
         return
     
-    def logfile(self,jobtype,numrun,numconverge,numresub,iteration):
+    def logfile(self,jobtype,numrun,numconverge,numresub,iteration,progress=None):
         """ Create a logfile (log.txt) for a given job type. Implemented in methods listed below.
+            @progress is an optional list of per-compound lines (see ionicProgress) written
+            below the iteration summary.
         """
         logfile=open(self.main_dir+'log.txt','a')
         titlestr = '=========================  '+jobtype+' ITERATION '+str("{0:.2f}".format(iteration))+' HRS  ======================='
-        logfile.write(titlestr+'\n'+' Number Submitted: '+str(numresub)+'\n Number Running: '+str(numrun)+'\n Number Converged: '+str(numconverge)+'\n \n')
+        logfile.write(titlestr+'\n'+' Number Submitted: '+str(numresub)+'\n Number Running: '+str(numrun)+'\n Number Converged: '+str(numconverge)+'\n')
+        if progress:
+            for line in progress:
+                logfile.write(' '+line+'\n')
+        logfile.write(' \n')
         logfile.close()
         return
+    
+    def ionicProgress(self,finalprefix,cifname):
+        """ Summarize the ionic progress of a job (@cifname+@finalprefix) as one line - the number
+            of completed ionic steps, the last free energy and the largest force. The OUTCAR is 
+            streamed one ionic step at a time (see VASPread.outcar.ionicsteps), so this is safe
+            on large or still running relaxations.
+            
+            This method is used in convergeAll for resubmitted jobs.
+        """
+        rundir = self.main_dir+cifname+'/'+finalprefix+'/'
+        last = None
+        try:
+            for record in VASPread.outcar(rundir).ionicsteps():
+                last = record
+        except (IOError,IndexError):
+            #NO OUTCAR (JOB DID NOT RUN) - PARSE ERRORS ARE RAISED
+            pass
+        if last is None:
+            return cifname+': no completed ionic steps'
+        progress = cifname+': '+str(last['step'])+' ionic steps, TOTEN = '+str(last['energy'])+' eV'
+        if last['forces'] is not None:
+            maxforce = np.sqrt((last['forces']**2).sum(axis=1)).max()
+            progress += ', max force = '+str("{0:.4f}".format(maxforce))+' eV/Angst'
+        return progress
             
     def convergeAll(self,tempprefix,finalprefix,interval):
         """ This method is used for relaxation runs - which may take a few iterations to converge. 
@@ -112,6 +142,7 @@ class HTP:
             numrun = 0
             numconverge = 0
             numresub = 0
+            progress = []
             
             #READ LIST OF JOBS FOR THAT PARTITION
             output = os.popen('squeue -p '+partition+' -u jtutmah1@jhu.edu').readlines()
@@ -147,6 +178,7 @@ class HTP:
                         else:
                             os.system('echo resubmitting')                            
                             numresub += 1
+                            progress.append(self.ionicProgress(finalprefix,self._cifs[i]))
                         
                     else:
                         numrun += 1
@@ -160,7 +192,7 @@ class HTP:
             
             #TIME IN MINUTES FOR LOG FILE
             iteration = t/3600.0
-            self.logfile(finalprefix,numrun,numconverge,numresub,iteration)
+            self.logfile(finalprefix,numrun,numconverge,numresub,iteration,progress)
             
             #IF ALL CIFS ARE CONVERGED
             if numconverge==self.number() and not counter==1:
@@ -308,11 +340,10 @@ class STP:
         
         #ITERATE THROUGH PREVIOUSLY RUN JOBS
         if not len(name) == 0 and not keyphrase==False:            
-            num_vec = []
+            num_vec = np.zeros(len(name))
             for k in range(len(name)):
                 name2 = name[k]
-                num = int(name2[-11:-4])
-                num_vec = np.append(num_vec,num)
+                num_vec[k] = int(name2[-11:-4])
                 
             #FIND MOST RECENT STD OUT FILE
             m = max(num_vec)
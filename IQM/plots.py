@@ -228,54 +228,41 @@ def elebandplot(ymat,reclat,kpoints,fermilevel,kpt_spec,labels,dir_save):
 	return
 
 #=============================  SUMMARIZE BAND CHARACTERS  =======================================
-def summarize_characters(characters):
+def summarize_characters(characters,dtype=None):
+    """ Collapse orbital characters (nchan x nkpts x nbands x norbitals) into s, p, d (and f)
+        weights per k-point and band, normalized to their total. Computed with whole-array
+        operations in @dtype (the dtype of @characters if None), so float32/float16 characters
+        are never promoted to float64."""
     #DETERMINE DIMENSIONS OF CHARACTER ARRAY
+    if dtype is None:
+        dtype = characters.dtype
     spin_length = characters.shape[0]
     kpt_length = characters.shape[1]
     band_length = characters.shape[2]
     char_length = characters.shape[3]
     
-    #SET DIMENSIONS OF INTERNAL ARRAY
-    spin_array = np.zeros((kpt_length,band_length,char_length))
-    
     #COMBINE SPIN DATA
     if spin_length==2:
-	   for i in range(spin_length):
-	       spin_array += characters[i,:,:,:]**2
-	       spin_array = np.sqrt(spin_array)
+        spin_array = np.zeros((kpt_length,band_length,char_length),dtype=dtype)
+        for i in range(spin_length):
+            spin_array = np.sqrt(spin_array+characters[i,:,:,:].astype(dtype)**2)
     else:
-	   spin_array = characters[0,:,:,:]
+        spin_array = characters[0,:,:,:].astype(dtype,copy=False)
     
-    #SUMMARIZE CHARACTERS
-    out_array = np.zeros((kpt_length,band_length,4))
+    #SUMMARIZE CHARACTERS - S, P, D AND F SUMS OF SQUARES
     if char_length==9:
-	for i in range(kpt_length):
-	    for j in range(band_length):
-		  tot = (spin_array[i,j,0]**2+sum(spin_array[i,j,1:3]**2)+sum(spin_array[i,j,4:]**2))
-		  out_array[i,j,0]=spin_array[i,j,0]**2
-		  out_array[i,j,1]=(sum(spin_array[i,j,1:3]**2))
-		  out_array[i,j,2]=(sum(spin_array[i,j,4:]**2))
-		  if tot !=0:
-		    out_array[i,j,0]=out_array[i,j,0]/tot
-		    out_array[i,j,1]=out_array[i,j,1]/tot
-		    out_array[i,j,2]=out_array[i,j,2]/tot
-		
+        groups = [slice(0,1),slice(1,3),slice(4,None)]
     elif char_length==16:
-	for i in range(kpt_length):
-	    for j in range(band_length):
-		  tot = (spin_array[i,j,0]**2+sum(spin_array[i,j,1:3]**2)+sum(spin_array[i,j,4:9]**2)+sum(spin_array[i,j,10:]**2))
-		  out_array[i,j,0] = spin_array[i,j,0]**2
-		  out_array[i,j,1] = (sum(spin_array[i,j,1:3]**2))
-		  out_array[i,j,2] = (sum(spin_array[i,j,4:9]**2))
-		  out_array[i,j,3] = (sum(spin_array[i,j,10:]**2))
-		  if tot!=0:
-		      out_array[i,j,0]=out_array[i,j,0]/tot
-		      out_array[i,j,1]=out_array[i,j,1]/tot
-		      out_array[i,j,2]=out_array[i,j,2]/tot
-		      out_array[i,j,3]=out_array[i,j,3]/tot
-		
+        groups = [slice(0,1),slice(1,3),slice(4,9),slice(10,None)]
     else: #LENGTH ALREADY EQUALS 4
-	out_array = spin_array
+        return spin_array
+    square = spin_array**2
+    out_array = np.zeros((kpt_length,band_length,4),dtype=dtype)
+    for i in range(len(groups)):
+        out_array[:,:,i] = square[:,:,groups[i]].sum(axis=2)
+    tot = out_array.sum(axis=2)
+    nonzero = tot!=0
+    out_array[nonzero] /= tot[nonzero][:,np.newaxis]
     
     return out_array
 
@@ -0,0 +1,138 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+###################################################################################################
+
+""" Time the VASPread and PHONOPYread parsers against the original line-by-line loops they 
+    replaced. Run from a compound directory (EIGENVAL is read from the STATIC folder, band.yaml,
+    qpoints.yaml and total_dos.dat from the DFPT folder) or pass a run directory holding any of
+    these files as the first argument. Both implementations are checked to agree before the 
+    timings are printed. The .iqmcache folder is not used, so every call parses the raw files.
+"""
+
+#=================  MODULES  ========================
+import os
+import sys
+import time
+import numpy as np
+import yaml
+import IQM.cache as cache
+import IQM.VASPread as VASPread
+import IQM.PHONOPYread as PHONOPYread
+import utils.inputs as inputs
+
+#=================  LEGACY LOOPS  ===================
+def loop_eigenval(dir_eig,spinpol):
+    """ Original EIGENVAL reader - splits each k-point block and converts one band at a time."""
+    eigenstr = open(dir_eig+'EIGENVAL','r')
+    blocks = eigenstr.read().split('\n \n')
+    eigenstr.close()
+    nbands = int(blocks[0].split('\n')[5].split()[2])
+    blocks = blocks[1:]
+    kpts = np.zeros([3,len(blocks)])
+    for i in range(len(blocks)):
+        kpts_str = blocks[i].split('\n')[0].split()
+        kpts[:,i] = [float(kpts_str[0]),float(kpts_str[1]),float(kpts_str[2])]
+    nspin = 2 if spinpol else 1
+    energy_array = np.zeros((nspin,len(blocks),nbands))
+    for i in range(len(blocks)):
+        e_str = blocks[i].split('\n')[1:]
+        for j in range(nbands):
+            energies = e_str[j].split()
+            for s in range(nspin):
+                energy_array[s,i,j] = float(energies[1+s])
+    return kpts,energy_array
+
+def loop_phonopy(filename):
+    """ Original band.yaml/qpoints.yaml reader - loads the full yaml tree and fills the 
+        q-positions and energies (nqpts x nbands) with nested loops over its dictionaries."""
+    phonon = yaml.load(open(filename),Loader=yaml.Loader)
+    qfile = np.zeros((3,len(phonon["phonon"])))
+    for i in range(len(phonon["phonon"])):
+        qfile[:,i] = phonon["phonon"][i]["q-position"]
+    bandfile = np.zeros((len(phonon["phonon"]),len(phonon["phonon"][0]["band"])))
+    for i in range(len(phonon["phonon"])):
+        for j in range(len(phonon["phonon"][0]["band"])):
+            bandfile[i,j] = phonon["phonon"][i]["band"][j]["frequency"]
+    hbar = 0.004135 #eV/THz
+    return qfile,hbar*bandfile
+
+def loop_mesh(dir_dos):
+    """ Original total_dos.dat reader - grows both columns with np.append line by line."""
+    dosstr = open(dir_dos+'total_dos.dat','r')
+    dosstr2 = dosstr.read().split('\n')[1:]
+    dosstr.close()
+    energy = []
+    dos = []
+    for i in range(len(dosstr2)-1):
+        energy = np.append(energy,float(dosstr2[i].split()[0]))
+        dos = np.append(dos,float(dosstr2[i].split()[1]))
+    return energy,dos
+
+#=================  TIMING  =========================
+def timeit(function,*args):
+    """ Return the best wall time of three calls along with the last result."""
+    best = None
+    for i in range(3):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time()-start
+        if best is None or elapsed<best:
+            best = elapsed
+    return best,result
+
+def bulk_eigenval(dir_eig,spinpol):
+    eigenfile = VASPread.eigenval(dir_eig,SpinPol=spinpol,SOC=False)
+    return eigenfile.kpoints(),eigenfile.energy()
+
+def bulk_bands(dir_phon):
+    bandfile = PHONOPYread.bands(dir_phon)
+    return bandfile.qpoints(),bandfile.bands().T
+
+def bulk_qpoints(dir_phon):
+    qfile = PHONOPYread.qpoints(dir_phon)
+    return qfile.kpoints(),qfile.bands()
+
+def bulk_mesh(dir_dos):
+    return PHONOPYread.mesh(dir_dos).dos()
+
+def report(name,t_loop,t_bulk):
+    sys.stdout.write('%-12s loop %9.4f s   bulk %9.4f s   speedup %7.1fx\n' % (name,t_loop,t_bulk,t_loop/max(t_bulk,1e-9)))
+
+#=================  MAIN  ===========================
+if __name__=='__main__':
+    if len(sys.argv)>1:
+        dir_ele = os.path.join(sys.argv[1],'')
+        dir_phon = dir_ele
+    else:
+        dir_ele = inputs.get_current_directory()+'STATIC/'
+        dir_phon = inputs.get_current_directory()+'DFPT/'
+    cache.ENABLED = False
+    
+    if os.path.exists(dir_ele+'EIGENVAL'):
+        #SPIN LAYOUT FROM THE EIGENVAL HEADER
+        spinpol = VASPread.eigenval(dir_ele).spinpol
+        t_loop,(k_loop,e_loop) = timeit(loop_eigenval,dir_ele,spinpol)
+        t_bulk,(k_bulk,e_bulk) = timeit(bulk_eigenval,dir_ele,spinpol)
+        if not (np.allclose(k_loop,k_bulk) and np.allclose(e_loop,e_bulk)):
+            raise ValueError('EIGENVAL parsers disagree in '+dir_ele)
+        report('EIGENVAL',t_loop,t_bulk)
+
+    for name,bulk in (('band.yaml',bulk_bands),('qpoints.yaml',bulk_qpoints)):
+        if os.path.exists(dir_phon+name):
+            t_loop,(q_loop,f_loop) = timeit(loop_phonopy,dir_phon+name)
+            t_bulk,(q_bulk,f_bulk) = timeit(bulk,dir_phon)
+            if not (np.allclose(q_loop,q_bulk) and np.allclose(f_loop,f_bulk)):
+                raise ValueError(name+' parsers disagree in '+dir_phon)
+            report(name,t_loop,t_bulk)
+
+    if os.path.exists(dir_phon+'total_dos.dat'):
+        t_loop,(x_loop,y_loop) = timeit(loop_mesh,dir_phon)
+        t_bulk,(x_bulk,y_bulk) = timeit(bulk_mesh,dir_phon)
+        if not (np.allclose(x_loop,x_bulk) and np.allclose(y_loop,y_bulk)):
+            raise ValueError('total_dos.dat parsers disagree in '+dir_phon)
+        report('total_dos',t_loop,t_bulk)
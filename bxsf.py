@@ -14,7 +14,12 @@ import os
 import numpy as np
 import glob
 import IQM.VASPread as VASPread
+import IQM.fileio as fileio
+from IQM.calculation import Calculation
+import IQM.export as export
 import utils.inputs as inputs
+import utils.symmetry as symmetry
+import utils.interpolate as interpolate
 
 #=================  Directories  ====================
 #RETURN CURRENT / PARENT DIRECTORY
@@ -23,66 +28,42 @@ dir1 = inputs.get_current_directory()
 # !!!!!!!!!! SET THIS VALUE !!!!!!!!!!!!!!!!!!!!!!!
 dir_ele = dir1+'STATIC/'
 
-#INCAR FILE FOR SOC AND SPINPOL
-incarfile = VASPread.incar(dir_ele)
-spinpol=incarfile.spin()
-soc=incarfile.soc()
+# !!!!!!!!!! SET THIS VALUE - FOURIER UPSAMPLING OF THE K-MESH (1 = RAW DFT MESH) !!!!!!!!!!
+upsample = 1
 
-#INITIATE EIGENVAL AND OUTCAR FILES
-eigenvalfile = VASPread.eigenval(dir_ele,SpinPol=spinpol,SOC=soc)
+# !!!!!!!!!! SET THIS VALUE - ONLY WRITE THE BANDS WHICH CROSS THE FERMI LEVEL !!!!!!!!!!!!!!!!
+crossing = False
+
+#INITIATE EIGENVAL AND OUTCAR FILES - SPIN LAYOUT IS READ FROM THE EIGENVAL HEADER
+eigenvalfile = VASPread.eigenval(dir_ele)
 outfile = VASPread.outcar(dir_ele)
 
 #PULL RELEVANT DATA USING VASPread
 kpoints = eigenvalfile.kpoints()
-nband = eigenvalfile.nband()
 
 reclat = outfile.reclatvec()
 name = outfile.compound()
-nkpts = outfile.nkpts()
 fermilevel = outfile.fermilevel()
 
-#DETERMINE KPT GRID FROM NKPTS
-singlek = int(round(nkpts**(1./3)))
-ksamp = [singlek,singlek,singlek]
+#MESH SUBDIVISIONS FROM AN AUTOMATIC KPOINTS FILE - ELSE MESHGRID FINDS THEM FROM THE COORDINATES
+ksamp = None
+if fileio.exists(dir_ele+'KPOINTS'):
+    ksamp = VASPread.kpoints(dir_ele).nsample()
 
 #GET BAND ENERGIES
 energies = eigenvalfile.energy()
 
 #REFORMAT ENERGIES AND GENERATE KMESH
+#NON SPIN RESULTS (AND THE MESH OF A FULL, GRID ORDERED RUN) SHARE MEMORY WITH THE ENERGY ARRAY
+#FROM VASPread - SHIFT ON A COPY (I.E. energymat-fermilevel), NEVER IN PLACE
 new_energy = inputs.reformat_energy(energies)
-kmat,energymat = inputs.meshgrid(kpoints,new_energy)
-
-#GENERATE BXSF FILE
-if os.path.exists(dir1+name+'.bxsf'):
-    os.remove(dir1+name+'.bxsf')
-
-#GENERATE BXSF HEADER    
-bxsf = open(name+'.bxsf', mode='a')
-bxsf.write('BEGIN_INFO \n  #Created by Jake Tutmaher and Guy Marcus\n  #Not for outside distribution\n')
-bxsf.write('  Fermi_Energy: '+str(fermilevel)+'\n')
-bxsf.write('END_INFO\n\nBEGIN_BLOCK_BANDGRID_3D\n  Pointless_Line\n  BEGIN_BANDGRID_3D\n')
-bxsf.write('    '+str(nband)+'\n')
-bxsf.write('    '+str(ksamp[0])+' '+str(ksamp[1])+' '+str(ksamp[2])+'\n    0.0 0.0 0.0\n')
-bxsf.write('    '+str(reclat[0,0])+' '+str(reclat[0,1])+' '+str(reclat[0,2])+'\n')
-bxsf.write('    '+str(reclat[1,0])+' '+str(reclat[1,1])+' '+str(reclat[1,2])+'\n')
-bxsf.write('    '+str(reclat[2,0])+' '+str(reclat[2,1])+' '+str(reclat[2,2])+'\n')
+#IRREDUCIBLE KPOINTS (ISYM NOT 0) ARE UNFOLDED TO THE FULL MESH WITH THE POINT GROUP OF THE POSCAR
+#(SPLIT BY MAGMOM FOR SPIN POLARIZED RUNS, WITHOUT TIME REVERSAL FOR SOC RUNS)
+run = Calculation(dir_ele)
+kpoints,new_energy = symmetry.unfold(dir_ele,new_energy,kpoints,eigenvalfile.weights(),ksamp,run.spinpol,run.soc)
+kmat,energymat = inputs.meshgrid(kpoints,new_energy,ksamp=ksamp)
+if upsample!=1:
+    kmat,energymat = interpolate.fourier(kmat,energymat,upsample)
 
-#GENERATE ENERGIES IN ROW MAJOR
-for n in range(nband):
-    bxsf.write('\n  BAND: '+str(n+1)+'\n')
-    for m in range(ksamp[0]):
-        for p in range(ksamp[1]):
-            for q in range(ksamp[2]):
-                if abs(energymat[q,p,m,n])<10:
-                    energy2 = format(energymat[m,p,q,n],'.5f')
-                else:
-                    energy2 = format(energymat[m,p,q,n],'.4f')
-                bxsf.write('    '+str(energy2))
-            bxsf.write('\n')
-        if m==(ksamp[0]-1):
-            continue
-        else:
-            bxsf.write('\n\n')
-bxsf.write('  END_BANDGRID_3D\n')
-bxsf.write('END_BLOCK_BANDGRID_3D')
-bxsf.close()
+#WRITE BXSF FILE
+export.write_bxsf(dir1+name+'.bxsf',energymat,reclat,fermilevel,crossing=crossing)
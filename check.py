@@ -56,9 +56,9 @@ def check(dir_main,prefix,keyphrase,subdir_length,subdir):
         directory containing these jobs, @prefix is the specific run type (i.e. relax, static,
         dfpt) and keyphrase is the std out keyphrase to find."""
     
-    #CLEAR ARRAYS    
-    Entries=[]
-    Number = [] 
+    #PREALLOCATE ARRAYS - ONE ENTRY PER SUBDIRECTORY
+    Entries = np.empty(subdir_length,dtype=object)
+    Number = np.zeros(subdir_length)
     
     #ITERATE THROUGH ALL SUBDIRECTORIES
     for j in range(subdir_length):
@@ -77,14 +77,13 @@ def check(dir_main,prefix,keyphrase,subdir_length,subdir):
             
             #IF THERE ARE SLURM FILES, LOOP THROUGH AND SEARCH FOR KEYWORD
             if len(name)!=0:
-                Number = np.append(Number,len(name))
-                num_vec = []
+                Number[j] = len(name)
+                num_vec = np.zeros(len(name))
                 
                 #PULL ID NUMBER FOR ALL .OUT FILES CONTAINED IN DIRECTORY
                 for k in range(len(name)):
                     name2 = name[k]
-                    num = int(name2[-11:-4])
-                    num_vec = np.append(num_vec,num)
+                    num_vec[k] = int(name2[-11:-4])
                     
                 #FIND .OUT FILE WITH MAX NUMBER (MOST RECENT NUMBER) AND READ AS STRING
                 m = max(num_vec)
@@ -94,16 +93,14 @@ def check(dir_main,prefix,keyphrase,subdir_length,subdir):
                 
                 #IF KEYPHRASE EXISTS FROM GREP - THEN IT HAS CONVERGED
                 if string:
-                    Entries=np.append(Entries,' Y ')
+                    Entries[j] = ' Y '
                 else:
-                    Entries=np.append(Entries,' N ')
+                    Entries[j] = ' N '
         #OUTPUT FILES NOT FOUND            
             else:
-                Entries=np.append(Entries,' DNR ')
-                Number=np.append(Number,0)
+                Entries[j] = ' DNR '
         else:
-            Entries=np.append(Entries,'DNR')
-            Number=np.append(Number,0)
+            Entries[j] = 'DNR'
             
     return Entries,Number
 
@@ -114,9 +111,9 @@ def check(dir_main,prefix,keyphrase,subdir_length,subdir):
 [Entries3,Number3] = check(maindir,'DFPT',strallow3,length,names)
 
 #=====================================  READ TIME  =============================================
-timerex = []
-timestat = []
-timedfpt = []
+timerex = np.empty(length,dtype=object)
+timestat = np.empty(length,dtype=object)
+timedfpt = np.empty(length,dtype=object)
 
 for k in range(length):
     
@@ -143,14 +140,14 @@ for k in range(length):
         dfpt_time = 'DNR'
     
     #APPEND RELAX, STATIC, AND DFPT TIME TO ARRAY
-    timerex = np.append(timerex,rex_time)
-    timestat = np.append(timestat,stat_time)
-    timedfpt = np.append(timedfpt,dfpt_time)
+    timerex[k] = rex_time
+    timestat[k] = stat_time
+    timedfpt[k] = dfpt_time
 
 #=================================  READ VALENCE  ===========================================
-rex_valence = []
-stat_valence = []
-dfpt_valence = []
+rex_valence = np.empty(length,dtype=object)
+stat_valence = np.empty(length,dtype=object)
+dfpt_valence = np.empty(length,dtype=object)
 
 for l in range(length):
     #DEFINE RELAX, STATIC, AND DFPT DIRECTORIES
@@ -176,9 +173,9 @@ for l in range(length):
         dfpt_nvalence = 'DNR'   
     
     #WRITE NVALENCE TO ARRAY
-    rex_valence = np.append(rex_valence,rex_nvalence)
-    stat_valence = np.append(stat_valence,stat_nvalence)
-    dfpt_valence = np.append(dfpt_valence,dfpt_nvalence)
+    rex_valence[l] = rex_nvalence
+    stat_valence[l] = stat_nvalence
+    dfpt_valence[l] = dfpt_nvalence
     
 #======================   READ AND PRINT SUMMARY   ================================
 #DEFINE DICTIONARY ENTRIES
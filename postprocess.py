@@ -15,9 +15,12 @@
 
 from IQM import VASPread
 from IQM import PHONOPYread
+from IQM import fileio
+from IQM.calculation import Calculation
 from IQM import plots
 import numpy as np
 import os
+import multiprocessing
 #import IQM.vasp as vasp
 
 #=================================  DIRECTORY  ===========================================
@@ -50,44 +53,45 @@ if not os.path.exists(dir1+'/PostProcess/') and not counter>1:
 dir_save = dir1+'/PostProcess/'
 summary=open(dir_save+"/Summary.txt",'w')
 
+#START THE PHONON DOS NOW - IF PHONOPY HAS TO RUN IT WORKS WHILE THE ELECTRONIC PLOTS ARE MADE
+if os.path.exists(dir_phon):
+	meshfile = PHONOPYread.mesh(dir_phon,background=True)
+
 #=================================  ELECTRONIC ===========================================
 
 if os.path.exists(dir_ele):
 	
 	#INITIAL CONDITIONS FOR PLOTTING ENVIRONMENT
-	if os.path.exists(dir_ele+'PROCAR') and os.path.exists(dir_eledos+'PROCAR'):
+	if fileio.exists(dir_ele+'PROCAR') and fileio.exists(dir_eledos+'PROCAR'):
 		procar=True
 	else:
 		procar=False
 	
-	incarfile = VASPread.incar(dir_eledos)
-	spinpol=incarfile.spin()
-	soc=incarfile.soc()
-	
-	#INITIALIZE FILES
-	outfile = VASPread.outcar(dir_ele)
-	eigenfile = VASPread.eigenval(dir_ele,SpinPol=spinpol,SOC=soc)
-	kfile = VASPread.kpoints(dir_ele)
-	dosfile = VASPread.doscar(dir_eledos,SpinPol=spinpol,SOC=soc)
+	#INITIALIZE RUNS - FILES ARE ONLY READ WHEN A VALUE IS FIRST USED
+	#SPIN AND SOC LAYOUTS ARE READ FROM THE HEADER OF EACH FILE
+	#PROCAR FILES ARE PARSED ON ALL CORES OF THE NODE
+	nproc = multiprocessing.cpu_count()
+	static = Calculation(dir_eledos,nproc=nproc)
+	path = Calculation(dir_ele,nproc=nproc)
 	
 	#DIRECT AND RECIPROCAL LATTICE INFORMATION	
-	kpoints = eigenfile.kpoints()
-	dirlat = outfile.dirlatvec()
-	reclat = outfile.reclatvec()
+	kpoints = path.kpts
+	dirlat = path.dirlat
+	reclat = path.reclat
 	
 	#FERMI LEVEL
-	fermilevel=outfile.fermilevel()
+	fermilevel=path.fermilevel
 	
 	#ENERGIES
-	energies = eigenfile.energy()
+	energies = path.energies
 	
 	#BAND PATH LABELS
-	kspec = kfile.kpath()
-	labels = kfile.labels()
+	kspec = path.kpath
+	labels = path.klabels
 	
 	#DOS
-	dosx = dosfile.energy()
-	dosy = dosfile.dos()
+	dosx = static.dos_energy
+	dosy = static.dos
 
 	#ELECTRONIC PLOTS
 	if len(kpoints[0,:])==len(energies[0,:,0]):
@@ -102,11 +106,10 @@ if os.path.exists(dir_ele):
 			print "PARSING DOSCAR AND PROCAR FILE"
 			
 			#ORBITAL INFORMATION
-			profile = VASPread.procar(dir_ele,SpinPol=spinpol,SOC=soc)
-			oenergy,odos = dosfile.odos()
-			kpoints_orbital = profile.kpoints()
-			energies_orbital = profile.energies()
-			characters = profile.character()
+			oenergy,odos = static.odos
+			kpoints_orbital = path.orbital_kpts
+			energies_orbital = path.orbital_energies
+			characters = path.characters
 			
 			#ORBITAL PLOTS
 			plots.orbital_dosplot(oenergy,odos,dosy,fermilevel,dir_save)
@@ -134,8 +137,7 @@ if os.path.exists(dir_phon):
 	qpoints = phonfile.qpoints()
 	#labels=['T','T','T','T','T','T','T']
 
-	#DOS
-	meshfile = PHONOPYread.mesh(dir_phon)
+	#DOS - WAITS FOR THE BACKGROUND PHONOPY RUN IF ONE WAS STARTED
 	qdosx,qdosy = meshfile.dos()
 	#phondosx, phondosy = vasp.phondos(dir_phon)
 	
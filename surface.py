@@ -13,7 +13,11 @@
 import os
 import numpy as np
 import utils.inputs as inputs
+import utils.symmetry as symmetry
+import utils.interpolate as interpolate
 import IQM.VASPread as VASPread
+import IQM.fileio as fileio
+from IQM.calculation import Calculation
 
 #GET CURRENT DIRECTORY
 dir1 = inputs.get_current_directory()
@@ -21,23 +25,34 @@ dir1 = inputs.get_current_directory()
 # !!!!!!!!!! SET THIS VALUE !!!!!!!!!!!!!!!!!!!!!!!
 dir_ele = dir1+'STATIC/'
 
-#INCAR FILE FOR SOC AND SPINPOL
-incarfile = VASPread.incar(dir_ele)
-spinpol=incarfile.spin()
-soc=incarfile.soc()
+# !!!!!!!!!! SET THIS VALUE - FOURIER UPSAMPLING OF THE K-MESH (1 = RAW DFT MESH) !!!!!!!!!!
+upsample = 1
 
-#INITIATE RELEVANT OUTPUT FILES
+#INITIATE RELEVANT OUTPUT FILES - SPIN LAYOUT IS READ FROM THE EIGENVAL HEADER
 outfile = VASPread.outcar(dir_ele)
-eigenfile = VASPread.eigenval(dir_ele,SpinPol=spinpol,SOC=soc)
+eigenfile = VASPread.eigenval(dir_ele)
 
 #GET DATA USING VASPREAD
 energy = eigenfile.energy()
 kpts = eigenfile.kpoints()
 fermilevel = outfile.fermilevel()
 
+#MESH SUBDIVISIONS FROM AN AUTOMATIC KPOINTS FILE - ELSE MESHGRID FINDS THEM FROM THE COORDINATES
+ksamp = None
+if fileio.exists(dir_ele+'KPOINTS'):
+    ksamp = VASPread.kpoints(dir_ele).nsample()
+
 #REFORMAT DATA
+#NON SPIN RESULTS (AND THE MESH OF A FULL, GRID ORDERED RUN) SHARE MEMORY WITH THE ENERGY ARRAY
+#FROM VASPread - SHIFT ON A COPY (I.E. energymat-fermilevel), NEVER IN PLACE
 new_energy = inputs.reformat_energy(energy)
-kmat,final_energy = inputs.meshgrid(kpts,new_energy)
+#IRREDUCIBLE KPOINTS (ISYM NOT 0) ARE UNFOLDED TO THE FULL MESH WITH THE POINT GROUP OF THE POSCAR
+#(SPLIT BY MAGMOM FOR SPIN POLARIZED RUNS, WITHOUT TIME REVERSAL FOR SOC RUNS)
+run = Calculation(dir_ele)
+kpts,new_energy = symmetry.unfold(dir_ele,new_energy,kpts,eigenfile.weights(),ksamp,run.spinpol,run.soc)
+kmat,final_energy = inputs.meshgrid(kpts,new_energy,ksamp=ksamp)
+if upsample!=1:
+    kmat,final_energy = interpolate.fourier(kmat,final_energy,upsample)
 
 #SAVE
 np.savez(dir1+"surface.npz",kpoints=kmat,energy=final_energy,fermilevel=fermilevel)
\ No newline at end of file
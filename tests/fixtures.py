@@ -0,0 +1,186 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Tiny VASP and PHONOPY output files for the tests. Every writer takes a directory (with a
+ trailing slash) and the arrays to write, and lays them out as VASP or phonopy does - so the
+ tests compare what the readers return against the arrays which went in.
+
+ ---
+
+ eigenval: EIGENVAL for nspin x nkpts x nbands energies (and occupations).
+ procar:   PROCAR for non-spin, spin polarized or SOC characters (the 'tot' row of each ion block).
+ doscar:   DOSCAR with a total DOS and one projected block per atom.
+ vasprun:  vasprun.xml with two ionic steps - only the last one carries the DOS and projections.
+ meshyaml: phonopy mesh.yaml with weighted q-points and frequencies.
+ totaldos: phonopy total_dos.dat.
+ gzipped:  compress a file in place (OUTCAR -> OUTCAR.gz), as archived runs are kept.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import os
+import gzip
+
+LABELS = ['s','py','pz','px','dxy','dyz','dz2','dxz','x2-y2']
+
+#===========================    VASP FILES   ===============================================
+def eigenval(d,kpoints,weights,energies,occupations=None):
+    #@kpoints IS 3 x NKPTS, @energies AND @occupations NSPIN x NKPTS x NBANDS
+    nspin,nkpts,nbands = energies.shape
+    f = open(d+'EIGENVAL','w')
+    f.write('    1    1    1    %d\n' % nspin)
+    f.write('  0.2700E+02  0.3000E-09  0.3000E-09  0.5000E-09  0.5000E-15\n  1.000000000000000E-004\n  CAR \n  fixture\n')
+    f.write('      8 %6d %6d' % (nkpts,nbands))
+    for k in range(nkpts):
+        f.write('\n\n  %.7E  %.7E  %.7E  %.7E\n' % (kpoints[0,k],kpoints[1,k],kpoints[2,k],weights[k]))
+        for b in range(nbands):
+            row = [energies[s,k,b] for s in range(nspin)]
+            if occupations is not None:
+                row += [occupations[s,k,b] for s in range(nspin)]
+            f.write('%5d ' % (b+1)+' '.join(['%14.8f' % v for v in row])+'\n')
+    f.close()
+
+def procar(d,kpoints,weights,energies,occupations,character):
+    """ @energies/@occupations are nspin x nkpts x nbands, @character is nchan x nkpts x nbands x
+        nions x 9 (rounded to 3 decimals) - nchan is nspin, or 4 (total, mx, my, mz) for SOC."""
+    nspin,nkpts,nbands = energies.shape
+    ncomp = character.shape[0]//nspin
+    nions = character.shape[3]
+    f = open(d+'PROCAR','w')
+    f.write('PROCAR lm decomposed\n')
+    for s in range(nspin):
+        f.write('# of k-points:  %d         # of bands:  %d         # of ions:   %d\n\n' % (nkpts,nbands,nions))
+        for k in range(nkpts):
+            f.write(' k-point %5d :    %11.8f%11.8f%11.8f     weight = %.8f\n\n' % ((k+1,)+tuple(kpoints[:,k])+(weights[k],)))
+            for b in range(nbands):
+                f.write('band %5d # energy %13.8f # occ. %11.8f\n\n' % (b+1,energies[s,k,b],occupations[s,k,b]))
+                f.write('ion '+' '.join(['%6s' % label for label in LABELS])+'    tot\n')
+                for c in range(ncomp):
+                    ions = character[s*ncomp+c,k,b]
+                    for i in range(nions):
+                        f.write('%5d ' % (i+1)+' '.join(['%6.3f' % v for v in ions[i]])+' %6.3f\n' % ions[i].sum())
+                    total = ions.sum(axis=0)
+                    f.write('tot   '+' '.join(['%6.3f' % v for v in total])+' %6.3f\n' % total.sum())
+                f.write('\n')
+            f.write('\n')
+    f.close()
+
+def doscar(d,energy,total,partial):
+    """ @energy is NEDOS, @total nspin x NEDOS and @partial natoms x nchan x NEDOS x norbitals. The
+        projected columns interleave the channels orbital by orbital, as VASP writes them."""
+    nspin = total.shape[0]
+    natoms,nchan,nedos,norb = partial.shape
+    f = open(d+'DOSCAR','w')
+    f.write('%4d%4d   1   0\n  0.2700E+02  0.3000E-09  0.3000E-09  0.5000E-09  0.5000E-15\n' % (natoms,natoms))
+    f.write('  1.0E-004\n  CAR \n fixture\n')
+    header = '  %14.8f  %14.8f %5d  %14.8f  %14.8f\n' % (energy[-1],energy[0],nedos,0.0,1.0)
+    f.write(header)
+    for i in range(nedos):
+        integrated = [0.0]*nspin
+        f.write('%11.3f ' % energy[i]+' '.join(['%11.4E' % v for v in list(total[:,i])+integrated])+'\n')
+    for a in range(natoms):
+        f.write(header)
+        for i in range(nedos):
+            values = [partial[a,c,i,o] for o in range(norb) for c in range(nchan)]
+            f.write('%11.3f ' % energy[i]+' '.join(['%11.4E' % v for v in values])+'\n')
+    f.close()
+
+def vasprun(d,kpoints,weights,energies,occupations,character,lattice,total,partial,efermi):
+    """ @character is nspin x nkpts x nbands x nions x 9, @total nspin x NEDOS x 3 (energy, DOS,
+        integrated DOS) and @partial nions x nspin x NEDOS x 10 (energy and 9 orbitals). A first
+        ionic step with shifted energies and a strained lattice precedes the final one."""
+    nspin,nkpts,nbands = energies.shape
+    nions = character.shape[3]
+    f = open(d+'vasprun.xml','w')
+    w = f.write
+    w('<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n <kpoints>\n')
+    w('  <varray name="kpointlist" >\n'+''.join(['   <v> %12.8f %12.8f %12.8f </v>\n' % tuple(k) for k in kpoints.T])+'  </varray>\n')
+    w('  <varray name="weights" >\n'+''.join(['   <v> %12.8f </v>\n' % v for v in weights])+'  </varray>\n </kpoints>\n')
+    def structure(name,basis):
+        w(' <structure name="%s" >\n  <crystal>\n   <varray name="basis" >\n' % name)
+        w(''.join(['    <v> %12.8f %12.8f %12.8f </v>\n' % tuple(row) for row in basis])+'   </varray>\n')
+        w('   <varray name="rec_basis" >\n'+''.join(['    <v> %12.8f %12.8f %12.8f </v>\n' % tuple(row) for row in np.linalg.inv(basis).T]))
+        w('   </varray>\n  </crystal>\n </structure>\n')
+    def eigenvalues(shift):
+        w('  <eigenvalues>\n   <array>\n    <field>eigene</field>\n    <field>occ</field>\n    <set>\n')
+        for s in range(nspin):
+            w('     <set comment="spin %d">\n' % (s+1))
+            for k in range(nkpts):
+                w('      <set comment="kpoint %d">\n' % (k+1))
+                w(''.join(['       <r> %10.4f %8.4f </r>\n' % (energies[s,k,b]+shift,occupations[s,k,b]) for b in range(nbands)]))
+                w('      </set>\n')
+            w('     </set>\n')
+        w('    </set>\n   </array>\n  </eigenvalues>\n')
+    #FIRST IONIC STEP - ITS SECTIONS MUST NOT LEAK INTO THE RESULT
+    w(' <calculation>\n')
+    structure('step',lattice*0.95)
+    eigenvalues(100.0)
+    w(' </calculation>\n <calculation>\n')
+    structure('step',lattice)
+    eigenvalues(0.0)
+    w('  <dos>\n   <i name="efermi"> %14.8f </i>\n   <total>\n    <array>\n     <set>\n' % efermi)
+    for s in range(nspin):
+        w('      <set comment="spin %d">\n' % (s+1)+''.join(['       <r> %10.4f %10.4f %10.4f </r>\n' % tuple(row) for row in total[s]])+'      </set>\n')
+    w('     </set>\n    </array>\n   </total>\n   <partial>\n    <array>\n     <field>energy</field>\n')
+    w(''.join(['     <field>%s</field>\n' % label for label in LABELS])+'     <set>\n')
+    for a in range(nions):
+        w('      <set comment="ion %d">\n' % (a+1))
+        for s in range(nspin):
+            w('       <set comment="spin %d">\n' % (s+1)+''.join(['        <r> '+' '.join(['%8.4f' % v for v in row])+' </r>\n' for row in partial[a,s]])+'       </set>\n')
+        w('      </set>\n')
+    w('     </set>\n    </array>\n   </partial>\n  </dos>\n  <projected>\n')
+    eigenvalues(0.0)
+    w('   <array>\n'+''.join(['    <field>%s</field>\n' % label for label in LABELS])+'    <set>\n')
+    for s in range(nspin):
+        w('     <set comment="spin%d">\n' % (s+1))
+        for k in range(nkpts):
+            w('      <set comment="kpoint %d">\n' % (k+1))
+            for b in range(nbands):
+                w('       <set comment="band %d">\n' % (b+1))
+                w(''.join(['        <r> '+' '.join(['%6.4f' % v for v in character[s,k,b,a]])+' </r>\n' for a in range(nions)]))
+                w('       </set>\n')
+            w('      </set>\n')
+        w('     </set>\n')
+    w('    </set>\n   </array>\n  </projected>\n </calculation>\n')
+    structure('finalpos',lattice)
+    w('</modeling>\n')
+    f.close()
+
+#===========================    PHONOPY FILES   ============================================
+def meshyaml(d,qpoints,weights,frequency):
+    #@qpoints IS NQPTS x 3, @frequency NQPTS x NBANDS (THz)
+    f = open(d+'mesh.yaml','w')
+    f.write('mesh: [ 2, 2, 2 ]\nnqpoint: %d\n' % len(qpoints))
+    f.write('reciprocal_lattice:\n- [ 0.3333333, 0.0000000, 0.0000000 ] # a*\n')
+    f.write('- [ 0.0000000, 0.3333333, 0.0000000 ] # b*\n- [ 0.0000000, 0.0000000, 0.2000000 ] # c*\n')
+    f.write('natom: %d\n' % (frequency.shape[1]//3))
+    f.write('phonon:\n')
+    for q in range(len(qpoints)):
+        f.write('- q-position: [ %12.7f, %12.7f, %12.7f ]\n  weight: %d\n  band:\n' % (tuple(qpoints[q])+(weights[q],)))
+        for b in range(frequency.shape[1]):
+            f.write('  - # %d\n    frequency: %15.10f\n' % (b+1,frequency[q,b]))
+        f.write('\n')
+    f.close()
+
+def totaldos(d,energy,dos):
+    f = open(d+'total_dos.dat','w')
+    f.write('# Sigma = 0.100000\n')
+    for i in range(len(energy)):
+        f.write('%20.10f%20.10f\n' % (energy[i],dos[i]))
+    f.close()
+
+#===========================    ARCHIVES   =================================================
+def gzipped(filename):
+    #REPLACE @filename BY filename.gz
+    f = gzip.open(filename+'.gz','wb')
+    f.write(open(filename,'rb').read())
+    f.close()
+    os.remove(filename)
@@ -0,0 +1,121 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Tests of the phonon DOS of PHONOPYread.mesh: which of total_dos.dat, the mesh.yaml histogram
+ and a phonopy run it takes, and that outputs left from older FORCE_CONSTANTS or mesh.conf are
+ not reused. A fake phonopy script on the PATH stands in for phonopy and logs every call.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+import IQM.PHONOPYread as PHONOPYread
+import fixtures
+
+#WRITES A TWO POINT total_dos.dat IN THE RUN DIRECTORY
+PHONOPY = '#!/bin/sh\necho "$@" >> phonopy.log\nprintf "# Sigma = 0.1\\n 1.0 2.0\\n 2.0 3.0\\n" > total_dos.dat\n'
+
+class MeshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()+'/'
+        self.bin = tempfile.mkdtemp()+'/'
+        f = open(self.bin+'phonopy','w')
+        f.write(PHONOPY)
+        f.close()
+        os.chmod(self.bin+'phonopy',0o755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin+os.pathsep+self.path
+        rng = np.random.RandomState(5)
+        self.frequency = np.round(rng.uniform(0,10,(4,6)),6)
+        self.weights = [1,3,3,1]
+        self.write('FORCE_CONSTANTS','fc1',100)
+        self.write('mesh.conf','MESH = 2 2 2\nSIGMA = 0.5\n',100)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir)
+        shutil.rmtree(self.bin)
+
+    def write(self,filename,text,stamp):
+        #WRITE A FILE WITH A GIVEN MODIFICATION TIME (SECONDS AFTER THE EPOCH)
+        f = open(self.dir+filename,'w')
+        f.write(text)
+        f.close()
+        os.utime(self.dir+filename,(stamp,stamp))
+
+    def meshyaml(self,stamp):
+        fixtures.meshyaml(self.dir,np.zeros((4,3)),self.weights,self.frequency)
+        os.utime(self.dir+'mesh.yaml',(stamp,stamp))
+
+    def runs(self):
+        #NUMBER OF PHONOPY CALLS SO FAR
+        if not os.path.exists(self.dir+'phonopy.log'):
+            return 0
+        return len(open(self.dir+'phonopy.log').readlines())
+
+    def test_histogram(self):
+        #A CURRENT mesh.yaml IS SMEARED IN-PROCESS WITHOUT RUNNING PHONOPY
+        self.meshyaml(200)
+        energy,dos = PHONOPYread.mesh(self.dir).dos()
+        reference = PHONOPYread.histogram_dos(self.frequency,self.weights,0.5)
+        np.testing.assert_allclose(energy,reference[0])
+        np.testing.assert_allclose(dos,reference[1])
+        self.assertEqual(self.runs(),0)
+        #THE DOS INTEGRATES TO THE NUMBER OF BRANCHES
+        self.assertAlmostEqual(dos.sum()*(energy[1]-energy[0]),6,places=2)
+
+    def test_total_dos(self):
+        #A CURRENT total_dos.dat IS READ AS IT IS
+        self.meshyaml(200)
+        fixtures.totaldos(self.dir,np.array([0.,1.,2.]),np.array([0.,0.5,0.25]))
+        os.utime(self.dir+'total_dos.dat',(200,200))
+        energy,dos = PHONOPYread.mesh(self.dir).dos()
+        np.testing.assert_allclose(dos,[0.,0.5,0.25])
+        self.assertEqual(self.runs(),0)
+
+    def test_older_output(self):
+        #A mesh.yaml OLDER THAN FORCE_CONSTANTS IS LEFT FROM A PREVIOUS RUN - PHONOPY IS RUN
+        self.meshyaml(50)
+        energy,dos = PHONOPYread.mesh(self.dir).dos()
+        np.testing.assert_allclose(dos,[2.,3.])
+        self.assertEqual(self.runs(),1)
+        #THE PHONOPY RESULT IS CACHED UNDER THE INPUTS
+        PHONOPYread.mesh(self.dir).dos()
+        self.assertEqual(self.runs(),1)
+
+    def test_changed_inputs(self):
+        """ New FORCE_CONSTANTS which keep an old modification time (i.e. copied with cp -p) leave
+            mesh.yaml looking current. The cached histogram records mesh.yaml as its source, so
+            it is known to be from the old inputs and phonopy is run."""
+        self.meshyaml(200)
+        self.assertEqual(str(PHONOPYread.mesh(self.dir)._data['method']),'histogram')
+        self.write('FORCE_CONSTANTS','fc2',100)
+        energy,dos = PHONOPYread.mesh(self.dir).dos()
+        np.testing.assert_allclose(dos,[2.,3.])
+        self.assertEqual(self.runs(),1)
+
+    def test_histogram_replaced(self):
+        #THE HISTOGRAM GIVES WAY TO PHONOPY'S OWN DOS AS SOON AS total_dos.dat IS WRITTEN
+        self.meshyaml(200)
+        PHONOPYread.mesh(self.dir).dos()
+        fixtures.totaldos(self.dir,np.array([0.,1.]),np.array([4.,5.]))
+        os.utime(self.dir+'total_dos.dat',(300,300))
+        energy,dos = PHONOPYread.mesh(self.dir).dos()
+        np.testing.assert_allclose(dos,[4.,5.])
+        self.assertEqual(str(PHONOPYread.mesh(self.dir)._data['method']),'phonopy')
+        self.assertEqual(self.runs(),0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Tests of the EIGENVAL, PROCAR, DOSCAR and vasprun.xml readers on tiny fixture files in the
+ non-spin, spin polarized and SOC layouts. Each reader is checked on the plain file, on a gzip
+ archive of it, for a subset of k-points and after a reload from the .iqmcache folder.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import IQM.VASPread as VASPread
+import IQM.cache as cache
+import fixtures
+
+#SPIN SETS AND CHARACTER CHANNELS OF EACH LAYOUT
+LAYOUTS = {'ns':(1,1),'sp':(2,2),'soc':(1,4)}
+
+class FixtureTest(unittest.TestCase):
+    #EVERY TEST WRITES ITS FILES TO A FRESH DIRECTORY
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()+'/'
+        self.rng = np.random.RandomState(7)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def bands(self,nspin,nkpts=5,nbands=4):
+        #K-POINTS, WEIGHTS, SORTED ENERGIES AND OCCUPATIONS
+        kpoints = np.round(self.rng.uniform(-0.5,0.5,(3,nkpts)),6)
+        weights = np.round(self.rng.uniform(0.1,1,nkpts),6)
+        energies = np.sort(np.round(self.rng.uniform(-5,5,(nspin,nkpts,nbands)),4),axis=2)
+        occupations = np.round(self.rng.uniform(0,1,(nspin,nkpts,nbands)),4)
+        return kpoints,weights,energies,occupations
+
+    def assertCached(self,filename,kind):
+        #THE RELOAD TRIAL READS THE ARRAYS SAVED BY THE FIRST ONE
+        self.assertTrue(cache.load(filename,kind) is not None,kind+' entry of '+filename+' was not saved')
+
+    def touch(self,filename):
+        #MOVE THE MODIFICATION TIME ON SO AN EDIT IS SEEN EVEN WITHIN THE MTIME RESOLUTION
+        stamp = time.time()+10
+        os.utime(filename,(stamp,stamp))
+
+#===========================    EIGENVAL   =================================================
+class EigenvalTest(FixtureTest):
+
+    def check(self,layout,compress=False):
+        nspin = LAYOUTS[layout][0]
+        kpoints,weights,energies,occupations = self.bands(nspin)
+        fixtures.eigenval(self.dir,kpoints,weights,energies,occupations)
+        if compress:
+            fixtures.gzipped(self.dir+'EIGENVAL')
+        for trial in ('parse','reload'):
+            eig = VASPread.eigenval(self.dir,SOC=layout=='soc')
+            self.assertEqual(eig.spinpol,layout=='sp')
+            #A SUBSET FIRST - READ THROUGH THE OFFSET INDEX BEFORE THE FULL PARSE, OR FROM THE CACHE
+            np.testing.assert_allclose(eig.energy(kpts=[3,1]),energies[:,[3,1]])
+            np.testing.assert_allclose(eig.kpoints(kpts=slice(1,3)),kpoints[:,1:3])
+            np.testing.assert_allclose(eig.kpoints(),kpoints)
+            np.testing.assert_allclose(eig.weights(),weights)
+            np.testing.assert_allclose(eig.energy(),energies)
+            np.testing.assert_allclose(eig.occupations(),occupations)
+            np.testing.assert_allclose(eig.energy(bands=[1,2]),energies[:,:,1:3])
+            self.assertCached(eig.filename,'eigenval')
+
+    def test_nonspin(self):
+        self.check('ns')
+
+    def test_spin(self):
+        self.check('sp')
+
+    def test_soc(self):
+        self.check('soc')
+
+    def test_gzip(self):
+        self.check('sp',compress=True)
+
+    def test_changed_file(self):
+        #A REWRITTEN FILE IS PARSED AGAIN RATHER THAN TAKEN FROM THE CACHE
+        kpoints,weights,energies,occupations = self.bands(1)
+        fixtures.eigenval(self.dir,kpoints,weights,energies,occupations)
+        VASPread.eigenval(self.dir).energy()
+        fixtures.eigenval(self.dir,kpoints,weights,energies+1,occupations)
+        self.touch(self.dir+'EIGENVAL')
+        np.testing.assert_allclose(VASPread.eigenval(self.dir).energy(),energies+1)
+        np.testing.assert_allclose(VASPread.eigenval(self.dir).energy(kpts=[2]),energies[:,[2]]+1)
+
+#===========================    PROCAR   ===================================================
+class ProcarTest(FixtureTest):
+
+    def write(self,layout,nions=2):
+        nspin,nchan = LAYOUTS[layout]
+        kpoints,weights,energies,occupations = self.bands(nspin)
+        character = np.round(self.rng.uniform(0,0.1,(nchan,)+energies.shape[1:]+(nions,9)),3)
+        fixtures.procar(self.dir,kpoints,weights,energies,occupations,character)
+        return kpoints,weights,energies,occupations,character.sum(axis=3)
+
+    def check(self,layout,compress=False,nproc=1):
+        kpoints,weights,energies,occupations,character = self.write(layout)
+        if compress:
+            fixtures.gzipped(self.dir+'PROCAR')
+        for trial in ('parse','reload'):
+            pro = VASPread.procar(self.dir,nproc=nproc)
+            np.testing.assert_allclose(pro.character(kpts=[4,0],bands=[2]),character[:,[4,0]][:,:,[2]],atol=2e-3)
+            np.testing.assert_allclose(pro.energies(kpts=[1]),energies[:,[1]])
+            np.testing.assert_allclose(pro.kpoints(),kpoints,atol=1e-8)
+            np.testing.assert_allclose(pro.weights(),weights,atol=1e-8)
+            np.testing.assert_allclose(pro.energies(),energies)
+            np.testing.assert_allclose(pro.occupations(),occupations)
+            np.testing.assert_allclose(pro.character(),character,atol=2e-3)
+            self.assertEqual(pro.spinpol,layout=='sp')
+            self.assertEqual(pro.soc,layout=='soc')
+            self.assertEqual(pro.labels(),fixtures.LABELS)
+            self.assertCached(pro.filename,pro._kind())
+
+    def test_nonspin(self):
+        self.check('ns')
+
+    def test_spin(self):
+        self.check('sp')
+
+    def test_soc(self):
+        self.check('soc')
+
+    def test_gzip(self):
+        self.check('sp',compress=True)
+
+    def test_gzip_soc(self):
+        self.check('soc',compress=True)
+
+    def test_parallel(self):
+        self.check('sp',nproc=2)
+
+    def test_parallel_soc(self):
+        self.check('soc',nproc=2)
+
+    def test_parallel_dtype(self):
+        #THE SHARED MEMORY ARRAYS TAKE THE REQUESTED DTYPE
+        character = self.write('ns')[4]
+        pro = VASPread.procar(self.dir,nproc=2,dtype=np.float32)
+        self.assertEqual(pro.character().dtype,np.float32)
+        np.testing.assert_allclose(pro.character(),character,atol=2e-3)
+
+#===========================    DOSCAR   ===================================================
+class DoscarTest(FixtureTest):
+
+    def check(self,layout,norb=9,compress=False):
+        nspin,nchan = LAYOUTS[layout]
+        energy = np.linspace(-4,4,6)
+        total = np.round(self.rng.uniform(0,3,(nspin,6)),4)
+        partial = np.round(self.rng.uniform(0,1,(2,nchan,6,norb)),4)
+        fixtures.doscar(self.dir,energy,total,partial)
+        if compress:
+            fixtures.gzipped(self.dir+'DOSCAR')
+        for trial in ('parse','reload'):
+            dos = VASPread.doscar(self.dir)
+            np.testing.assert_allclose(dos.energy(),energy[np.newaxis,:],atol=1e-3)
+            np.testing.assert_allclose(dos.dos(),total)
+            np.testing.assert_allclose(dos.pdos(),partial)
+            np.testing.assert_allclose(dos.odos()[1],partial.sum(axis=0))
+            self.assertEqual(dos.spinpol,layout=='sp')
+            self.assertEqual(dos.soc,layout=='soc')
+            self.assertCached(dos.filename,'doscar')
+
+    def test_nonspin(self):
+        self.check('ns')
+
+    def test_spin(self):
+        self.check('sp')
+
+    def test_soc(self):
+        self.check('soc')
+
+    def test_gzip(self):
+        self.check('soc',norb=16,compress=True)
+
+#===========================    VASPRUN   ==================================================
+class VasprunTest(FixtureTest):
+
+    def check(self,nspin,compress=False):
+        kpoints,weights,energies,occupations = self.bands(nspin)
+        character = np.round(self.rng.uniform(0,0.2,(nspin,)+energies.shape[1:]+(2,9)),4)
+        lattice = np.array([[3.,0,0],[0,3.,0],[0,0,5.]])
+        total = np.round(self.rng.uniform(0,2,(nspin,6,3)),4)
+        partial = np.round(self.rng.uniform(0,1,(2,nspin,6,10)),4)
+        fixtures.vasprun(self.dir,kpoints,weights,energies,occupations,character,lattice,total,partial,1.25)
+        if compress:
+            fixtures.gzipped(self.dir+'vasprun.xml')
+        for trial in ('parse','reload'):
+            run = VASPread.vasprun(self.dir)
+            np.testing.assert_allclose(run.kpoints(),kpoints,atol=1e-8)
+            np.testing.assert_allclose(run.weights(),weights,atol=1e-8)
+            #THE FIRST IONIC STEP IS SHIFTED BY 100 EV AND STRAINED - ONLY THE LAST ONE IS KEPT
+            np.testing.assert_allclose(run.energy(),energies)
+            np.testing.assert_allclose(run.occupations(),occupations)
+            np.testing.assert_allclose(run.dirlatvec(),lattice.T)
+            np.testing.assert_allclose(run.character(),character.sum(axis=3),atol=1e-3)
+            self.assertEqual(run.labels(),fixtures.LABELS)
+            np.testing.assert_allclose(run.dos(),total[:,:,1])
+            np.testing.assert_allclose(run.pdos(),partial[...,1:])
+            self.assertEqual(run.fermilevel(),1.25)
+            self.assertCached(run.filename,'vasprun')
+
+    def test_nonspin(self):
+        self.check(1)
+
+    def test_spin(self):
+        self.check(2)
+
+    def test_gzip(self):
+        self.check(2,compress=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Round trip of the k-point unfolding: a run with symmetry (irreducible k-points and weights)
+ is unfolded onto the full mesh and compared, point by point, against the same bands from a run
+ without symmetry. The cell is simple tetragonal, so the irreducible set is built here from the
+ 16 operations of 4/mmm written out by hand - independently of utils.symmetry.rotations.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+import IQM.VASPread as VASPread
+import utils.inputs as inputs
+import utils.symmetry as symmetry
+import fixtures
+
+KSAMP = [4,4,3]
+POSCAR = 'Fe\n1.0\n3.0 0.0 0.0\n0.0 3.0 0.0\n0.0 0.0 5.0\nFe\n1\nDirect\n0.0 0.0 0.0\n'
+KPOINTS = 'Automatic mesh\n0\nGamma\n%d %d %d\n0 0 0\n' % tuple(KSAMP)
+
+def operations():
+    #4/mmm - SWAP (OR NOT) KX AND KY, THEN FLIP THE SIGN OF ANY AXIS
+    ops = []
+    for swap in (False,True):
+        base = np.array([[0,1,0],[1,0,0],[0,0,1]]) if swap else np.eye(3,dtype=int)
+        for signs in itertools.product((1,-1),repeat=3):
+            ops.append(np.dot(np.diag(signs),base))
+    return ops
+
+def fullmesh():
+    #EVERY POINT OF THE GAMMA MESH, WRAPPED INTO (-0.5,0.5]
+    axes = [np.array([m-n if m>n//2 else m for m in range(n)])*1.0/n for n in KSAMP]
+    return np.array([[x,y,z] for x in axes[0] for y in axes[1] for z in axes[2]]).T
+
+def bands(kpoints,nspin):
+    #TETRAGONAL BANDS - THE C AXIS TERM DIFFERS, SO MAPPING KZ ONTO KX OR KY WOULD SHOW
+    c = np.cos(2*np.pi*kpoints)
+    energy = np.array([c[0]+c[1]+0.5*c[2]+0.3*c[0]*c[1]+b+0.1*s for s in range(nspin) for b in range(3)])
+    return np.round(energy,8).reshape((nspin,3,-1)).transpose(0,2,1)
+
+def flatindex(kpoints):
+    grid = symmetry.gridindex(kpoints,KSAMP)
+    return (grid[0]*KSAMP[1]+grid[1])*KSAMP[2]+grid[2]
+
+def irreducible(kpoints):
+    #FIRST POINT OF EVERY STAR AND THE NUMBER OF MESH POINTS IN IT
+    flat = flatindex(kpoints)
+    seen = set()
+    keep = []
+    weights = []
+    for i in range(kpoints.shape[1]):
+        if flat[i] in seen:
+            continue
+        star = set(flatindex(np.array([np.dot(op,kpoints[:,i]) for op in operations()]).T))
+        seen.update(star)
+        keep.append(i)
+        weights.append(len(star))
+    return kpoints[:,keep],np.array(weights,dtype=float)
+
+class UnfoldTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()+'/'
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_dir(self,name,kpoints,weights,nspin,incar=''):
+        #ONE RUN DIRECTORY WITH EIGENVAL, POSCAR, KPOINTS AND INCAR
+        d = self.dir+name+'/'
+        os.mkdir(d)
+        fixtures.eigenval(d,kpoints,weights,bands(kpoints,nspin))
+        for filename,text in (('POSCAR',POSCAR),('KPOINTS',KPOINTS),('INCAR',incar)):
+            f = open(d+filename,'w')
+            f.write(text)
+            f.close()
+        return d
+
+    def roundtrip(self,nspin,incar=''):
+        full = fullmesh()
+        #THE RUN WITHOUT SYMMETRY LISTS THE MESH IN ITS OWN ORDER
+        order = np.random.RandomState(3).permutation(full.shape[1])
+        nosym = self.run_dir('nosym',full[:,order],np.ones(full.shape[1]),nspin,incar)
+        kirr,weights = irreducible(full)
+        #6 IN-PLANE STARS (GAMMA, X, M AND THE POINTS BETWEEN) TIMES KZ = 0 AND +-1/3
+        self.assertEqual(kirr.shape[1],12)
+        sym = self.run_dir('sym',kirr,weights,nspin,incar)
+        results = []
+        for d in (sym,nosym):
+            eig = VASPread.eigenval(d)
+            kpoints,energies = symmetry.unfold(d,inputs.reformat_energy(eig.energy()),spinpol=eig.spinpol)
+            self.assertEqual(kpoints.shape[1],full.shape[1])
+            #EVERY MESH POINT ONCE
+            self.assertEqual(len(set(flatindex(kpoints))),full.shape[1])
+            results.append(energies[np.argsort(flatindex(kpoints))])
+        np.testing.assert_allclose(results[0],results[1],atol=1e-6)
+        return results[0]
+
+    def test_nonspin(self):
+        self.assertEqual(self.roundtrip(1).shape,(48,3))
+
+    def test_spin(self):
+        #ONE FERROMAGNETIC ATOM - THE MOMENTS KEEP THE FULL POINT GROUP
+        self.assertEqual(self.roundtrip(2,'ISPIN = 2\nMAGMOM = 2.0\n').shape,(48,6))
+
+    def test_wrong_weights(self):
+        #WEIGHTS WHICH DO NOT MATCH THE STARS OF THE POINT GROUP ARE REFUSED
+        kirr,weights = irreducible(fullmesh())
+        weights[0] += 1
+        sym = self.run_dir('sym',kirr,weights,1)
+        eig = VASPread.eigenval(sym)
+        self.assertRaises(ValueError,symmetry.unfold,sym,inputs.reformat_energy(eig.energy()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,9 @@ import csv
 from numpy import linalg as LA
 import IQM.VASPread as VASPread
 import IQM.PHONOPYread as PHONOPYread
+import IQM.calculation as calculation
+import IQM.fileio as fileio
+import utils.symmetry as symmetry
 import multiprocessing
 
 #===========================    MAIN METHODS FOR INPUTS   =================================
@@ -43,30 +46,18 @@ def get_converged_folders(csvfile):
         and returns an array of all converged compounds. In order to be in the array, a compound must
         have successfully completed its Relaxation, Static, and DFPT runs.
     """
-    #DEFINE STATUS ARRAYS
-    name=[]
-    relax_stat=[]
-    stat_stat=[]
-    dfpt_stat=[]
-    
     #READ SUMMARY FILE
     txtfile = open(csvfile)
-    reader = csv.DictReader(txtfile)
-    for row in reader:
-        name = np.append(name,row["COMPOUND"])
-        relax_stat = np.append(relax_stat,row["RELAX"])
-        stat_stat = np.append(stat_stat,row["STATIC"])
-        dfpt_stat = np.append(dfpt_stat,row["DFPT"])
+    rows = list(csv.DictReader(txtfile))
+    txtfile.close()
     
-    #GET CONVERGED FOLDERS  
-    folder = []
-    for i in range(len(name)):
-        if "Y" in relax_stat[i] and "Y" in stat_stat[i] and "Y" in dfpt_stat[i]:
-            folder = np.append(folder,name[i])
-        else:
-            continue    
+    #GET CONVERGED FOLDERS - A COMPOUND NEEDS A Y IN EACH STATUS COLUMN
+    converged = np.zeros(len(rows),dtype=bool)
+    for i in range(len(rows)):
+        converged[i] = "Y" in rows[i]["RELAX"] and "Y" in rows[i]["STATIC"] and "Y" in rows[i]["DFPT"]
+    name = np.array([row["COMPOUND"] for row in rows])
         
-    return folder
+    return name[converged]
     
 def qpoints(dir1):
     """ This function generates a NECESSARY QPOINTS file for PHONOPY. When doing mesh sampling with PHONOPY
@@ -77,17 +68,18 @@ def qpoints(dir1):
         
         This function is implemented in the PYTHON/inputs.py script.
     """
-    #FIND EIGENVAL FILE - RETURN TO MAIN SCRIPT IF MISSING
-    if os.stat(dir1+'STATIC/EIGENVAL').st_size==0:
+    #FIND EIGENVAL FILE (OR ITS ARCHIVE) - RETURN TO MAIN SCRIPT IF MISSING OR EMPTY
+    eigenval = fileio.locate(dir1+'STATIC/EIGENVAL')
+    if not os.path.exists(eigenval) or os.stat(eigenval).st_size==0:
         print 'Skipping '+dir1
         return
     #IF EIGENVAL FILE FOUND
     else:
-        #INITIALIZE FILE
-        eigenfile = VASPread.eigenval(dir1+'STATIC/')
+        #INITIALIZE RUN - ONLY EIGENVAL IS READ
+        static = calculation.Calculation(dir1+'STATIC/',SpinPol=False,SOC=False)
         
         #GET KPOINT INFORMATION
-        kpoints = eigenfile.kpoints()
+        kpoints = static.kpts
         length = len(kpoints[0,:])
         
         #WRITE KPOINTS INFORMATION TO QPOINTS FILE IN DFPT DIR
@@ -99,39 +91,47 @@ def qpoints(dir1):
         qfile.close()	
         return
 
-def reformat_energy(energymat):
+def reformat_energy(energymat,out=None):
     """This function reformats an energy numpy array AFTER is has been read in with the VASPread class. VASPread
        organizes spin-polarized and non spin-polarized data differently, since the EIGENVAL files are 
        structured differently for these runs. A spin polarized run will have dimensions 2 x nkpts x nbands,
        whereas a non spin-polarized run will have dimensions 1 x nkpts x nbands. This function returns a 
-       numpy array with dimensions 2*nkpts x nbands or nkpts x nbands depending on the situation.
+       numpy array with dimensions nkpts x 2*nbands or nkpts x nbands depending on the situation. 
+       
+       The non spin-polarized result is a view of @energymat (nothing is copied), so in-place
+       arithmetic on it (i.e. -= fermilevel) also changes @energymat - shift a copy instead. 
+       eigenval.energy returns a new array on every call, so the reader's own arrays are never
+       shared. The spin polarized interleave is one transposed copy - into @out (nkpts x 
+       2*nbands) if given, so a buffer can be reused across compounds.
        
        This function is implemented in several scripts, including the postprocess.py script.
     """
     #IF SPIN POLARIZED - FIRST DIMENSION OF ARRAY WILL BE 2
     if energymat.shape[0]==2:
-        energymat_new = np.zeros((energymat.shape[1],2*energymat.shape[2]))
-        count=0
         #SPIN POLARIZED DATA HAS TO BE ORGANIZED EVERY-OTHER-ONE - SINCE IT LISTS SPIN UP FIRST
         #FOLLOWED BY SPIN DOWN. THE SPIN UPS AND SPIN DOWNS ARE DEGENERATE AT EACH LEVEL.
-        for i in range(energymat.shape[2]):
-            energymat_new[:,count] = energymat[0,:,i]
-            count+=1
-            energymat_new[:,count] = energymat[1,:,i]
-            count+=1
+        #nkpts x nbands x 2 IN ROW MAJOR ORDER IS EXACTLY THE INTERLEAVED nkpts x 2*nbands LAYOUT
+        interleaved = energymat.transpose(1,2,0)
+        if out is None:
+            return interleaved.reshape((energymat.shape[1],2*energymat.shape[2]))
+        #SETTING THE SHAPE OF A VIEW RAISES (RATHER THAN COPYING) IF @out CANNOT TAKE IT IN PLACE
+        target = out.view()
+        target.shape = (energymat.shape[1],energymat.shape[2],2)
+        np.copyto(target,interleaved)
+        return out
     
     #ELSE - FIRST DIMENSION OF ARRAY WILL BE 1
-    else:
-        energymat_new = np.zeros((energymat.shape[1],energymat.shape[2]))
-        energymat_new[:,:] = energymat[0,:,:]
-    return energymat_new
+    if out is None:
+        return energymat[0]
+    np.copyto(out,energymat[0])
+    return out
                     
 def get_reclats(dirmain,dirsave,compound):
     """ Return and save (@dirsave) reciprocal lattice vectors as a numpy array by simply reading them from the 
         OUTCAR located in @dirmain & @compound folder using VASPread. See VASPread documentation for more detail.
     """
-    outfile = VASPread.outcar(dirmain+compound+"/STATIC/")
-    reclat = outfile.reclatvec()
+    static = calculation.Calculation(dirmain+compound+"/STATIC/")
+    reclat = static.reclat
     np.save(dirsave+compound+'/reclat',reclat)
     return
 
@@ -141,59 +141,69 @@ def get_natoms(dirmain,dirsave,compound):
         directory to read the info from. I.E. ~/work/myname/Test/ would be @dirmain, and @compound
         would be MgB2.
     """
-    outfile = VASPread.outcar(dirmain+compound+"/STATIC/")
-    natoms = outfile.nions()
+    static = calculation.Calculation(dirmain+compound+"/STATIC/")
+    natoms = static.natoms
     np.save(dirsave+compound+'/natoms',natoms)
     return      
 
-def meshgrid(kpoints,energies):
+def meshdims(kpoints):
+    """ Subdivisions of a full k-point mesh along each reciprocal axis, from the fractional 
+        coordinates in @kpoints (3 x nkpts): the number of distinct coordinates (modulo 1)
+        along each axis."""
+    folded = np.round(np.mod(kpoints,1.0),5)%1.0
+    return [len(np.unique(folded[i,:])) for i in range(3)]
+
+def meshgrid(kpoints,energies,bands=None,window=None,efermi=0.0,dtype=None,ksamp=None):
     """MESHGRID is an important function that is utilized by several scripts. Kpoint and Energy data is 
        output by VASP in a somewhat strange (and linear) order. I.E. kx: 0.000 -> 0.111 -> 0.222 -> 0.333
        -> 0.444 -> -0.444 -> -0.333 -> -0.222 -> -0.111 for a 9x9x9 kpoint grid. We want these values 
        reordered into a 9x9x9 grid (or whatever arbitrary kpt sampling) for postprocessing. This function
        takes the inputs @kpoints and @energies - which have dimensions 3 x nkpts and nkpts x nbands 
-       respectively - and restructure them into a kpt x kpt x kpt x 3 array or kpt x kpt x kpt x nbands
-       array.
+       respectively - and restructure them into a n1 x n2 x n3 x 3 array and n1 x n2 x n3 x nbands
+       array. The subdivisions @ksamp (i.e. VASPread.kpoints(dir).nsample()) are found from the
+       coordinates if not given (see meshdims), so anisotropic meshes like 24x24x12 work. @bands, 
+       @window and @efermi select a subset of the bands before the grid is allocated (see 
+       VASPread.bandindex) - i.e. window=(0,0) with the fermilevel keeps only the bands which
+       cross E_F for Fermi surface work. The energy grid is @dtype (the dtype of @energies if None).
+       
+       Every point goes to index floor(k*n + (n-1)/2 + 1/4) mod n along each axis (see 
+       symmetry.gridindex), which puts gamma at the center (or the two middle points of a 
+       shifted even mesh around it). The reordering is one argsort of the flat indices and one
+       fancy index. Points already in row major grid order - as symmetry.unfold returns them -
+       give a view of @energies. VASP's own order (first axis fastest, gamma first) takes the
+       copy. Runs with symmetry must be unfolded to the full mesh first (see 
+       symmetry.unfold).
        
        This function is implemented in several scripts, including the PYTHON/inputs.py, PYTHON/surface.py,
        and PYTHON/bxsf.py.
     """
-    #GET DIMENSIONS OF SQUARE KPT GRID FROM RAW VASP DATA - @kpoints
+    #GET MESH SUBDIVISIONS - FROM THE CALLER (KPOINTS) OR THE FRACTIONAL COORDINATES
     nkpts = kpoints.shape[1]
+    if ksamp is None:
+        ksamp = meshdims(kpoints)
+    ksamp = [int(n) for n in ksamp]
+    if ksamp[0]*ksamp[1]*ksamp[2]!=nkpts:
+        raise ValueError(str(nkpts)+' kpoints do not fill a '+'x'.join([str(n) for n in ksamp])+' mesh - unfold irreducible kpoints first (see symmetry.unfold)')
     
-    #SQUARE DIMENSIONS WILL BE CUBED ROOT OF THIS
-    kpts = int(round(nkpts**(1./3)))     
-    ksamp = [kpts,kpts,kpts]
-    
-    #GET NUMBER OF BANDS
-    nbands = energies.shape[1]
+    #KEEP ONLY THE SELECTED BANDS
+    index = VASPread.bandindex(energies,bands,window,efermi)
+    if index is not None:
+        energies = energies[:,index]
+    if dtype is not None:
+        energies = energies.astype(dtype,copy=False)
     
-    #INITALIZE KPOINT AND ENERGY ARRAYS
-    kmat = np.zeros((kpts,kpts,kpts,3))
-    energymat = np.zeros((kpts,kpts,kpts,nbands))
-    center = kpts/2
+    #GAMMA-CENTERED GRID INDEX OF EVERY KPOINT ALONG EACH AXIS - THEN THE FLAT (ROW MAJOR) INDEX
+    grid = symmetry.gridindex(kpoints,ksamp)
+    flat = (grid[0,:]*ksamp[1]+grid[1,:])*ksamp[2]+grid[2,:]
+    if np.any(np.bincount(flat,minlength=nkpts)!=1):
+        raise ValueError('kpoints do not map one to one onto a '+'x'.join([str(n) for n in ksamp])+' mesh')
     
-    #REORGRANIZE INTO GAMMA-CENTERED SQUARE MATRICES
-    for j in range(ksamp[0]):
-        for k in range(ksamp[1]):
-            for l in range(ksamp[2]):
-                if l<center:
-                    kx = l+center+1
-                else:
-                    kx = l-center
-                if j <= center:
-                    if k <= center:
-                        kmat[l,k+center,j+center,:] = kpoints[:,kx+k*ksamp[1]+j*ksamp[0]**2]
-                        energymat[l,k+center,j+center,:] = energies[kx+k*ksamp[1]+j*ksamp[0]**2,:]
-                    else:
-                        kmat[l,k-center-1,j+center,:] = kpoints[:,kx+k*ksamp[1]+j*ksamp[0]**2]
-                        energymat[l,k-center-1,j+center,:] = energies[kx+k*ksamp[1]+j*ksamp[0]**2,:]
-                else:
-                    if k <= center:
-                        kmat[l,k+center,j-center-1,:] = kpoints[:,kx+k*ksamp[1]+j*ksamp[0]**2]
-                        energymat[l,k+center,j-center-1,:] = energies[kx+k*ksamp[1]+j*ksamp[0]**2,:]
-                    else:
-                        kmat[l,k-center-1,j-center-1,:] = kpoints[:,kx+k*ksamp[1]+j*ksamp[0]**2]
-                        energymat[l,k-center-1,j-center-1,:] = energies[kx+k*ksamp[1]+j*ksamp[0]**2,:]
-                        
+    #REORDER - THE KPOINT LIST WHICH LANDS ON EACH GRID POINT IN TURN
+    order = np.argsort(flat)
+    shape = tuple(ksamp)
+    kmat = kpoints.T[order].reshape(shape+(3,))
+    if np.all(order==np.arange(nkpts)):
+        energymat = energies.reshape(shape+(energies.shape[1],))
+    else:
+        energymat = energies[order].reshape(shape+(energies.shape[1],))
     return kmat,energymat
@@ -0,0 +1,75 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Periodic interpolation of band energies on the k-mesh. Band energies are periodic in the
+ reciprocal lattice, so a gamma-centered mesh from inputs.meshgrid can be upsampled exactly (for
+ band limited energies) by zero padding its Fourier series. Smooth Fermi surfaces for surface.py
+ and bxsf.py then come from a moderate STATIC mesh instead of a very dense one. Energies are
+ interpolated band by band in index order, so bands which cross ring slightly near the crossing.
+
+ ---
+
+ gammaindex: index of gamma along an axis of a gamma-centered mesh (inputs.meshgrid layout).
+ fourier:    upsample a k-mesh and its energies by any factor per axis with real FFTs.
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+
+#===========================    INTERPOLATION   ============================================
+def gammaindex(n):
+    #POSITION OF k=0 ALONG AN AXIS OF n POINTS - SAME RULE AS symmetry.gridindex
+    return int(np.floor((n-1)/2.+0.25))
+
+def fourier(kmat,energymat,factor):
+    """ Upsample a gamma-centered mesh - @kmat (n1 x n2 x n3 x 3, fractional) and @energymat
+        (n1 x n2 x n3 x nbands) from inputs.meshgrid - by @factor (a number or one per axis,
+        need not be an integer). Each axis in turn is rolled to put gamma first, transformed
+        with rfft, zero padded to the new length by irfft (the Nyquist term of even meshes is
+        split between +q and -q) and rolled back, so all bands are done at once. Returns the
+        new kmat and energymat in the same layout, with gamma-centered meshes of round(factor*n)
+        points and the dtype of @energymat. With an integer factor along every axis the old
+        points are on the new mesh and keep their energies exactly - a non-integer factor 
+        gives a mesh which generally misses them, sampled from the same Fourier series."""
+    shape = energymat.shape[0:3]
+    if np.isscalar(factor):
+        factor = [factor]*3
+    ksamp = [int(round(factor[i]*shape[i])) for i in range(3)]
+    if min([ksamp[i]-shape[i] for i in range(3)])<0:
+        raise ValueError('upsampling factor must be at least 1 along every axis')
+    gamma = kmat[gammaindex(shape[0]),gammaindex(shape[1]),gammaindex(shape[2]),:]
+    if not np.allclose(gamma-np.round(gamma),0,atol=1e-4):
+        raise ValueError('the mesh does not contain gamma - only gamma-centered meshes can be upsampled')
+
+    #ONE AXIS AT A TIME - THE SPECTRUM IS REAL-TO-REAL SO rfft/irfft HALVE THE WORK
+    data = energymat
+    for axis in range(3):
+        n = shape[axis]
+        m = ksamp[axis]
+        if m==n:
+            continue
+        data = np.roll(data,-gammaindex(n),axis)
+        spectrum = np.fft.rfft(data,axis=axis)
+        if n%2==0:
+            nyquist = [slice(None)]*spectrum.ndim
+            nyquist[axis] = n//2
+            spectrum[tuple(nyquist)] *= 0.5
+        data = np.fft.irfft(spectrum,n=m,axis=axis)*(float(m)/n)
+        data = np.roll(data,gammaindex(m),axis)
+
+    #FRACTIONAL COORDINATES OF THE NEW MESH - ONE COLUMN PER AXIS, GAMMA AT gammaindex
+    axes = [(np.arange(m)-gammaindex(m))/float(m) for m in ksamp]
+    knew = np.zeros(tuple(ksamp)+(3,))
+    for i in range(3):
+        view = [1,1,1]
+        view[i] = ksamp[i]
+        knew[...,i] = axes[i].reshape(view)
+    return knew,data.astype(energymat.dtype,copy=False)
@@ -0,0 +1,196 @@
+## JAKE A TUTMAHER
+## JOHNS HOPKINS UNIVERSITY
+## MCQUEEN LABORATORY
+## THE INSTITUTE FOR QUANTUM MATTER
+## DEPARTMENT OF PHYSICS, DEPARTMENT OF CHEMISTRY, DEPARTMENT OF MATERIALS SCIENCE AND ENGINEERING
+##
+## CONTACT: jtutmah1@jhu.edu
+####################################################################################################
+
+""" Crystal point group and k-point unfolding. A STATIC run with symmetry on (ISYM = 2, the VASP
+ default) only writes the irreducible k-points of its mesh. These functions find the rotations of
+ the crystal from its POSCAR and map every point of the full gamma-centered mesh onto the
+ irreducible point it is equivalent to, so the full grid of energies for surface.py and bxsf.py
+ is one fancy index of the EIGENVAL energies.
+
+ ---
+
+ gridindex:   index of k-points (fractional) on an n1 x n2 x n3 gamma-centered mesh.
+ rotations:   point group of a crystal as integer matrices acting on fractional coordinates.
+ koperations: the same operations acting on fractional k-points, plus time reversal.
+ magmoms:     initial magnetic moments of a run from its INCAR (VASP defaults if not set).
+ magnetictypes: species split by their collinear moments, for the point group of a magnet.
+ unfoldindex: full mesh k-points and, for every mesh point, its irreducible k-point.
+ unfold:      full mesh k-points and energies from a run directory (EIGENVAL, POSCAR, KPOINTS).
+"""
+
+####################################################################################################
+
+#===========================    IMPORT SPECIFIC PACKAGES   =================================
+import numpy as np
+import fractions
+import IQM.VASPread as VASPread
+import IQM.fileio as fileio
+
+#===========================    MESH INDEXING   ============================================
+def gridindex(kpoints,ksamp):
+    """ Index of each k-point of @kpoints (3 x nkpts, fractional) along each axis of a @ksamp
+        mesh (3 x nkpts integers). Point k goes to floor(k*n + (n-1)/2 + 1/4) mod n, which puts
+        gamma at the center of odd and even gamma meshes and centers shifted Monkhorst-Pack 
+        meshes around it - the 1/4 keeps points (on the mesh to rounding error) away from the
+        floor boundaries. Equivalent points (k and k+1) get the same index."""
+    n = np.array(ksamp).reshape((3,1))
+    return np.mod(np.floor(kpoints*n+(n-1)/2.+0.25).astype(int),n)
+
+def ongrid(kpoints,ksamp,shift,tol=1e-4):
+    #TRUE FOR K-POINTS ON THE MESH - k*n-shift IS AN INTEGER ALONG EVERY AXIS
+    scaled = kpoints*np.array(ksamp).reshape((3,1))-np.array(shift).reshape((3,1))
+    return np.all(np.abs(scaled-np.round(scaled))<tol,axis=0)
+
+#===========================    POINT GROUP   ==============================================
+def rotations(lattice,positions,types,symprec=1e-3):
+    """ Point group of a crystal - the integer matrices R (entries -1, 0 or 1) which keep the
+        metric of @lattice (3 x 3, one vector per column) and, with some translation t, map
+        every atom x (rows of the fractional @positions) onto an atom of the same species in
+        @types: R x + t = x' mod 1 within @symprec. Returns an nops x 3 x 3 array."""
+    metric = np.dot(lattice.T,lattice)
+    #ALL 3^9 CANDIDATE MATRICES - KEEP THOSE WHICH PRESERVE THE METRIC
+    entries = np.array([-1,0,1])
+    candidates = np.array(np.meshgrid(*([entries]*9),indexing='ij')).reshape((9,-1)).T.reshape((-1,3,3))
+    dets = np.round(np.linalg.det(candidates)).astype(int)
+    candidates = candidates[np.abs(dets)==1]
+    transformed = np.einsum('nji,jk,nkl->nil',candidates,metric,candidates)
+    keep = np.all(np.abs(transformed-metric)<=symprec*np.abs(metric).max(),axis=(1,2))
+    candidates = candidates[keep]
+
+    #KEEP THE ROTATIONS WHICH MAP THE ATOMS ONTO THEMSELVES WITH SOME TRANSLATION
+    positions = np.asarray(positions,dtype=float)
+    types = np.asarray(types)
+    same = types[:,None]==types[None,:]
+    ops = []
+    for R in candidates:
+        rotated = np.dot(positions,R.T)
+        for j in np.nonzero(types==types[0])[0]:
+            t = positions[j]-rotated[0]
+            diff = rotated[:,None,:]+t-positions[None,:,:]
+            diff = np.abs(diff-np.round(diff)).max(axis=2)
+            if np.all(np.any((diff<symprec)&same,axis=1)):
+                ops.append(R)
+                break
+    return np.array(ops,dtype=int)
+
+def koperations(rotations,timereversal=True):
+    """ Operations on fractional k-points for the real space @rotations: (R^-1)^T, so that
+        k'.(R x) = k.x. With @timereversal (no magnetic SOC) -k is added for every operation.
+        Duplicates are removed."""
+    kops = np.round(np.linalg.inv(rotations).transpose((0,2,1))).astype(int)
+    if timereversal:
+        kops = np.concatenate((kops,-kops))
+    return np.unique(kops.reshape((-1,9)),axis=0).reshape((-1,3,3))
+
+def magmoms(calc_dir,natoms,soc=False):
+    """ MAGMOM of the INCAR in @calc_dir - natoms values, or natoms x 3 for SOC runs. A missing
+        tag gives the VASP default of 1.0 per component."""
+    ncomp = 3 if soc else 1
+    moments = VASPread.incar(calc_dir).get('MAGMOM')
+    if moments is None:
+        moments = [1.0]*(ncomp*natoms)
+    moments = np.atleast_1d(np.array(moments,dtype=float))
+    if moments.size!=ncomp*natoms:
+        raise ValueError('MAGMOM has '+str(moments.size)+' values, expected '+str(ncomp*natoms))
+    return moments.reshape((natoms,3)) if soc else moments
+
+def magnetictypes(types,moments,decimals=3):
+    """ Split the species @types (natoms) by the collinear @moments (natoms), so rotations only
+        map atoms onto atoms of the same species and moment. Returns new species indices."""
+    pairs = np.column_stack((types,np.round(moments,decimals)))
+    return np.unique(pairs,axis=0,return_inverse=True)[1].ravel()
+
+#===========================    UNFOLDING   ================================================
+def meshshift(kpoints,ksamp,tol=1e-4):
+    #OFFSET OF THE MESH ALONG EACH AXIS (0 OR 0.5 IN UNITS OF THE SPACING) FROM THE FIRST K-POINT
+    scaled = kpoints[:,0]*np.array(ksamp)
+    return np.round(2*(scaled-np.floor(scaled+tol)))/2.
+
+def meshsize(kpoints,maxdenominator=1000):
+    """ Guess the mesh of an irreducible set (3 x nkpts) as the least common multiple of the
+        coordinate denominators along each axis - doubled for shifted meshes. Use the KPOINTS
+        file (VASPread.kpoints.nsample) when it is available."""
+    ksamp = []
+    for i in range(3):
+        n = 1
+        for k in kpoints[i,:]:
+            d = fractions.Fraction(float(k)).limit_denominator(maxdenominator).denominator
+            n = n*d//fractions.gcd(n,d)
+        ksamp.append(n)
+    return ksamp
+
+def unfoldindex(kpoints,weights,ksamp,kops,tol=1e-4):
+    """ Map the full @ksamp mesh onto the irreducible @kpoints (3 x nirr, fractional). Every
+        operation of @kops is applied to every irreducible point at once, and each image on
+        the mesh marks its grid point with the index of the point it came from. Returns the
+        full mesh k-points (3 x n1*n2*n3, in the row major grid order of inputs.meshgrid and
+        wrapped into (-0.5,0.5]) and the irreducible index of every mesh point - so the full
+        energies are energies[index]. The number of mesh points per irreducible point is
+        checked against the EIGENVAL @weights, which catches a wrong point group."""
+    nirr = kpoints.shape[1]
+    npts = ksamp[0]*ksamp[1]*ksamp[2]
+    shift = meshshift(kpoints,ksamp,tol)
+    #IMAGES OF EVERY POINT UNDER EVERY OPERATION - nops x 3 x nirr
+    images = np.einsum('nij,jk->nik',kops,kpoints)
+    images = images-np.ceil(images-0.5-tol)
+    source = np.tile(np.arange(nirr),len(kops))
+    images = images.transpose((1,0,2)).reshape((3,-1))
+    valid = ongrid(images,ksamp,shift,tol)
+    images = images[:,valid]
+    source = source[valid]
+    grid = gridindex(images,ksamp)
+    flat = (grid[0,:]*ksamp[1]+grid[1,:])*ksamp[2]+grid[2,:]
+
+    #FIRST IMAGE TO REACH A GRID POINT WINS - ALL IMAGES OF ONE POINT ARE EQUIVALENT
+    index = -np.ones(npts,dtype=int)
+    kfull = np.zeros((3,npts))
+    flat,first = np.unique(flat,return_index=True)
+    index[flat] = source[first]
+    kfull[:,flat] = images[:,first]
+    if np.any(index<0):
+        raise ValueError(str(np.sum(index<0))+' mesh points are not images of the irreducible k-points')
+    counts = np.bincount(index,minlength=nirr)
+    if not np.allclose(counts,npts*np.asarray(weights)/np.sum(weights),atol=0.5):
+        raise ValueError('unfolded mesh does not reproduce the k-point weights - check the point group')
+    return kfull,index
+
+def unfold(calc_dir,energies,kpoints=None,weights=None,ksamp=None,spinpol=False,soc=False,timereversal=None,symprec=1e-3):
+    """ Full mesh k-points and energies for a run that wrote only irreducible k-points. The
+        irreducible points and weights are read from EIGENVAL (unless given), the structure
+        from POSCAR and the mesh from KPOINTS (see meshsize otherwise). @energies is nkpts x
+        nbands as returned by inputs.reformat_energy. Unfolded results are in grid order, so
+        inputs.meshgrid reshapes them without a copy. Runs without symmetry pass through in 
+        the order of the EIGENVAL file.
+        
+        The layout of the run (i.e. Calculation.spinpol and .soc) decides the operations: 
+        @spinpol runs split the species by MAGMOM (see magnetictypes), @soc runs drop time 
+        reversal unless @timereversal is given, and SOC runs with nonzero moments are refused
+        - their magnetic point group acts on the moments, which POSCAR does not describe."""
+    if kpoints is None or weights is None:
+        eigenfile = VASPread.eigenval(calc_dir)
+        kpoints = eigenfile.kpoints()
+        weights = eigenfile.weights()
+    if ksamp is None and fileio.exists(calc_dir+'KPOINTS'):
+        ksamp = VASPread.kpoints(calc_dir).nsample()
+    if ksamp is None:
+        ksamp = meshsize(kpoints)
+    ksamp = [int(n) for n in ksamp]
+    if kpoints.shape[1]==ksamp[0]*ksamp[1]*ksamp[2]:
+        return kpoints,energies
+    structure = VASPread.poscar(calc_dir)
+    types = structure.types()
+    if soc and np.any(magmoms(calc_dir,len(types),soc=True)!=0):
+        raise ValueError('noncollinear magnetic run (LSORBIT with nonzero MAGMOM) - rerun with ISYM = 0 for a full mesh')
+    if spinpol and not soc:
+        types = magnetictypes(types,magmoms(calc_dir,len(types)))
+    if timereversal is None:
+        timereversal = not soc
+    ops = rotations(structure.dirlatvec(),structure.fractional(),types,symprec)
+    kfull,index = unfoldindex(kpoints,weights,ksamp,koperations(ops,timereversal))
+    return kfull,energies[index]